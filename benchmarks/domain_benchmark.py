@@ -0,0 +1,202 @@
+"""
+Benchmarks the hot paths of the symbols and portfolios domain and of the repository decoding,
+on a reproducible synthetic universe, and compares them against a saved baseline.
+
+    python -m benchmarks.domain_benchmark --save-baseline    # on the reference commit
+    python -m benchmarks.domain_benchmark                    # fails if a case is slower than the threshold
+"""
+import argparse
+import os
+import sys
+import timeit
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import ujson
+
+from benchmarks.in_memory_repository import InMemoryRepositoryAdapter
+from benchmarks.synthetic import synthetic_history
+from src.Portfolio.application.flask_adapter import FlaskServiceAdapter as PortfolioServiceAdapter
+from src.Portfolio.domain.domain_service import DomainService as PortfolioDomainService
+from src.Symbol.application.flask_adapter import FlaskServiceAdapter as SymbolServiceAdapter
+from src.Symbol.domain.domain_service import DomainService
+from src.Symbol.domain.screener import screen_metrics
+from src.Symbol.domain.symbol import Symbol
+from src import settings as st
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+TRADING_DAYS_PER_YEAR = 261
+PORTFOLIO_SIZES = (5, 50, 500)
+# Trading days of the windowed cases, when the history is long enough.
+WINDOW_DAYS = 2500
+
+
+def build_repository(universe_size: int, history_days: int, seed: int = 0) -> InMemoryRepositoryAdapter:
+    """
+    Stores the benchmark indexes and universe_size stocks, encoded as they are in the db.
+    """
+    rng = np.random.default_rng(seed)
+    domain_service = DomainService()
+    repository = InMemoryRepositoryAdapter()
+    for ticker in st.EXCHANGES:
+        dates, closures, _ = synthetic_history(history_days, 0, rng)
+        repository.save_index(domain_service.create_symbol_entity(ticker=ticker, name=ticker.lower(),
+                                                                  closures=pd.Series(closures, index=dates)))
+    for number in range(universe_size):
+        dates, closures, dividends = synthetic_history(history_days, 0.01, rng)
+        ticker = 'S{:05d}.MC'.format(number)
+        repository.save_stock(domain_service.create_symbol_entity(
+            ticker=ticker, isin=ticker, name=ticker.lower(), exchange=st.EXCHANGES[number % len(st.EXCHANGES)],
+            closures=pd.Series(closures, index=dates), dividends=pd.Series(dividends, index=dates)))
+    return repository
+
+
+def benchmark_cases(repository: InMemoryRepositoryAdapter, universe_size: int) -> dict[str, Callable]:
+    """
+    :return: the cases to time, by name.
+    """
+    domain_service = DomainService()
+    symbol_service = SymbolServiceAdapter(repository=repository, domain_service=domain_service)
+    portfolio_service = PortfolioServiceAdapter(symbol_repository=repository, domain_service=PortfolioDomainService(),
+                                                symbol_domain_service=domain_service)
+    stock_data = repository.get_symbol('S00000.MC')
+    stock = domain_service.create_symbol_entity(ticker=stock_data['ticker'], isin=stock_data['isin'],
+                                                name=stock_data['name'], closures=stock_data['closures'],
+                                                exchange=stock_data['exchange'],
+                                                daily_returns=stock_data['daily_returns'],
+                                                dividends=stock_data['dividends'],
+                                                aggregates=stock_data.get('aggregates'))
+    stock_transfer = symbol_service.get_symbol('S00000.MC')
+    benchmarks_data = tuple(repository.get_symbol(ticker) for ticker in st.EXCHANGES)
+    # Built once, the screen and similar cases time the queries.
+    symbol_service.screener_cache.index()
+    symbol_service.similarity_cache.profiles()
+    # First day of the windowed cases, the first of the history if it is shorter than WINDOW_DAYS.
+    window_start = stock.closures.index[-min(len(stock.closures), WINDOW_DAYS)].date()
+
+    cases = {
+        'repository_decode': lambda: repository.get_symbol('S00000.MC'),
+        'process_historical_data': lambda: Symbol._process_historical_data(stock_data['closures'],
+                                                                           stock_data['daily_returns']),
+        'create_symbol_entity': lambda: domain_service.create_symbol_entity(
+            ticker=stock_data['ticker'], isin=stock_data['isin'], name=stock_data['name'],
+            closures=stock_data['closures'], exchange=stock_data['exchange'],
+            daily_returns=stock_data['daily_returns'], dividends=stock_data['dividends']),
+        'compute_cagr': lambda: (domain_service.compute_cagr(stock, period='3yr'),
+                                 domain_service.compute_cagr(stock, period='5yr')),
+        'reduce_history_monthly': lambda: domain_service.reduce_history(stock, freq='M'),
+        'reduce_history_yearly_window': lambda: domain_service.reduce_history(
+            stock, initial_date=window_start, freq='Y'),
+        'window_statistics': lambda: domain_service.compute_window_statistics(
+            stock.ticker, stock.prefix_sums, initial_date=window_start,
+            end_date=stock.closures.index[-min(len(stock.closures), 100)].date()),
+        'drawdowns': lambda: domain_service.compute_drawdowns(stock, min_depth=0.05),
+        'screen_metrics': lambda: screen_metrics(stock.closures, stock.daily_returns, stock.drawdown),
+        'screen': lambda: symbol_service.screen(filters={'cagr_5yr': (0.05, None), 'volatility': (None, 0.2)},
+                                                symbol_type='stock', order_by='cagr_5yr', descending=True).to_json(),
+        'similar': lambda: symbol_service.get_similar('S00000.MC', k=20).to_json(),
+        'symbol_to_json': lambda: ujson.dumps(stock_transfer.to_json()),
+        'get_symbol': lambda: symbol_service.get_symbol('S00000.MC').to_json(),
+    }
+    for size in PORTFOLIO_SIZES:
+        if size > universe_size:
+            continue
+        tickers = tuple('S{:05d}.MC'.format(number) for number in range(size))
+        symbols_data = repository.get_symbols(tickers)
+        shares = {ticker: 10 for ticker in tickers}
+        statistics = _portfolio_case(portfolio_service, symbols_data, benchmarks_data, shares)
+        cases['portfolio_statistics_{}'.format(size)] = statistics
+        cases['portfolio_to_json_{}'.format(size)] = _to_json_case(statistics)
+    return cases
+
+
+def _portfolio_case(portfolio_service: PortfolioServiceAdapter, symbols_data: tuple[dict, ...],
+                    benchmarks_data: tuple[dict, ...], shares: dict[str, int]) -> Callable:
+    return lambda: portfolio_service._analyse_portfolio(symbols_data=symbols_data, benchmarks_data=benchmarks_data,
+                                                        n_shares_per_symbol=shares, initial_date=None, end_date=None)
+
+
+def _to_json_case(statistics: Callable) -> Callable:
+    # The transfer is computed on the first call, which is only used by timeit to calibrate the number of calls.
+    transfers = []
+
+    def case():
+        if not transfers:
+            transfers.append(statistics())
+        return ujson.dumps(transfers[0].to_json())
+    return case
+
+
+def time_case(case: Callable, repeat: int) -> float:
+    """
+    :return: best time of a call, in seconds.
+    """
+    timer = timeit.Timer(case)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float) -> list[str]:
+    """
+    Prints the comparison report.
+    :return: names of the cases slower than the baseline by more than the threshold.
+    """
+    regressions = []
+    print('{:<28} {:>12} {:>12} {:>9}'.format('case', 'baseline ms', 'current ms', 'change'))
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print('{:<28} {:>12} {:>12.3f} {:>9}'.format(name, '-', seconds * 1000, 'new'))
+            continue
+        change = seconds / reference - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print('{:<28} {:>12.3f} {:>12.3f} {:>+8.1%}{}'.format(name, reference * 1000, seconds * 1000, change,
+                                                             ' REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=1000, help='stocks in the universe')
+    parser.add_argument('--years', type=int, default=30, help='years of history per symbol')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='timing repetitions, the best one is kept')
+    parser.add_argument('--cases', nargs='*', help='only runs these cases')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='saves the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fails if a case is slower than the baseline by more than this fraction')
+    args = parser.parse_args()
+
+    repository = build_repository(universe_size=args.symbols, history_days=args.years * TRADING_DAYS_PER_YEAR,
+                                  seed=args.seed)
+    cases = benchmark_cases(repository, universe_size=args.symbols)
+    results = {name: time_case(case, repeat=args.repeat) for name, case in cases.items()
+               if not args.cases or name in args.cases}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = ujson.load(f)
+        if (saved['symbols'], saved['years'], saved['seed']) != (args.symbols, args.years, args.seed):
+            print('The baseline was taken with another dataset, it is not compared')
+        else:
+            baseline = saved['results']
+    regressions = compare(results, baseline, threshold=args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            ujson.dump({'symbols': args.symbols, 'years': args.years, 'seed': args.seed, 'results': results},
+                       f, indent=2)
+        print('Baseline saved to {}'.format(args.baseline))
+    elif regressions:
+        print('{} cases regressed more than {:.0%}: {}'.format(len(regressions), args.threshold,
+                                                               ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Union, Literal
+
+from src.Symbol.domain.symbol import Stock, Index
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Symbol.infrastructure.mongodb_adapter import MongoRepositoryAdapter
+
+
+class InMemoryRepositoryAdapter(RepositoryInterface):
+    """
+    Keeps the symbols documents in a dict, encoded and decoded as MongoRepositoryAdapter does,
+    so the serialization cost of the writes and reads is the same without a database.
+    """
+    def __init__(self):
+        self.documents = {}
+        self.risk = {}
+        self.leases = {}
+        self.__lock = threading.Lock()
+
+    def save_stock(self, stock: Stock, fingerprint: str = None) -> None:
+        document = MongoRepositoryAdapter._stock_document(stock, fingerprint)
+        document['_id'] = stock.ticker
+        with self.__lock:
+            self.documents[stock.ticker] = document
+
+    def save_index(self, index: Index, fingerprint: str = None) -> None:
+        document = MongoRepositoryAdapter._index_document(index, fingerprint)
+        document['_id'] = index.ticker
+        with self.__lock:
+            self.documents[index.ticker] = document
+
+    def get_symbol(self, ticker: str) -> Union[dict, bool]:
+        document = self.documents.get(ticker)
+        if document is None:
+            return False
+        return MongoRepositoryAdapter._symbol_info(document)
+
+    def get_symbols(self, tickers: tuple[str, ...]) -> Union[tuple[dict, ...], bool]:
+        symbols = tuple(MongoRepositoryAdapter._symbol_info(self.documents[ticker]) for ticker in tickers
+                        if ticker in self.documents)
+        return symbols if symbols else False
+
+    def get_all_symbols(self, symbol_type: Literal['stock', 'index', 'all'] = 'all') -> tuple[dict, ...]:
+        return tuple(MongoRepositoryAdapter._symbol_info(document) for document in tuple(self.documents.values())
+                     if symbol_type == 'all' or document['type'] == symbol_type)
+
+    def clean_old_symbols(self) -> tuple[str, ...]:
+        date_limit = datetime.utcnow() - timedelta(days=5)
+        with self.__lock:
+            tickers = tuple(ticker for ticker, document in self.documents.items() if document['date'] < date_limit)
+            for ticker in tickers:
+                del self.documents[ticker]
+                self.risk.pop(ticker, None)
+        return tickers
+
+    def get_fingerprints(self) -> dict[str, str]:
+        return {ticker: document['fingerprint'] for ticker, document in tuple(self.documents.items())
+                if document.get('fingerprint') is not None}
+
+    def touch_symbols(self, tickers: tuple[str, ...]) -> None:
+        with self.__lock:
+            for ticker in tickers:
+                if ticker in self.documents:
+                    self.documents[ticker]['date'] = datetime.utcnow()
+
+    def save_risk(self, risk: dict[str, dict]) -> None:
+        with self.__lock:
+            self.risk.update(risk)
+
+    def get_risk(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        if tickers is None:
+            return dict(self.risk)
+        return {ticker: self.risk[ticker] for ticker in tickers if ticker in self.risk}
+
+    def get_screen_metrics(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        documents = tuple(self.documents.items()) if tickers is None else \
+            tuple((ticker, self.documents[ticker]) for ticker in tickers if ticker in self.documents)
+        return {ticker: {'type': document['type'], 'metrics': document.get('screen')} for ticker, document in documents}
+
+    def get_latest_returns(self, days: int, tickers: tuple[str, ...] = None,
+                           symbol_type: Literal['stock', 'index', 'all'] = 'all') -> dict[str, dict]:
+        documents = tuple(self.documents.items()) if tickers is None else \
+            tuple((ticker, self.documents[ticker]) for ticker in tickers if ticker in self.documents)
+        return {ticker: {'type': document['type'], 'exchange': document.get('exchange'),
+                         'daily_returns': MongoRepositoryAdapter._decode_returns(
+                             document['daily_returns']).iloc[-days:]}
+                for ticker, document in documents if symbol_type == 'all' or document['type'] == symbol_type}
+
+    def acquire_lease(self, name: str, owner: str, seconds: float) -> bool:
+        now = time.time()
+        with self.__lock:
+            holder, expires_at = self.leases.get(name, (owner, now))
+            if holder != owner and expires_at > now:
+                return False
+            self.leases[name] = (owner, now + seconds)
+        return True
@@ -0,0 +1,143 @@
+"""
+Measures the ingestion throughput of the full RabbitmqServiceAdapter pipeline, without a broker or a database.
+
+    python -m benchmarks.ingestion_benchmark --symbols 500 --days 7500 --dividend-density 0.01
+"""
+import argparse
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+import ujson
+
+from benchmarks.in_memory_repository import InMemoryRepositoryAdapter
+from benchmarks.synthetic import generate_messages
+from src.Symbol.application.ingestion_metrics import ingestion_metrics
+from src.Symbol.application.message_decoder import peek_ticker, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, \
+    COLUMNAR_CONTENT_TYPE
+from src.Symbol.application.partitioned_queue import PartitionedQueue, ConsumedMessage
+from src.Symbol.application.rabbitmq_adapter import RabbitmqServiceAdapter
+from src.Symbol.domain.domain_service import DomainService
+from src import settings as st
+
+
+class LocalConsumer:
+    """
+    In-process stand-in of RabbitmqConsumer. It delivers the messages as the broker would,
+    keeping at most prefetch_count of them unacknowledged and delivering again the nacked ones.
+    It disconnects once every message has been acked.
+    """
+    def __init__(self, messages_queue: PartitionedQueue, messages: list[tuple[str, bytes]],
+                 prefetch_count: int = st.SYMBOLS_PREFETCH_COUNT, content_type: str = JSON_CONTENT_TYPE):
+        self.connected = False
+        self.content_type = content_type
+        self.prefetch_count = prefetch_count
+        self.delivered_at = {}
+        self.latencies = []
+        self.nacks = 0
+        self.__queue = messages_queue
+        self.__messages = messages
+        self.__pending = list(range(len(messages)))
+        self.__unacked = set()
+        self.__window = threading.Condition()
+
+    def start_consumer(self) -> None:
+        self.connected = True
+        threading.Thread(target=self.__deliver, daemon=True).start()
+
+    def acknowledge(self, delivery_tag: int) -> None:
+        with self.__window:
+            self.latencies.append(time.perf_counter() - self.delivered_at[delivery_tag])
+            self.__unacked.discard(delivery_tag)
+            self.__window.notify_all()
+
+    def reject(self, delivery_tag: int, requeue: bool = True) -> None:
+        with self.__window:
+            self.nacks += 1
+            self.__unacked.discard(delivery_tag)
+            if requeue:
+                self.__pending.append(delivery_tag)
+            self.__window.notify_all()
+
+    def set_prefetch(self, prefetch_count: int) -> None:
+        with self.__window:
+            self.prefetch_count = prefetch_count
+            self.__window.notify_all()
+
+    def __deliver(self):
+        while True:
+            with self.__window:
+                self.__window.wait_for(lambda: len(self.__unacked) < self.prefetch_count
+                                       and self.__pending or not self.__pending and not self.__unacked)
+                if not self.__pending and not self.__unacked:
+                    break
+                delivery_tag = self.__pending.pop(0)
+                self.__unacked.add(delivery_tag)
+                self.delivered_at[delivery_tag] = time.perf_counter()
+            routing_key, body = self.__messages[delivery_tag]
+            ticker = peek_ticker(body, self.content_type)
+            ingestion_metrics.increment('received')
+            self.__queue.put(ConsumedMessage(delivery_tag=delivery_tag, ticker=ticker, routing_key=routing_key,
+                                             body=body, content_type=self.content_type))
+        self.connected = False
+
+
+def peak_rss_mb() -> tuple[float, float]:
+    """
+    :return: peak resident set size of this process and of its biggest finished child process, in mb.
+    """
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def run(symbols: int, days: int, dividend_density: float, workers: int, seed: int,
+        content_type: str = JSON_CONTENT_TYPE) -> dict:
+    messages = list(generate_messages(universe_size=symbols, history_days=days, dividend_density=dividend_density,
+                                      seed=seed, content_type=content_type))
+    repository = InMemoryRepositoryAdapter()
+    adapter = RabbitmqServiceAdapter(repository=repository, domain_service=DomainService(), workers=workers)
+    consumer = LocalConsumer(adapter.messages_queue, messages, content_type=content_type)
+    adapter.consumer = consumer
+
+    started_at = time.perf_counter()
+    adapter.fetch_symbol_data()
+    elapsed = time.perf_counter() - started_at
+
+    latencies = np.array(consumer.latencies)
+    rss, children_rss = peak_rss_mb()
+    return {'messages': len(messages), 'stored': len(repository.documents), 'nacks': consumer.nacks,
+            'mean_message_kb': sum(len(body) for _, body in messages) / len(messages) / 1024,
+            'seconds': elapsed, 'messages_per_second': len(messages) / elapsed,
+            'latency_p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'latency_p99_ms': float(np.percentile(latencies, 99) * 1000),
+            'peak_rss_mb': rss, 'peak_children_rss_mb': children_rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=200, help='stocks in the universe')
+    parser.add_argument('--days', type=int, default=5000, help='trading days of history per symbol')
+    parser.add_argument('--dividend-density', type=float, default=0.01,
+                        help='probability of a trading day paying a dividend')
+    parser.add_argument('--workers', type=int, default=st.SYMBOLS_CONSUMER_WORKERS, help='consumer worker threads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', default=JSON_CONTENT_TYPE,
+                        choices=(JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, COLUMNAR_CONTENT_TYPE),
+                        help='content type the messages are published with')
+    parser.add_argument('--json', help='also writes the report to this file')
+    args = parser.parse_args()
+
+    report = run(symbols=args.symbols, days=args.days, dividend_density=args.dividend_density,
+                 workers=args.workers, seed=args.seed, content_type=args.format)
+    for key, value in report.items():
+        print('{:<22} {:>12.2f}'.format(key, value) if isinstance(value, float) else '{:<22} {:>12}'.format(key, value))
+    if args.json:
+        with open(args.json, 'w') as f:
+            ujson.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
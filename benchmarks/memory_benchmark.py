@@ -0,0 +1,64 @@
+"""
+Measures the memory taken by the symbols memory store, to size its budget and the containers.
+Reads a synthetic universe through the store and compares the accounted bytes against the estimate
+and the growth of the process RSS.
+
+    python -m benchmarks.memory_benchmark --symbols 1000 --years 30 --float32
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.domain_benchmark import TRADING_DAYS_PER_YEAR
+from benchmarks.in_memory_repository import InMemoryRepositoryAdapter
+from benchmarks.synthetic import synthetic_history
+from src.Symbol.domain.domain_service import DomainService
+from src.Symbol.infrastructure.memory_store_adapter import MemoryStoreRepositoryAdapter
+
+
+def current_rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096 / 1024 / 1024
+
+
+def run(symbols: int, history_days: int, float32: bool, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    domain_service = DomainService()
+    repository = InMemoryRepositoryAdapter()
+    tickers = tuple('S{:05d}.MC'.format(number) for number in range(symbols))
+    for ticker in tickers:
+        dates, closures, dividends = synthetic_history(history_days, 0.01, rng)
+        repository.save_stock(domain_service.create_symbol_entity(
+            ticker=ticker, isin=ticker, name=ticker.lower(), exchange='^IBEX',
+            closures=pd.Series(closures, index=dates), dividends=pd.Series(dividends, index=dates)))
+
+    store = MemoryStoreRepositoryAdapter(fallback=repository, budget_bytes=2 ** 62, float32=float32)
+    rss_before = current_rss_mb()
+    for ticker in tickers:
+        store.get_symbol(ticker)
+    rss_growth = current_rss_mb() - rss_before
+
+    estimate = MemoryStoreRepositoryAdapter.estimate_nbytes(symbols, history_days, float32=float32)
+    return {'symbols': len(store), 'accounted_mb': store.nbytes / 1024 / 1024,
+            'estimated_mb': estimate / 1024 / 1024, 'rss_growth_mb': rss_growth,
+            'bytes_per_symbol': store.nbytes // max(len(store), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=1000, help='stocks in the universe')
+    parser.add_argument('--years', type=int, default=30, help='years of history per symbol')
+    parser.add_argument('--float32', action='store_true', help='stores the values in single precision')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(symbols=args.symbols, history_days=args.years * TRADING_DAYS_PER_YEAR, float32=args.float32,
+                 seed=args.seed)
+    for key, value in report.items():
+        print('{:<18} {:>12.2f}'.format(key, value) if isinstance(value, float) else '{:<18} {:>12}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Checks that the repository adapters honour the same contract, and compares their write and read throughput
+on a synthetic universe.
+
+    python -m benchmarks.repository_benchmark --symbols 200 --years 30             # sqlite and in-memory
+    python -m benchmarks.repository_benchmark --symbols 200 --years 30 --mongo     # also the MONGO_DB server
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.domain_benchmark import TRADING_DAYS_PER_YEAR
+from benchmarks.in_memory_repository import InMemoryRepositoryAdapter
+from benchmarks.synthetic import synthetic_history
+from src.Symbol.domain.domain_service import DomainService
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Symbol.domain.symbol import Symbol, Stock
+from src.Symbol.infrastructure.mongodb_adapter import MongoRepositoryAdapter
+from src.Symbol.infrastructure.sqlite_adapter import SqliteRepositoryAdapter
+
+# Mongo database the benchmark writes to, it is dropped afterwards.
+MONGO_DATABASE = 'fincalcs_benchmark'
+PORTFOLIO_SIZE = 50
+
+
+def build_symbols(symbols: int, history_days: int, seed: int = 0) -> list[Symbol]:
+    """
+    :return: an index and symbols - 1 stocks.
+    """
+    rng = np.random.default_rng(seed)
+    domain_service = DomainService()
+    dates, closures, _ = synthetic_history(history_days, 0, rng)
+    entities = [domain_service.create_symbol_entity(ticker='^IBEX', name='ibex',
+                                                    closures=pd.Series(closures, index=dates))]
+    for number in range(symbols - 1):
+        dates, closures, dividends = synthetic_history(history_days, 0.01, rng)
+        ticker = 'S{:05d}.MC'.format(number)
+        entities.append(domain_service.create_symbol_entity(
+            ticker=ticker, isin=ticker, name=ticker.lower(), exchange='^IBEX',
+            closures=pd.Series(closures, index=dates), dividends=pd.Series(dividends, index=dates)))
+    return entities
+
+
+def save(repository: RepositoryInterface, symbol: Symbol, fingerprint: str = None) -> None:
+    if isinstance(symbol, Stock):
+        repository.save_stock(symbol, fingerprint=fingerprint)
+    else:
+        repository.save_index(symbol, fingerprint=fingerprint)
+
+
+def check_contract(repository: RepositoryInterface) -> None:
+    """
+    Exercises every operation of the repository interface, raises AssertionError on the first difference
+    with the expected behaviour.
+    """
+    index, stock, other_stock = build_symbols(3, 300, seed=1)
+    save(repository, index, fingerprint='index-fingerprint')
+    save(repository, stock, fingerprint='stock-fingerprint')
+    save(repository, other_stock)
+
+    _check_symbol(repository.get_symbol(stock.ticker), stock)
+    _check_symbol(repository.get_symbol(index.ticker), index)
+    assert repository.get_symbol('MISSING') is False, 'get_symbol of a missing ticker must return False'
+
+    symbols = repository.get_symbols((stock.ticker, 'MISSING', index.ticker))
+    assert sorted(symbol['ticker'] for symbol in symbols) == sorted((stock.ticker, index.ticker)), \
+        'get_symbols must return the stored symbols only'
+    assert repository.get_symbols(('MISSING',)) is False, 'get_symbols without any stored symbol must return False'
+
+    stocks = {symbol['ticker'] for symbol in repository.get_all_symbols(symbol_type='stock')}
+    indexes = {symbol['ticker'] for symbol in repository.get_all_symbols(symbol_type='index')}
+    assert stocks == {stock.ticker, other_stock.ticker} and indexes == {index.ticker}, 'wrong get_all_symbols filter'
+    assert len(repository.get_all_symbols()) == 3, 'get_all_symbols must return every symbol'
+
+    fingerprints = repository.get_fingerprints()
+    assert fingerprints == {index.ticker: 'index-fingerprint', stock.ticker: 'stock-fingerprint'}, \
+        'get_fingerprints must return the fingerprints of the symbols saved with one'
+
+    screen = repository.get_screen_metrics()
+    assert screen == {symbol.ticker: {'type': 'stock' if isinstance(symbol, Stock) else 'index',
+                                      'metrics': symbol.screen_metrics} for symbol in (index, stock, other_stock)}, \
+        'get_screen_metrics must return the type and screen metrics of every symbol'
+    assert repository.get_screen_metrics((stock.ticker, 'MISSING')) == {stock.ticker: screen[stock.ticker]}, \
+        'get_screen_metrics must return the screen metrics of the stored symbols only'
+
+    save(repository, stock, fingerprint='new-fingerprint')
+    assert repository.get_fingerprints()[stock.ticker] == 'new-fingerprint', 'saving a symbol must replace it'
+    _check_symbol(repository.get_symbol(stock.ticker), stock)
+
+    latest_returns = repository.get_latest_returns(100, tickers=(stock.ticker, 'MISSING'))
+    assert list(latest_returns) == [stock.ticker] and latest_returns[stock.ticker]['type'] == 'stock' and \
+        latest_returns[stock.ticker]['exchange'] == stock.exchange, \
+        'get_latest_returns must return the type and exchange of the stored symbols only'
+    pd.testing.assert_series_equal(latest_returns[stock.ticker]['daily_returns'], stock.daily_returns.iloc[-100:],
+                                   check_names=False, check_freq=False)
+    assert set(repository.get_latest_returns(100, symbol_type='index')) == {index.ticker}, \
+        'wrong get_latest_returns filter'
+
+    risk = DomainService.compute_risk(index.ticker, index.daily_returns,
+                                      {symbol.ticker: symbol.daily_returns for symbol in (stock, other_stock)})
+    repository.save_risk(risk)
+    assert repository.get_risk() == risk, 'get_risk must return the saved risk statistics'
+    assert repository.get_risk((stock.ticker, 'MISSING')) == {stock.ticker: risk[stock.ticker]}, \
+        'get_risk must return the risk statistics of the stored stocks only'
+    repository.save_risk({stock.ticker: dict(risk[stock.ticker], day=risk[stock.ticker]['day'] + 1)})
+    assert repository.get_risk((stock.ticker,))[stock.ticker]['day'] == risk[stock.ticker]['day'] + 1, \
+        'saving the risk statistics of a stock must replace them'
+
+    assert repository.acquire_lease('job', 'owner', 60), 'a lease not held must be acquired'
+    assert not repository.acquire_lease('job', 'other', 60), 'a lease held by another owner must not be acquired'
+    assert repository.acquire_lease('job', 'owner', -1), 'the owner of a lease must renew it'
+    assert repository.acquire_lease('job', 'other', 60), 'an expired lease must be acquired'
+
+    repository.touch_symbols((stock.ticker, 'MISSING'))
+    assert repository.clean_old_symbols() == (), 'clean_old_symbols must return the tickers it cleaned'
+    assert len(repository.get_all_symbols()) == 3, 'clean_old_symbols must keep the symbols updated recently'
+
+
+def _check_symbol(symbol_data: dict, symbol: Symbol) -> None:
+    assert symbol_data and symbol_data['ticker'] == symbol.ticker and symbol_data['name'] == symbol.name, \
+        'wrong info of {}'.format(symbol.ticker)
+    closures, daily_returns = Symbol._process_historical_data(symbol_data['closures'], symbol_data['daily_returns'])
+    assert (closures.index == symbol.closures.index).all(), 'wrong dates of {}'.format(symbol.ticker)
+    assert np.allclose(closures.values, symbol.closures.values), 'wrong closures of {}'.format(symbol.ticker)
+    assert np.allclose(daily_returns.values.astype(np.float64), symbol.daily_returns.values, equal_nan=True), \
+        'wrong daily returns of {}'.format(symbol.ticker)
+    if 'aggregates' in symbol_data:
+        aggregates = Symbol._process_aggregates(closures, daily_returns, symbol_data['aggregates'])
+        assert all(aggregates[freq].index.equals(symbol.aggregates[freq].index) and
+                   np.allclose(aggregates[freq].values, symbol.aggregates[freq].values, equal_nan=True)
+                   for freq in symbol.aggregates), 'wrong aggregates of {}'.format(symbol.ticker)
+    if 'drawdown' in symbol_data:
+        assert Symbol._process_drawdown(closures, symbol_data['drawdown']).to_dict() == symbol.drawdown.to_dict(), \
+            'wrong drawdown of {}'.format(symbol.ticker)
+    if isinstance(symbol, Stock):
+        assert symbol_data['isin'] == symbol.isin and symbol_data['exchange'] == symbol.exchange, \
+            'wrong info of {}'.format(symbol.ticker)
+        dividends = Stock._process_dividends_data(symbol_data['dividends'])
+        assert (dividends.index == symbol.dividends.index).all() and \
+            np.allclose(dividends.values, symbol.dividends.values), 'wrong dividends of {}'.format(symbol.ticker)
+        total_returns = Stock._process_total_returns(closures, dividends, symbol_data.get('total_returns'))
+        assert np.allclose(total_returns.values, symbol.total_returns.values, equal_nan=True), \
+            'wrong total returns of {}'.format(symbol.ticker)
+    else:
+        assert 'dividends' not in symbol_data, '{} is an index, it has no dividends'.format(symbol.ticker)
+
+
+def measure(repository: RepositoryInterface, symbols: list[Symbol]) -> dict:
+    """
+    :return: symbols/s of each operation.
+    """
+    tickers = tuple(symbol.ticker for symbol in symbols)
+    report = {'save': _throughput(lambda: [save(repository, symbol) for symbol in symbols], len(symbols)),
+              'get_symbol': _throughput(lambda: [repository.get_symbol(ticker) for ticker in tickers], len(tickers))}
+
+    portfolios = [tickers[start:start + PORTFOLIO_SIZE] for start in range(0, len(tickers), PORTFOLIO_SIZE)]
+    report['get_symbols'] = _throughput(lambda: [repository.get_symbols(portfolio) for portfolio in portfolios],
+                                        len(tickers))
+    report['get_all_symbols'] = _throughput(repository.get_all_symbols, len(tickers))
+    if type(repository) is SqliteRepositoryAdapter:
+        last_date = symbols[0].last_date.date()
+        report['get_symbols_1yr'] = _throughput(
+            lambda: [repository.get_symbols(portfolio, initial_date=last_date - timedelta(days=365),
+                                            end_date=last_date) for portfolio in portfolios], len(tickers))
+    return report
+
+
+def _throughput(operation: Callable, count: int) -> float:
+    started_at = time.perf_counter()
+    operation()
+    return count / (time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=200, help='symbols in the universe')
+    parser.add_argument('--years', type=int, default=30, help='years of history per symbol')
+    parser.add_argument('--mongo', action='store_true', help='also measures the mongodb server of MONGO_DB')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {'memory (mongo encoding)': lambda: InMemoryRepositoryAdapter(),
+                    'sqlite': lambda: SqliteRepositoryAdapter(path=os.path.join(directory, '{}.db'.format(
+                        datetime.utcnow().timestamp())))}
+        if args.mongo:
+            backends['mongo'] = lambda: _empty_mongo_repository()
+
+        for name, create in backends.items():
+            check_contract(create())
+            print('{}: contract ok'.format(name))
+
+        symbols = build_symbols(args.symbols, args.years * TRADING_DAYS_PER_YEAR, seed=args.seed)
+        reports = {name: measure(create(), symbols) for name, create in backends.items()}
+
+    if args.mongo:
+        _empty_mongo_repository()
+    operations = sorted({operation for report in reports.values() for operation in report},
+                        key=lambda operation: list(reports['sqlite']).index(operation))
+    print('{:<18}'.format('symbols/s') + ''.join('{:>26}'.format(name) for name in reports))
+    for operation in operations:
+        print('{:<18}'.format(operation) + ''.join(
+            '{:>26.1f}'.format(report[operation]) if operation in report else '{:>26}'.format('-')
+            for report in reports.values()))
+
+
+def _empty_mongo_repository() -> MongoRepositoryAdapter:
+    repository = MongoRepositoryAdapter(database=MONGO_DATABASE)
+    repository.symbols_collection.delete_many({})
+    return repository
+
+
+if __name__ == '__main__':
+    main()
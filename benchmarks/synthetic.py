@@ -0,0 +1,86 @@
+"""
+Reproducible synthetic symbols data, shaped as findata publishes it.
+"""
+import zlib
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import ujson
+
+from src.Symbol.application.message_decoder import JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, COLUMNAR_CONTENT_TYPE, \
+    COLUMNAR_MAGIC, COLUMNAR_HEADER, COLUMNAR_HAS_DIVIDENDS, msgpack
+from src import settings as st
+
+FIRST_DATE = '1991-01-02'
+
+
+def synthetic_history(history_days: int, dividend_density: float, rng: np.random.Generator) \
+        -> tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+    """
+    :param history_days: number of trading days.
+    :param dividend_density: probability of a trading day paying a dividend.
+    :return: trading days, closures following a random walk and dividends (0 when not paid).
+    """
+    dates = pd.bdate_range(FIRST_DATE, periods=history_days)
+    closures = 50 * np.cumprod(1 + rng.normal(0.0003, 0.015, history_days))
+    dividends = np.where(rng.random(history_days) < dividend_density, np.round(closures * 0.01, 4), 0.0)
+    return dates, np.round(closures, 4), dividends
+
+
+def symbol_message(ticker: str, history_days: int, dividend_density: float, rng: np.random.Generator,
+                   index: bool = False) -> dict:
+    dates, closures, dividends = synthetic_history(history_days, dividend_density, rng)
+    keys = dates.strftime('%Y-%m-%d %H:%M:%S')
+    message = {'ticker': ticker, 'name': ticker.lower(),
+               'historic': {'close': dict(zip(keys, closures.tolist()))}}
+    if not index:
+        message['isin'] = 'XX{:010d}'.format(zlib.crc32(ticker.encode()))
+        message['exchange'] = st.EXCHANGES[0]
+        message['historic']['dividends'] = dict(zip(keys, dividends.tolist()))
+    return message
+
+
+def encode_message(message: dict, content_type: str = JSON_CONTENT_TYPE) -> bytes:
+    """
+    Encodes a json shaped symbol message as findata publishes it with the given content type.
+    """
+    if content_type == JSON_CONTENT_TYPE:
+        return ujson.dumps(message).encode()
+
+    info = {key: value for key, value in message.items() if key != 'historic'}
+    closures = message['historic']['close']
+    days = pd.to_datetime(tuple(closures.keys())).values.astype('datetime64[D]').astype('<i4')
+    columns = [days, np.asarray(tuple(closures.values()), dtype='<f8')]
+    if message['historic'].get('dividends') is not None:
+        columns.append(np.asarray(tuple(message['historic']['dividends'].values()), dtype='<f8'))
+
+    if content_type == MSGPACK_CONTENT_TYPE:
+        info['historic'] = dict(zip(('days', 'close', 'dividends'), (column.tobytes() for column in columns)))
+        return msgpack.packb(info, use_bin_type=True)
+
+    if content_type == COLUMNAR_CONTENT_TYPE:
+        info = ujson.dumps(info).encode()
+        flags = COLUMNAR_HAS_DIVIDENDS if len(columns) == 3 else 0
+        body = bytearray(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, len(info), len(days), flags) + info)
+        for column in columns:
+            body.extend(bytes(-len(body) % 8))
+            body.extend(column.tobytes())
+        return bytes(body)
+
+    raise ValueError('Unknown content type {}'.format(content_type))
+
+
+def generate_messages(universe_size: int, history_days: int, dividend_density: float = 0.01,
+                      seed: int = 0, content_type: str = JSON_CONTENT_TYPE) -> Iterator[tuple[str, bytes]]:
+    """
+    Generates the messages of a universe refresh, first the benchmark indexes and then the stocks.
+    :return: routing key and body of each message.
+    """
+    rng = np.random.default_rng(seed)
+    for ticker in st.EXCHANGES:
+        yield st.SYMBOLS_INDEX_ROUTING_KEY, encode_message(symbol_message(ticker, history_days, 0, rng, index=True),
+                                                           content_type)
+    for number in range(universe_size):
+        yield st.SYMBOLS_STOCK_ROUTING_KEY, encode_message(symbol_message('S{:05d}.MC'.format(number), history_days,
+                                                                          dividend_density, rng), content_type)
@@ -0,0 +1,51 @@
+"""
+Compares the size and decode time of a symbol message in each wire format.
+
+    python -m benchmarks.wire_format_benchmark --days 7500
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from benchmarks.synthetic import symbol_message, encode_message
+from src.Symbol.application.message_decoder import decode_symbol_message, msgpack, JSON_CONTENT_TYPE, \
+    MSGPACK_CONTENT_TYPE, COLUMNAR_CONTENT_TYPE
+from src import settings as st
+
+
+def run(days: int, dividend_density: float, repeat: int) -> dict:
+    message = symbol_message('S00000.MC', days, dividend_density, np.random.default_rng(0))
+    content_types = (JSON_CONTENT_TYPE, COLUMNAR_CONTENT_TYPE) if msgpack is None else \
+        (JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, COLUMNAR_CONTENT_TYPE)
+
+    report = {}
+    for content_type in content_types:
+        body = encode_message(message, content_type)
+        decoded = decode_symbol_message(body, st.SYMBOLS_STOCK_ROUTING_KEY, content_type)
+        assert len(decoded['historic']['close']) == days
+        seconds = min(timeit.repeat(lambda: decode_symbol_message(body, st.SYMBOLS_STOCK_ROUTING_KEY, content_type),
+                                    number=1, repeat=repeat))
+        report[content_type] = {'size_kb': len(body) / 1024, 'decode_ms': seconds * 1000}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=7500, help='trading days of history of the message')
+    parser.add_argument('--dividend-density', type=float, default=0.01,
+                        help='probability of a trading day paying a dividend')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    report = run(days=args.days, dividend_density=args.dividend_density, repeat=args.repeat)
+    json_size, json_decode = report[JSON_CONTENT_TYPE]['size_kb'], report[JSON_CONTENT_TYPE]['decode_ms']
+    print('{:<36} {:>10} {:>10} {:>8} {:>8}'.format('content type', 'size kb', 'decode ms', 'size x', 'decode x'))
+    for content_type, result in report.items():
+        print('{:<36} {:>10.1f} {:>10.2f} {:>8.1f} {:>8.1f}'.format(
+            content_type, result['size_kb'], result['decode_ms'],
+            json_size / result['size_kb'], json_decode / result['decode_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,42 @@
 import time
 
-from src.Symbol.application.use_cases import FetchSymbolsUseCase
-from src.api import start_api
-
 if __name__ == '__main__':
+    # Imported here, the process pools spawn their workers by importing this module, and they do not need the api.
+    from src.Symbol.application.use_cases import FetchSymbolsUseCase, CleanOldSymbolsUseCase, ComputeRiskUseCase, \
+        BroadcastDataVersionsUseCase
+    from src.api import start_api
+    from src.api.health_routes import schedule_warm_up
+    from src.Utils.scheduler import scheduler
+    from src import settings as st
 
-    FetchSymbolsUseCase().execute()
-    start_api()
-    while True:
-        time.sleep(60)
-        pass
+    if st.API_WORKERS > 1:
+        from src.api.server import start_production_api
 
+        # The workers supervisor is forked before the ingestion threads are started.
+        server = start_production_api(workers=st.API_WORKERS)
+        if st.INSTANCES:
+            # The master publishes the peers' updates into shared memory along with its own.
+            BroadcastDataVersionsUseCase().execute()
+        FetchSymbolsUseCase().execute()
+        # The workers schedule their own warm-up, the master keeps the database clean and the risk up to date.
+        # The cleanup is run by one instance, the one holding its lease, each instance computes its partitions.
+        clean_old_symbols = CleanOldSymbolsUseCase()
+        scheduler.every('clean_old_symbols', st.CLEAN_OLD_SYMBOLS_INTERVAL, clean_old_symbols.execute,
+                        lease=clean_old_symbols.repository.acquire_lease)
+        scheduler.after_ingestion_waves('risk', ComputeRiskUseCase().execute)
+        scheduler.start()
+        server.supervise()
+    else:
+        if st.INSTANCES:
+            BroadcastDataVersionsUseCase().execute()
+        FetchSymbolsUseCase().execute()
+        clean_old_symbols = CleanOldSymbolsUseCase()
+        scheduler.every('clean_old_symbols', st.CLEAN_OLD_SYMBOLS_INTERVAL, clean_old_symbols.execute,
+                        lease=clean_old_symbols.repository.acquire_lease)
+        scheduler.after_ingestion_waves('risk', ComputeRiskUseCase().execute)
+        schedule_warm_up(scheduler)
+        scheduler.start()
+        start_api()
+        while True:
+            time.sleep(60)
+            pass
@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import datetime
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from src.Portfolio.application.flask_adapter import FlaskServiceAdapter
+from src.Portfolio.domain.domain_service import DomainService, PortfolioStatisticsTransfer
+from src.Symbol.domain.domain_service import DomainService as SymbolDomainService
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface as SymbolRepositoryInterface
+from src.Utils.exceptions import PortfolioException
+from src.Utils.timing import timings
+from src import settings as st
+
+
+def _analyse_portfolio(symbols_data: tuple[dict, ...], benchmarks_data: tuple[dict, ...],
+                       n_shares_per_symbol: dict[str, int], initial_date: datetime.date,
+                       end_date: datetime.date,
+                       total_return: bool = False) -> tuple[PortfolioStatisticsTransfer, dict[str, float]]:
+    """
+    Entry point of the process pool workers, they only need the symbols data, not the repository.
+    :return: the analysis and the time spent in each of its stages, to be recorded by the parent process.
+    """
+    analyser = FlaskServiceAdapter(symbol_repository=None, domain_service=DomainService(),
+                                   symbol_domain_service=SymbolDomainService())
+    with timings.request() as spans:
+        analysis = analyser._analyse_portfolio(symbols_data=symbols_data, benchmarks_data=benchmarks_data,
+                                               n_shares_per_symbol=n_shares_per_symbol,
+                                               initial_date=initial_date, end_date=end_date,
+                                               total_return=total_return)
+    return analysis, spans
+
+
+def _warm_up_worker(_) -> int:
+    """
+    Run by each process pool worker once it has imported the analysis modules.
+    """
+    return os.getpid()
+
+
+class _Admission:
+    """
+    Slot of an accepted analysis. Once the analysis is submitted to the process pool the slot is held until the
+    pool task finishes, a task already running cannot be cancelled and keeps its worker busy after the request
+    has given up.
+    """
+    def __init__(self, release):
+        self.__release = release
+        self.__lock = threading.Lock()
+        self.__submitted = False
+        self.__released = False
+
+    def submit(self, pool: ProcessPoolExecutor, fn, *args) -> Future:
+        """
+        :raises asyncio.CancelledError: if the request has already given up, the analysis is not submitted.
+        """
+        with self.__lock:
+            if self.__released:
+                raise asyncio.CancelledError()
+            future = pool.submit(fn, *args)
+            self.__submitted = True
+        future.add_done_callback(lambda _: self.__release())
+        return future
+
+    def close(self, _=None) -> None:
+        """
+        Called once the request is done with the analysis, releases the slot unless a pool task holds it.
+        """
+        with self.__lock:
+            if self.__submitted or self.__released:
+                return
+            self.__released = True
+        self.__release()
+
+
+class AsyncServiceAdapter(FlaskServiceAdapter):
+    """
+    Runs the portfolio analysis in an asyncio loop, so request threads only wait for the result.
+    The repository reads of every ticker are issued concurrently and the statistics are computed
+    in a bounded process pool, out of the GIL of the api threads.
+    """
+    def __init__(self, symbol_repository: SymbolRepositoryInterface, domain_service: DomainService,
+                 symbol_domain_service: SymbolDomainService, process_workers: int = st.PORTFOLIO_PROCESS_WORKERS,
+                 max_pending: int = st.PORTFOLIO_MAX_PENDING, deadline: float = st.PORTFOLIO_DEADLINE):
+        super().__init__(symbol_repository=symbol_repository, domain_service=domain_service,
+                         symbol_domain_service=symbol_domain_service)
+        self.process_workers = process_workers
+        self.max_pending = max_pending
+        self.deadline = deadline
+        self.__pending = 0
+        self.__lock = threading.Lock()
+        self.__loop = None
+        self.__io_pool = None
+        self.__process_pool = None
+
+    @property
+    def pending(self) -> int:
+        """
+        Analyses accepted and not finished yet.
+        """
+        return self.__pending
+
+    def warm_up(self) -> None:
+        """
+        Starts the loop and the pools, and waits until every process pool worker has been spawned
+        and has imported the analysis modules, so the first analyses do not pay for it.
+        """
+        with self.__lock:
+            if self.__loop is None:
+                self.__start()
+        pids = set(self.__process_pool.map(_warm_up_worker, range(4 * self.process_workers)))
+        st.logger.info("Portfolio analysis pool warmed up with {} processes".format(len(pids)))
+
+    def create_portfolio(self, tickers: tuple[str], n_shares_per_symbol: dict[str, int],
+                         initial_date: datetime.date, end_date: datetime.date,
+                         total_return: bool = False) -> PortfolioStatisticsTransfer:
+        with self.__lock:
+            if self.__pending >= self.max_pending:
+                raise PortfolioException(error="Service overloaded")
+            self.__pending += 1
+            if self.__loop is None:
+                self.__start()
+
+        admission = _Admission(release=self.__release)
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self.create_portfolio_async(tickers=tickers, n_shares_per_symbol=n_shares_per_symbol,
+                                            initial_date=initial_date, end_date=end_date,
+                                            total_return=total_return, context=contextvars.copy_context(),
+                                            admission=admission),
+                self.__loop)
+        except Exception:
+            admission.close()
+            raise
+        future.add_done_callback(admission.close)
+        try:
+            return future.result(timeout=self.deadline + 1)
+        except FutureTimeoutError:
+            # Only drops the analysis if it is still queued, the slot is released when its pool task finishes.
+            future.cancel()
+            raise PortfolioException(error="Deadline exceeded")
+
+    def __release(self):
+        with self.__lock:
+            self.__pending -= 1
+
+    async def create_portfolio_async(self, tickers: tuple[str], n_shares_per_symbol: dict[str, int],
+                                     initial_date: datetime.date, end_date: datetime.date,
+                                     total_return: bool = False,
+                                     context: contextvars.Context = None,
+                                     admission: _Admission = None) -> PortfolioStatisticsTransfer:
+        """
+        :param context: context of the caller, the timings of the analysis are recorded in it.
+        :param admission: slot of the analysis, held by its process pool task once submitted.
+        :raises PortfolioException: if the analysis is not valid or does not finish before the deadline.
+        """
+        context = context if context is not None else contextvars.copy_context()
+        try:
+            return await asyncio.wait_for(self.__create_portfolio(tickers, n_shares_per_symbol,
+                                                                  initial_date, end_date, total_return, context,
+                                                                  admission),
+                                          timeout=self.deadline)
+        except asyncio.TimeoutError:
+            raise PortfolioException(error="Deadline exceeded")
+
+    async def __create_portfolio(self, tickers, n_shares_per_symbol, initial_date, end_date, total_return, context,
+                                 admission):
+        if any(ticker in st.EXCHANGES for ticker in tickers):
+            raise PortfolioException(error="Invalid ticker")
+
+        started_at = time.perf_counter()
+        symbols_data = await asyncio.gather(*(self.__read_symbol(ticker, context) for ticker in tickers))
+        symbols_data = tuple(symbol for symbol in symbols_data if symbol)
+        if not symbols_data:
+            raise PortfolioException(error="No symbols found")
+
+        benchmarks_data = await asyncio.gather(*(self.__read_symbol(benchmark, context)
+                                                 for benchmark in self._benchmarks(symbols_data)))
+        # A context can only be entered by a thread at a time, each use gets its own copy.
+        context.copy().run(timings.record, 'portfolio.read', time.perf_counter() - started_at)
+
+        # A cancelled analysis is dropped from the pool queue if it has not started yet, once running it finishes.
+        started_at = time.perf_counter()
+        args = (_analyse_portfolio, symbols_data, tuple(benchmarks_data), n_shares_per_symbol,
+                initial_date, end_date, total_return)
+        task = admission.submit(self.__process_pool, *args) if admission else self.__process_pool.submit(*args)
+        analysis, spans = await asyncio.wrap_future(task, loop=self.__loop)
+        context.copy().run(self.__record_analysis, spans, time.perf_counter() - started_at)
+        return analysis
+
+    async def __read_symbol(self, ticker: str, context: contextvars.Context):
+        return await self.__loop.run_in_executor(self.__io_pool, context.copy().run,
+                                                 self.symbol_repository.get_symbol, ticker)
+
+    @staticmethod
+    def __record_analysis(spans: dict[str, float], elapsed: float) -> None:
+        """
+        Records the stages timed by the process pool worker, the rest of the elapsed time was spent
+        waiting for a worker and transferring the data.
+        """
+        for name, seconds in spans.items():
+            timings.record(name, seconds)
+        timings.record('portfolio.pool_wait', max(0.0, elapsed - sum(spans.values())))
+
+    def __start(self):
+        """
+        The loop and the pools are created on first use, after the api workers have been forked.
+        """
+        self.__io_pool = ThreadPoolExecutor(max_workers=st.PORTFOLIO_IO_WORKERS)
+        self.__process_pool = ProcessPoolExecutor(max_workers=self.process_workers,
+                                                  mp_context=multiprocessing.get_context('spawn'))
+        self.__loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.__loop.run_forever, daemon=True)
+        thread.start()
@@ -6,6 +6,7 @@ import numpy as np
 import pandas as pd
 
 from src.Portfolio.domain.portfolio import Portfolio
+from src.Symbol.domain.drawdowns import episodes_to_json
 from src.Symbol.domain.symbol import Symbol
 from src import settings as st
 
@@ -42,9 +43,16 @@ class PortfolioStatisticsTransfer(PortfolioTransfer):
     sharpe_ratio: float
     sortino_ratio: dict[str, float]
     calmar_ratio: float
+    total_return: bool = False
+    drawdowns: pd.DataFrame = None
+    underwater: pd.Series = None
 
     def to_json(self):
         json = super().to_json()
+        json['total_return'] = self.total_return
+        if self.drawdowns is not None:
+            json['drawdowns'] = episodes_to_json(self.drawdowns)
+            json['underwater'] = {k.strftime('%d-%m-%Y'): str(round(v, 4)) for k, v in self.underwater.items()}
         json['annualized_returns'] = str(round(self.annualized_returns, 4))
         json['annualized_volatility'] = str(round(self.annualized_volatility, 4))
         json['maximum_drawdown'] = str(round(self.maximum_drawdown, 4))
@@ -57,9 +65,10 @@ class PortfolioStatisticsTransfer(PortfolioTransfer):
 class DomainService:
     @staticmethod
     def create_portfolio_entity(symbols: tuple[Symbol], n_shares_per_symbols: dict[str, int],
-                                initial_date: Union[datetime.date, None],  end_date: Union[datetime.date, None]) -> Portfolio:
+                                initial_date: Union[datetime.date, None],  end_date: Union[datetime.date, None],
+                                total_return: bool = False) -> Portfolio:
         return Portfolio(symbols=symbols, n_shares_per_symbol=n_shares_per_symbols,
-                         initial_date=initial_date, end_date=end_date)
+                         initial_date=initial_date, end_date=end_date, total_return=total_return)
 
     @staticmethod
     def sharpe_ratio(entity: Portfolio):
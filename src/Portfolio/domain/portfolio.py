@@ -6,25 +6,47 @@ import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
+from src.Symbol.domain.drawdowns import drawdown_episodes
 from src.Symbol.domain.symbol import Symbol
 from src import settings as st
 
 
 class Portfolio:
     def __init__(self, symbols: tuple[Symbol], n_shares_per_symbol: dict[str, int],
-                 initial_date: Union[datetime.date, None], end_date: Union[datetime.date, None]):
+                 initial_date: Union[datetime.date, None], end_date: Union[datetime.date, None],
+                 total_return: bool = False):
+        """
+        :param total_return: if True, the returns of the stocks include their dividends reinvested.
+        """
         self.symbols = symbols
+        self.total_return = total_return
         self.total_shares = sum(n_shares_per_symbol.values())
         self.weights = {symbol.ticker: (n_shares_per_symbol[symbol.ticker] / self.total_shares)
                         for symbol in symbols}
         self.first_date, self.last_date = self.__compute_common_date(initial_date, end_date)
+        self.__weighted_returns = None
+        self.__drawdowns = None
 
     @property
     def weighted_returns(self) -> pd.Series:
-        weighted_rets = DataFrame(data=[symbol.daily_returns[self.first_date:self.last_date]
-                                  .rename(index=symbol.ticker, inplace=True) * self.weights[symbol.ticker]
-                                        for symbol in self.symbols]).transpose()
-        return weighted_rets.sum(axis=1)
+        """
+        Computed on first use, every statistic of the portfolio is derived from them.
+        """
+        if self.__weighted_returns is None:
+            weighted_rets = DataFrame(data=[self.__returns(symbol)[self.first_date:self.last_date]
+                                      .rename(index=symbol.ticker, inplace=True) * self.weights[symbol.ticker]
+                                            for symbol in self.symbols]).transpose()
+            self.__weighted_returns = weighted_rets.sum(axis=1)
+        return self.__weighted_returns
+
+    @property
+    def drawdowns(self) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        Drawdown episodes of the value of the portfolio, growing with its weighted returns, and its underwater curve.
+        """
+        if self.__drawdowns is None:
+            self.__drawdowns = drawdown_episodes(self.weighted_returns.fillna(0).add(1).cumprod())
+        return self.__drawdowns
 
     @property
     def volatility(self):
@@ -51,11 +73,16 @@ class Portfolio:
         """
         Max Drawdown
         """
-        cum_rets = self.weighted_returns.add(1).cumprod()
-        nav = ((1 + cum_rets) * 100).fillna(100)
-        hwm = nav.cummax()
-        dd = nav / hwm - 1
-        return min(dd)
+        _, underwater = self.drawdowns
+        return min(underwater.min(), 0)
+
+    def __returns(self, symbol: Symbol) -> pd.Series:
+        """
+        :return: the precomputed total returns of the stocks in total return mode, the daily returns otherwise.
+        """
+        if self.total_return and getattr(symbol, 'total_returns', None) is not None:
+            return symbol.total_returns
+        return symbol.daily_returns
 
     def __compute_common_date(self, initial_date, end_date) -> tuple:
         common_idx = self.symbols[0].daily_returns.index
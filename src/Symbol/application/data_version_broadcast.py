@@ -0,0 +1,131 @@
+import threading
+import time
+
+import ujson
+from pika.exceptions import AMQPError, ConnectionWrongStateError
+
+from src.Symbol.application.rabbitmq_consumer import open_connection
+from src.Utils.data_version import symbols_data_version
+from src.Utils.exceptions import DataConsumerException
+from src import settings as st
+
+
+class DataVersionBroadcast:
+    """
+    Keeps the data version of the instances sharing the ingestion in step: the tickers this instance writes are
+    broadcast on a fanout exchange, and those written by its peers bump its own data version, so its caches are
+    invalidated as if it had written them.
+
+    The tickers bumped while the connection thread is busy are published together in a single message. When the
+    connection is lost the updates may have been missed, on reconnection the whole data of this instance and of its
+    peers is invalidated.
+    """
+    def __init__(self, instance_id: str = st.INSTANCE_ID, exchange: str = st.DATA_VERSION_EXCHANGE):
+        self.instance_id = instance_id
+        self.connection = None
+        self.channel = None
+        self.connected = False
+        self.__exchange = exchange
+        self.__pending = []
+        self.__lock = threading.Lock()
+        # Set while the bumps of a peer are applied, they are not broadcast again.
+        self.__applying = threading.local()
+
+    def start(self) -> None:
+        symbols_data_version.subscribe(self.__on_data_version)
+        thread = threading.Thread(target=self.__run, daemon=True)
+        thread.start()
+
+    def __run(self):
+        reconnection = False
+        while True:
+            try:
+                self.connection = open_connection()
+                self.channel = self.__setup_channel()
+            except (DataConsumerException, AMQPError) as e:
+                st.logger.warning("Data version broadcast cannot connect: {}".format(e))
+                self.__close()
+                time.sleep(st.DATA_VERSION_RETRY_DELAY)
+                continue
+
+            self.connected = True
+            st.logger.info("Data version broadcast connected")
+            if reconnection:
+                with self.__lock:
+                    self.__pending = [None]
+                self.__apply(None)
+            self.__flush()
+            try:
+                self.channel.start_consuming()
+            except AMQPError as e:
+                st.logger.exception(e)
+            self.connected = False
+            self.__close()
+            reconnection = True
+            time.sleep(st.DATA_VERSION_RETRY_DELAY)
+
+    def __setup_channel(self):
+        channel = self.connection.channel()
+        channel.exchange_declare(exchange=self.__exchange, exchange_type='fanout', durable=True)
+        # A queue of its own, deleted with the connection.
+        rabbit_queue = channel.queue_declare(queue='', exclusive=True).method.queue
+        channel.queue_bind(exchange=self.__exchange, queue=rabbit_queue)
+        channel.basic_consume(queue=rabbit_queue, on_message_callback=self.__on_message, auto_ack=True)
+        return channel
+
+    def __close(self):
+        try:
+            if self.connection is not None:
+                self.connection.close()
+        except (ConnectionWrongStateError, AMQPError):
+            pass
+
+    def __on_data_version(self, version: int, ticker: str):
+        if getattr(self.__applying, 'active', False):
+            return
+        with self.__lock:
+            scheduled = bool(self.__pending)
+            self.__pending.append(ticker)
+        if scheduled or not self.connected:
+            # Published along with the pending ones, or once connected.
+            return
+        try:
+            # pika connections are not thread-safe, it is published by the connection's thread.
+            self.connection.add_callback_threadsafe(self.__flush)
+        except (ConnectionWrongStateError, AttributeError) as e:
+            st.logger.warning("Data version cannot be broadcast, it will be on reconnection: {}".format(e))
+
+    def __flush(self):
+        with self.__lock:
+            tickers, self.__pending = self.__pending, []
+        if not tickers:
+            return
+        body = ujson.dumps({'instance': self.instance_id,
+                            'tickers': None if None in tickers else list(dict.fromkeys(tickers))})
+        try:
+            self.channel.basic_publish(exchange=self.__exchange, routing_key='', body=body)
+        except AMQPError as e:
+            st.logger.exception(e)
+            # The peers invalidate everything once it is connected again.
+
+    def __on_message(self, channel, basic_deliver, properties, body):
+        try:
+            message = ujson.loads(body)
+            instance, tickers = message['instance'], message['tickers']
+        except (ValueError, KeyError, TypeError) as e:
+            st.logger.warning("Data version message not valid: {}".format(e))
+            return
+        if instance == self.instance_id:
+            return
+        if tickers is None:
+            self.__apply(None)
+        else:
+            for ticker in tickers:
+                self.__apply(ticker)
+
+    def __apply(self, ticker: str):
+        self.__applying.active = True
+        try:
+            symbols_data_version.bump(ticker)
+        finally:
+            self.__applying.active = False
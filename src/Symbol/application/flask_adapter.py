@@ -1,40 +1,174 @@
-from typing import Union
+from datetime import date
+from typing import Union, Literal
 
+from src.Symbol.application.prefix_sums_cache import PrefixSumsCache
+from src.Symbol.application.screener_cache import ScreenerCache
+from src.Symbol.application.similarity_cache import SimilarityCache
 from src.Symbol.domain.ports.driver_service_interface import DriverServiceInterface
 from src.Symbol.domain.ports.repository_interface import RepositoryInterface
 from src.Symbol.domain.domain_service import DomainService, StockTransfer, StockInformationTransfer, \
-    SymbolStatisticsTransfer, SymbolInformationTransfer
+    SymbolStatisticsTransfer, SymbolInformationTransfer, WindowStatisticsTransfer, DrawdownsTransfer, RiskTransfer, \
+    ScreenTransfer, SimilarityTransfer
 from src.Symbol.domain.symbol import Stock
+from src.Utils.data_version import symbols_data_version
+from src.Utils.exceptions import SymbolException
+from src.Utils.timing import timings
+from src import settings as st
 
 
 class FlaskServiceAdapter(DriverServiceInterface):
     def __init__(self, repository: RepositoryInterface, domain_service: DomainService):
         super().__init__(repository=repository, domain_service=domain_service)
+        self.prefix_sums_cache = PrefixSumsCache(budget_bytes=st.PREFIX_SUMS_BUDGET)
+        self.screener_cache = ScreenerCache(repository=repository, domain_service=domain_service)
+        self.similarity_cache = SimilarityCache(repository=repository, lookback=st.SIMILARITY_LOOKBACK)
 
-    def get_symbol(self, symbol_ticker: str) -> Union[SymbolStatisticsTransfer, bool]:
-        symbol_data = self.repository.get_symbol(ticker=symbol_ticker)
+    def use_repository(self, repository: RepositoryInterface) -> None:
+        """
+        Replaces the repository the symbols are read from, along with the one the caches are built from.
+        """
+        self.repository = repository
+        self.screener_cache.repository = repository
+        self.similarity_cache.repository = repository
+
+    def get_symbol(self, symbol_ticker: str, initial_date: date = None, end_date: date = None,
+                   freq: Literal['W', 'M', 'Q', 'Y'] = None, points: int = None,
+                   total_return: bool = False) -> Union[SymbolStatisticsTransfer, bool]:
+        with timings.span('symbol.read'):
+            symbol_data = self.repository.get_symbol(ticker=symbol_ticker)
         if not symbol_data:
             return False
 
-        symbol = self.domain_service.create_symbol_entity(ticker=symbol_data['ticker'], isin=symbol_data.get('isin'),
-                                                          name=symbol_data['name'], closures=symbol_data['closures'],
-                                                          exchange=symbol_data.get('exchange'),
-                                                          daily_returns=symbol_data.get('daily_returns'),
-                                                          dividends=symbol_data.get('dividends'))
+        with timings.span('symbol.entity'):
+            symbol = self.domain_service.create_symbol_entity(ticker=symbol_data['ticker'],
+                                                              isin=symbol_data.get('isin'), name=symbol_data['name'],
+                                                              closures=symbol_data['closures'],
+                                                              exchange=symbol_data.get('exchange'),
+                                                              daily_returns=symbol_data.get('daily_returns'),
+                                                              dividends=symbol_data.get('dividends'),
+                                                              total_returns=symbol_data.get('total_returns'),
+                                                              aggregates=symbol_data.get('aggregates'),
+                                                              drawdown=symbol_data.get('drawdown'))
+
+        with timings.span('symbol.statistics'):
+            cagr = {'3yr': self.domain_service.compute_cagr(symbol, period='3yr', total_return=total_return),
+                    '5yr': self.domain_service.compute_cagr(symbol, period='5yr', total_return=total_return)}
 
-        cagr = {'3yr': self.domain_service.compute_cagr(symbol, period='3yr'),
-                '5yr': self.domain_service.compute_cagr(symbol, period='5yr')}
+        with timings.span('symbol.reduce'):
+            closures, daily_returns, dividends, volatility = self.domain_service.reduce_history(
+                symbol, initial_date=initial_date, end_date=end_date, freq=freq, points=points)
+        if closures.empty:
+            raise SymbolException(error="No data in the requested range")
 
         if isinstance(symbol, Stock):
+            risk = self.get_risk((symbol.ticker,))
             return StockTransfer(ticker=symbol.ticker, isin=symbol.isin, name=symbol.name,
-                                 closures=symbol.closures, daily_returns=symbol.daily_returns,
-                                 dividends=symbol.dividends, first_date=symbol.first_date,
-                                 last_date=symbol.last_date, cagr=cagr, exchange=symbol.exchange)
+                                 closures=closures, daily_returns=daily_returns,
+                                 dividends=dividends, first_date=closures.index[0],
+                                 last_date=closures.index[-1], cagr=cagr, exchange=symbol.exchange,
+                                 volatility=volatility, risk=risk[0] if risk else None)
 
         return SymbolStatisticsTransfer(ticker=symbol.ticker, name=symbol.name,
-                                        closures=symbol.closures, daily_returns=symbol.daily_returns,
-                                        first_date=symbol.first_date, last_date=symbol.last_date,
-                                        cagr=cagr)
+                                        closures=closures, daily_returns=daily_returns,
+                                        first_date=closures.index[0], last_date=closures.index[-1],
+                                        cagr=cagr, volatility=volatility)
+
+    def get_window(self, symbol_ticker: str, initial_date: date = None,
+                   end_date: date = None) -> Union[WindowStatisticsTransfer, bool]:
+        prefix_sums = self.prefix_sums_cache.get(symbol_ticker)
+        if prefix_sums is None:
+            version = symbols_data_version.of(symbol_ticker)
+            with timings.span('symbol.read'):
+                symbol_data = self.repository.get_symbol(ticker=symbol_ticker)
+            if not symbol_data:
+                return False
+            with timings.span('symbol.entity'):
+                symbol = self.domain_service.create_symbol_entity(ticker=symbol_data['ticker'],
+                                                                  isin=symbol_data.get('isin'),
+                                                                  name=symbol_data['name'],
+                                                                  closures=symbol_data['closures'],
+                                                                  exchange=symbol_data.get('exchange'),
+                                                                  daily_returns=symbol_data.get('daily_returns'),
+                                                                  dividends=symbol_data.get('dividends'),
+                                                                  total_returns=symbol_data.get('total_returns'))
+                prefix_sums = symbol.prefix_sums
+            self.prefix_sums_cache.put(symbol_ticker, prefix_sums, version)
+
+        with timings.span('symbol.window'):
+            window = self.domain_service.compute_window_statistics(symbol_ticker, prefix_sums,
+                                                                   initial_date=initial_date, end_date=end_date)
+        if window is None:
+            raise SymbolException(error="No data in the requested range")
+        return window
+
+    def get_drawdowns(self, symbol_ticker: str, initial_date: date = None, end_date: date = None,
+                      min_depth: float = 0) -> Union[DrawdownsTransfer, bool]:
+        with timings.span('symbol.read'):
+            symbol_data = self.repository.get_symbol(ticker=symbol_ticker)
+        if not symbol_data:
+            return False
+
+        with timings.span('symbol.entity'):
+            symbol = self.domain_service.create_symbol_entity(ticker=symbol_data['ticker'],
+                                                              isin=symbol_data.get('isin'), name=symbol_data['name'],
+                                                              closures=symbol_data['closures'],
+                                                              exchange=symbol_data.get('exchange'),
+                                                              daily_returns=symbol_data.get('daily_returns'),
+                                                              dividends=symbol_data.get('dividends'),
+                                                              total_returns=symbol_data.get('total_returns'),
+                                                              drawdown=symbol_data.get('drawdown'))
+
+        with timings.span('symbol.drawdowns'):
+            drawdowns = self.domain_service.compute_drawdowns(symbol, initial_date=initial_date, end_date=end_date,
+                                                              min_depth=min_depth)
+        if drawdowns is None:
+            raise SymbolException(error="No data in the requested range")
+        return drawdowns
+
+    def get_risk(self, tickers: tuple[str, ...] = None) -> tuple[RiskTransfer, ...]:
+        with timings.span('risk.read'):
+            risk = self.repository.get_risk(tickers)
+        return tuple(self.domain_service.risk_transfer(ticker, stock_risk)
+                     for ticker, stock_risk in sorted(risk.items()))
+
+    def screen(self, filters: dict[str, tuple[Union[float, None], Union[float, None]]] = None,
+               symbol_type: Literal['stock', 'index'] = None, order_by: str = None, descending: bool = False,
+               offset: int = 0, limit: int = 50) -> ScreenTransfer:
+        with timings.span('screen.index'):
+            index = self.screener_cache.index()
+        with timings.span('screen.query'):
+            total, symbols = index.query(filters=filters, symbol_type=symbol_type, order_by=order_by,
+                                         descending=descending, offset=offset, limit=limit)
+        return ScreenTransfer(total=total, offset=offset, limit=limit, symbols=symbols)
+
+    def get_similar(self, symbol_ticker: str, k: int = 20, least: bool = False) -> Union[SimilarityTransfer, bool]:
+        with timings.span('similarity.profiles'):
+            profiles = self.similarity_cache.profiles()
+        if symbol_ticker not in profiles.rows:
+            return False
+        profile = profiles.profile(symbol_ticker)
+        if profile is None:
+            raise SymbolException(error="Not enough returns in the lookback")
+        with timings.span('similarity.search'):
+            symbols = profiles.most_correlated(profile, k, least=least, exclude=(symbol_ticker,))
+        return SimilarityTransfer(reference=(symbol_ticker,), least=least, first_date=profiles.calendar[0],
+                                  last_date=profiles.calendar[-1], symbols=symbols)
+
+    def get_similar_to_portfolio(self, n_shares_per_symbol: dict[str, int], k: int = 20,
+                                 least: bool = False) -> Union[SimilarityTransfer, bool]:
+        with timings.span('similarity.profiles'):
+            profiles = self.similarity_cache.profiles()
+        if not any(ticker in profiles.rows for ticker in n_shares_per_symbol):
+            return False
+        total_shares = sum(n_shares_per_symbol.values())
+        profile = profiles.portfolio_profile({ticker: shares / total_shares
+                                              for ticker, shares in n_shares_per_symbol.items()})
+        if profile is None:
+            raise SymbolException(error="Not enough returns in the lookback")
+        with timings.span('similarity.search'):
+            symbols = profiles.most_correlated(profile, k, least=least, exclude=tuple(n_shares_per_symbol))
+        return SimilarityTransfer(reference=tuple(n_shares_per_symbol), least=least,
+                                  first_date=profiles.calendar[0], last_date=profiles.calendar[-1], symbols=symbols)
 
     def get_stocks_info(self) -> tuple[StockInformationTransfer, ...]:
         stocks = self.repository.get_all_symbols(symbol_type='stock')
@@ -0,0 +1,47 @@
+import threading
+
+
+class IngestionMetrics:
+    """
+    Counters and gauges of the symbols ingestion.
+    Latencies are exponentially weighted moving averages, in seconds.
+    """
+    SMOOTHING = 0.1
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.received = 0
+        self.processed = 0
+        self.acked = 0
+        self.nacked = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.queue_depth = 0
+        self.queue_bytes = 0
+        self.prefetch_count = 0
+        self.lag = 0.0
+        self.processing_latency = 0.0
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def observe(self, lag: float, processing_latency: float) -> None:
+        """
+        :param lag: time the message waited in the queue.
+        :param processing_latency: time spent parsing, computing and writing the message.
+        """
+        with self.__lock:
+            self.lag += self.SMOOTHING * (lag - self.lag)
+            self.processing_latency += self.SMOOTHING * (processing_latency - self.processing_latency)
+
+    def to_dict(self) -> dict:
+        with self.__lock:
+            return {'received': self.received, 'processed': self.processed, 'acked': self.acked,
+                    'nacked': self.nacked, 'dropped': self.dropped, 'skipped': self.skipped,
+                    'queue_depth': self.queue_depth, 'queue_bytes': self.queue_bytes,
+                    'prefetch_count': self.prefetch_count,
+                    'lag': self.lag, 'processing_latency': self.processing_latency}
+
+
+ingestion_metrics = IngestionMetrics()
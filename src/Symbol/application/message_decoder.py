@@ -0,0 +1,250 @@
+import hashlib
+import re
+import struct
+
+import numpy as np
+import pandas as pd
+import ujson
+
+from src.Symbol.domain.screener import screen_metrics
+from src.Symbol.domain.symbol import Symbol, Stock
+from src import settings as st
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/x-msgpack'
+COLUMNAR_CONTENT_TYPE = 'application/vnd.fincalcs.columnar'
+
+# Columnar layout, little-endian: magic, length of the info, number of days and flags (bit 0: has dividends),
+# the symbol info as json, and the days since epoch (int32), closures (float64) and dividends (float64) arrays,
+# each array aligned to 8 bytes.
+COLUMNAR_MAGIC = b'FCC1'
+COLUMNAR_HEADER = struct.Struct('<4sIIB3x')
+COLUMNAR_HAS_DIVIDENDS = 1
+
+_TICKER_PATTERN = re.compile(rb'"ticker"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_MSGPACK_TICKER_KEY = b'\xa6ticker'
+
+
+class MessageNotValid(Exception):
+    pass
+
+
+def decode_symbol_message(body: bytes, routing_key: str, content_type: str = None) -> dict:
+    """
+    Parses a findata symbol message and computes its historic data as compact arrays.
+    Runs in the decoder processes, so it must not depend on any state of the consumer.
+
+    :param body: raw body of the message.
+    :param routing_key: routing key the message was published with.
+    :param content_type: encoding of the body, json if not given.
+    :return: the symbol info, its 'historic' holds 'days' (days since epoch), 'close', 'daily_returns'
+    and, for stocks, 'dividends' numpy arrays, and its 'derived' the data stored along with the history.
+    :raises MessageNotValid: if the message has not the expected format.
+    """
+    content_type = _media_type(content_type)
+    if content_type == JSON_CONTENT_TYPE:
+        message = _decode_json(body)
+    elif content_type == MSGPACK_CONTENT_TYPE:
+        message = _decode_msgpack(body)
+    elif content_type == COLUMNAR_CONTENT_TYPE:
+        message = _decode_columnar(body)
+    else:
+        raise MessageNotValid('content type {}'.format(content_type))
+
+    message['routing_key'] = routing_key
+    validation = validate_message_format(message)
+    if not validation[0]:
+        raise MessageNotValid(validation[1])
+
+    historic = message['historic']
+    if historic.get('days') is None or len(historic['days']) != len(historic['close']):
+        raise MessageNotValid('historic.close')
+    closes = pd.Series(historic['close'])
+    historic['daily_returns'] = closes.pct_change().to_numpy()
+    if routing_key == st.SYMBOLS_STOCK_ROUTING_KEY:
+        if len(historic['dividends']) != len(historic['close']):
+            raise MessageNotValid('historic.dividends')
+    else:
+        historic.pop('dividends', None)
+    message['derived'] = _derived_data(historic)
+    return message
+
+
+def _derived_data(historic: dict) -> dict:
+    """
+    Computes the data derived from the history, so the consumer process only wraps and writes it.
+    :return: the 'aggregates' by frequency, 'drawdown' state and 'screen_metrics' and, for stocks, 'total_returns'
+    array, empty without closures.
+    """
+    if not len(historic['close']):
+        return {}
+    dates = pd.DatetimeIndex(historic['days'].astype('datetime64[D]'))
+    closures = pd.Series(historic['close'], index=dates)
+    daily_returns = pd.Series(historic['daily_returns'], index=dates)
+    drawdown = Symbol._process_drawdown(closures)
+    derived = {'aggregates': Symbol._process_aggregates(closures, daily_returns), 'drawdown': drawdown,
+               'screen_metrics': screen_metrics(closures, daily_returns, drawdown)}
+    if historic.get('dividends') is not None:
+        paid = np.flatnonzero(np.nan_to_num(historic['dividends']))
+        dividends = pd.Series(historic['dividends'][paid], index=dates[paid])
+        derived['total_returns'] = Stock._process_total_returns(closures, dividends).to_numpy()
+    return derived
+
+
+def peek_ticker(body: bytes, content_type: str = None) -> str:
+    """
+    Finds the ticker of a message without decoding it.
+    :return: the ticker, or an empty string if it is not found.
+    """
+    content_type = _media_type(content_type)
+    if content_type == COLUMNAR_CONTENT_TYPE:
+        try:
+            info = ujson.loads(body[COLUMNAR_HEADER.size:COLUMNAR_HEADER.size + _columnar_header(body)[0]])
+        except (ValueError, MessageNotValid):
+            return ''
+        return info.get('ticker') or ''
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return _msgpack_ticker(body)
+    # The ticker is usually one of the first keys, the whole body is only scanned otherwise.
+    match = _TICKER_PATTERN.search(body, 0, 4096) or _TICKER_PATTERN.search(body)
+    return match.group(1).decode() if match is not None else ''
+
+
+def _media_type(content_type: str = None) -> str:
+    # Parameters as the charset do not change the decoding.
+    return content_type.split(';')[0].strip().lower() if content_type else JSON_CONTENT_TYPE
+
+
+def _decode_json(body: bytes) -> dict:
+    message = ujson.loads(body)
+    historic = message.get('historic')
+    if not isinstance(historic, dict) or historic.get('close') is None:
+        return message
+
+    closures = historic['close']
+    dates = pd.to_datetime(tuple(closures.keys()), format=_date_format(closures))
+    message['historic'] = {'days': dates.values.astype('datetime64[D]').astype(np.int32),
+                           'close': np.asarray(tuple(closures.values()), dtype=np.float64)}
+    if historic.get('dividends') is not None:
+        message['historic']['dividends'] = np.asarray(tuple(historic['dividends'].values()), dtype=np.float64)
+    return message
+
+
+def _decode_msgpack(body: bytes) -> dict:
+    """
+    The historic arrays are msgpack bin values holding little-endian 'days' (int32), 'close' and 'dividends' (float64).
+    """
+    if msgpack is None:
+        raise MessageNotValid('msgpack is not installed')
+    message = msgpack.unpackb(body, raw=False)
+    historic = message.get('historic')
+    if not isinstance(historic, dict) or historic.get('close') is None or historic.get('days') is None:
+        return message
+
+    message['historic'] = {'days': np.frombuffer(historic['days'], dtype='<i4'),
+                           'close': np.frombuffer(historic['close'], dtype='<f8')}
+    if historic.get('dividends') is not None:
+        message['historic']['dividends'] = np.frombuffer(historic['dividends'], dtype='<f8')
+    return message
+
+
+def _decode_columnar(body: bytes) -> dict:
+    info_length, days, flags = _columnar_header(body)
+    offset = COLUMNAR_HEADER.size + info_length
+    message = ujson.loads(body[COLUMNAR_HEADER.size:offset])
+
+    offset = _align(offset)
+    days_offset, offset = offset, _align(offset + 4 * days)
+    closures_offset, offset = offset, offset + 8 * days
+    dividends_offset, offset = offset, offset + 8 * days if flags & COLUMNAR_HAS_DIVIDENDS else offset
+    if offset > len(body):
+        raise MessageNotValid('historic')
+
+    message['historic'] = {'days': np.frombuffer(body, dtype='<i4', count=days, offset=days_offset),
+                           'close': np.frombuffer(body, dtype='<f8', count=days, offset=closures_offset)}
+    if flags & COLUMNAR_HAS_DIVIDENDS:
+        message['historic']['dividends'] = np.frombuffer(body, dtype='<f8', count=days, offset=dividends_offset)
+    return message
+
+
+def _columnar_header(body: bytes) -> tuple[int, int, int]:
+    """
+    :return: length of the info, number of days and flags of a columnar message.
+    """
+    if len(body) < COLUMNAR_HEADER.size:
+        raise MessageNotValid('header')
+    magic, info_length, days, flags = COLUMNAR_HEADER.unpack_from(body)
+    if magic != COLUMNAR_MAGIC:
+        raise MessageNotValid('header')
+    return info_length, days, flags
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _msgpack_ticker(body: bytes) -> str:
+    position = body.find(_MSGPACK_TICKER_KEY)
+    if position == -1:
+        return ''
+    position += len(_MSGPACK_TICKER_KEY)
+    prefix = body[position:position + 1]
+    if not prefix:
+        return ''
+    if 0xa0 <= prefix[0] <= 0xbf:
+        length, position = prefix[0] & 0x1f, position + 1
+    elif prefix[0] == 0xd9 and len(body) > position + 1:
+        length, position = body[position + 1], position + 2
+    else:
+        return ''
+    return body[position:position + length].decode(errors='replace')
+
+
+def message_fingerprint(body: bytes) -> str:
+    """
+    Fingerprint of a raw message, used to detect symbols republished without changes before parsing them.
+    The whole body is hashed, it holds the close and dividends payload up to its last date and the symbol info.
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def validate_message_format(symbol_message: dict) -> tuple[bool, str]:
+    """
+    Validates the received message format.
+    :param symbol_message: Message received from the consumer.
+    :return: True,None if message is valid, False,Missing_key if is not valid.
+    """
+    if symbol_message.get('routing_key') is None:
+        symbol_message['routing_key'] = 'default'
+
+    historic = symbol_message.get('historic')
+
+    if symbol_message.get('ticker') is None:
+        key_error = 'ticker'
+    elif symbol_message.get('routing_key') != st.SYMBOLS_INDEX_ROUTING_KEY and \
+            symbol_message.get('isin') is None:
+        key_error = 'isin'
+    elif symbol_message.get('name') is None:
+        key_error = 'name'
+    elif historic is None:
+        key_error = 'historic'
+    elif historic.get('close') is None:
+        key_error = 'historic.close'
+    elif symbol_message.get('routing_key') == st.SYMBOLS_STOCK_ROUTING_KEY and \
+            historic.get('dividends') is None:
+        key_error = 'historic.dividends'
+    else:
+        key_error = None
+
+    return (True, None) if key_error is None else (False, key_error)
+
+
+def _date_format(closures: dict) -> str:
+    for first_date in closures:
+        return '%Y-%m-%d %H:%M:%S' if ' ' in first_date else '%Y-%m-%d'
+    return '%Y-%m-%d'
@@ -0,0 +1,78 @@
+import queue
+import threading
+import zlib
+from dataclasses import dataclass, field
+from time import monotonic
+
+
+@dataclass
+class ConsumedMessage:
+    """
+    Message received from the broker, pending to be processed and acknowledged.
+    """
+    delivery_tag: int
+    ticker: str
+    routing_key: str
+    body: bytes
+    content_type: str = None
+    received_at: float = field(default_factory=monotonic)
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+
+class PartitionedQueue:
+    """
+    Queue split in partitions by ticker hash, the messages of a ticker always land in the same
+    partition, so they are processed in order while different tickers are processed in parallel.
+
+    The queue is bounded by the size of the messages it holds, a message takes its space from
+    the moment it is put until it is marked as done.
+    """
+    def __init__(self, partitions: int, max_bytes: int = None):
+        self.partitions = partitions
+        self.max_bytes = max_bytes
+        self.__queues = tuple(queue.Queue() for _ in range(partitions))
+        self.__bytes = 0
+        self.__space = threading.Condition()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the messages queued or being processed.
+        """
+        return self.__bytes
+
+    def partition(self, ticker: str) -> int:
+        return zlib.crc32(ticker.encode()) % self.partitions
+
+    def put(self, message: ConsumedMessage, timeout: float = None) -> None:
+        """
+        Blocks until there is room for the message, a message bigger than the queue is only accepted if it is empty.
+        :raises queue.Full: if the message does not fit before the timeout.
+        """
+        with self.__space:
+            if self.max_bytes is not None and \
+                    not self.__space.wait_for(lambda: self.__bytes == 0
+                                              or self.__bytes + message.size <= self.max_bytes, timeout=timeout):
+                raise queue.Full
+            self.__bytes += message.size
+        self.__queues[self.partition(message.ticker)].put(message)
+
+    def get(self, partition: int, timeout: float = None) -> ConsumedMessage:
+        """
+        :raises queue.Empty: if there is not any message in the partition before the timeout.
+        """
+        return self.__queues[partition].get(timeout=timeout)
+
+    def done(self, message: ConsumedMessage) -> None:
+        """
+        Releases the space of a message once it has been processed.
+        """
+        with self.__space:
+            self.__bytes -= message.size
+            self.__space.notify_all()
+
+    def qsize(self) -> int:
+        return sum(q.qsize() for q in self.__queues)
@@ -0,0 +1,71 @@
+import zlib
+
+from src.Utils.hash_ring import HashRing
+from src import settings as st
+
+
+def ticker_partition(ticker: str, partitions: int = st.SYMBOLS_PARTITIONS) -> int:
+    """
+    :return: the partition of the ticker, the crc32 of its utf-8 bytes modulo the partitions,
+    so any producer can compute it.
+    """
+    return zlib.crc32(ticker.encode()) % partitions
+
+
+def partition_routing_key(routing_key: str, ticker: str) -> str:
+    """
+    :param routing_key: routing key of the symbol message, SYMBOLS_STOCK_ROUTING_KEY or SYMBOLS_INDEX_ROUTING_KEY.
+    :return: the routing key the producers publish the message with when the ingestion is partitioned,
+    e.g. findata.symbol.stock.17.
+    """
+    return '{}.{}'.format(routing_key, ticker_partition(ticker))
+
+
+def symbol_routing_key(routing_key: str) -> str:
+    """
+    :return: the routing key of the symbol message without its partition.
+    """
+    prefix, _, partition = routing_key.rpartition('.')
+    return prefix if partition.isdigit() else routing_key
+
+
+class SymbolsPartitioning:
+    """
+    Partitions of the tickers this instance ingests. When several instances share the ingestion each partition has
+    its own queue, bound to its routing keys on the symbols exchange, and the partitions are assigned to the
+    instances by consistent hashing: adding or removing an instance only moves about 1/n of them, and their
+    queues keep the messages until the new owner consumes them.
+    """
+    def __init__(self, instance_id: str, instances: tuple[str, ...], partitions: int):
+        self.instance_id = instance_id
+        self.enabled = bool(instances)
+        if not self.enabled:
+            self.partitions = tuple(range(partitions))
+            return
+
+        if instance_id not in instances:
+            st.logger.warning("Instance {} is not one of INSTANCES, it owns no partition".format(instance_id))
+        ring = HashRing(instances, virtual_nodes=st.HASH_RING_VIRTUAL_NODES)
+        self.partitions = tuple(partition for partition in range(partitions)
+                                if ring.node(str(partition)) == instance_id)
+        self.__owned = frozenset(self.partitions)
+        self.__count = partitions
+
+    def owns(self, ticker: str) -> bool:
+        """
+        :return: whether the symbol is ingested, and its derived data computed, by this instance.
+        """
+        return not self.enabled or ticker_partition(ticker, self.__count) in self.__owned
+
+    def bindings(self) -> dict[str, str]:
+        """
+        :return: by queue, the routing key it is bound with, the queues this instance consumes.
+        """
+        if not self.enabled:
+            return {st.SYMBOLS_QUEUE: st.SYMBOLS_TOPIC_ROUTING_KEY}
+        return {st.SYMBOLS_PARTITION_QUEUE.format(partition): st.SYMBOLS_PARTITION_ROUTING_KEY.format(partition)
+                for partition in self.partitions}
+
+
+symbols_partitioning = SymbolsPartitioning(instance_id=st.INSTANCE_ID, instances=st.INSTANCES,
+                                           partitions=st.SYMBOLS_PARTITIONS)
@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+from typing import Union
+
+from src.Symbol.domain.prefix_sums import ReturnsPrefixSums
+from src.Utils.data_version import symbols_data_version
+
+
+class PrefixSumsCache:
+    """
+    Keeps the returns prefix sums of the symbols queried by date window, so each window query is answered
+    without reading and decoding the symbol again.
+
+    Once the bytes held exceed the budget the least recently queried symbols are evicted, the symbols are
+    dropped as soon as their data version is bumped.
+    """
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__symbols = OrderedDict()
+        self.__nbytes = 0
+        self.__lock = threading.Lock()
+        symbols_data_version.subscribe(self.__on_data_version)
+
+    @property
+    def nbytes(self) -> int:
+        return self.__nbytes
+
+    def __len__(self) -> int:
+        return len(self.__symbols)
+
+    def get(self, ticker: str) -> Union[ReturnsPrefixSums, None]:
+        with self.__lock:
+            prefix_sums = self.__symbols.get(ticker)
+            if prefix_sums is None:
+                self.misses += 1
+                return None
+            self.__symbols.move_to_end(ticker)
+            self.hits += 1
+            return prefix_sums
+
+    def put(self, ticker: str, prefix_sums: ReturnsPrefixSums, version: int) -> None:
+        """
+        :param version: data version of the symbol before reading it, they are not kept if it has changed since.
+        """
+        with self.__lock:
+            if symbols_data_version.of(ticker) != version:
+                return
+            previous = self.__symbols.pop(ticker, None)
+            if previous is not None:
+                self.__nbytes -= previous.nbytes
+            if prefix_sums.nbytes > self.budget_bytes:
+                return
+            self.__symbols[ticker] = prefix_sums
+            self.__nbytes += prefix_sums.nbytes
+            while self.__nbytes > self.budget_bytes:
+                _, evicted = self.__symbols.popitem(last=False)
+                self.__nbytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__symbols.clear()
+            self.__nbytes = 0
+
+    def __on_data_version(self, version: int, ticker: str):
+        if ticker is None:
+            self.clear()
+            return
+        with self.__lock:
+            prefix_sums = self.__symbols.pop(ticker, None)
+            if prefix_sums is not None:
+                self.__nbytes -= prefix_sums.nbytes
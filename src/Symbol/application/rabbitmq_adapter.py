@@ -1,116 +1,292 @@
+import multiprocessing
 import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+import numpy as np
+import pandas as pd
+
+from src.Symbol.application.ingestion_metrics import ingestion_metrics
+from src.Symbol.application.message_decoder import decode_symbol_message, message_fingerprint, MessageNotValid
+from src.Symbol.application.partitioned_queue import PartitionedQueue, ConsumedMessage
+from src.Symbol.application.partitioning import symbols_partitioning
 from src.Symbol.application.rabbitmq_consumer import RabbitmqConsumer
 from src.Symbol.domain.ports.driven_service_interface import DrivenServiceInterface
 from src.Symbol.domain.domain_service import DomainService
 from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Utils.data_version import symbols_data_version
 from src.Utils.exceptions import DataConsumerException, ServiceException, RepositoryException
+from src.Utils.timing import timings
 from src import settings as st
 
 
-class MessageNotValid(Exception):
-    pass
-
-
 class RabbitmqServiceAdapter(DrivenServiceInterface):
-    def __init__(self, repository: RepositoryInterface, domain_service: DomainService):
+    def __init__(self, repository: RepositoryInterface, domain_service: DomainService,
+                 workers: int = st.SYMBOLS_CONSUMER_WORKERS):
         super().__init__(repository=repository, domain_service=domain_service)
-        self.__consumers_queue = queue.Queue()
-        self.consumer = self.__create_rabbit_consumer(rabbit_queue=st.SYMBOLS_QUEUE, exchange=st.SYMBOLS_EXCHANGE,
-                                                      routing_key=st.SYMBOLS_TOPIC_ROUTING_KEY)
+        self.workers = workers
+        self.__consumers_queue = PartitionedQueue(partitions=workers, max_bytes=st.SYMBOLS_QUEUE_MAX_BYTES)
+        self.metrics = ingestion_metrics
+        self.__decoders = None
+        self.__fingerprints = {}
+        self.__unchanged = []
+        self.__unchanged_lock = threading.Lock()
+        self.consumer = self.__create_rabbit_consumer(bindings=symbols_partitioning.bindings(),
+                                                      exchange=st.SYMBOLS_EXCHANGE)
         self.repository = repository
 
+    @property
+    def messages_queue(self) -> PartitionedQueue:
+        """
+        Queue the consumer puts the received messages into.
+        """
+        return self.__consumers_queue
+
     def fetch_symbol_data(self) -> None:
         """
         Gets the symbol data, converts it to a symbol entity,
         precalculates it's financials data, and saves into the db.
         """
+        self.__load_fingerprints()
+        self.__start_decoders()
         try:
             self.consumer.start_consumer()
         except DataConsumerException:
+            self.__decoders.shutdown(wait=False)
             raise ServiceException()
 
+        workers = [threading.Thread(target=self.__process_partition, args=(partition,))
+                   for partition in range(self.workers)]
+        for worker in workers:
+            worker.start()
+        self.__control_prefetch()
+        for worker in workers:
+            worker.join()
+        self.__decoders.shutdown()
+        self.__touch_unchanged()
+
+    def __control_prefetch(self) -> None:
+        """
+        Adapts the prefetch window while the consumer is connected: it is halved when the queue is
+        close to its size limit or messages are being nacked, and it grows while the queue has room
+        and the messages do not wait in it longer than SYMBOLS_TARGET_LAG.
+        """
+        prefetch = st.SYMBOLS_PREFETCH_COUNT
+        nacked = self.metrics.nacked
+        self.metrics.prefetch_count = prefetch
+        while self.consumer.connected:
+            time.sleep(st.SYMBOLS_PREFETCH_ADJUST_INTERVAL)
+            self.__touch_unchanged()
+            self.metrics.queue_depth = self.__consumers_queue.qsize()
+            self.metrics.queue_bytes = self.__consumers_queue.nbytes
+            fill = self.__consumers_queue.nbytes / st.SYMBOLS_QUEUE_MAX_BYTES
+
+            if fill > 0.8 or self.metrics.nacked > nacked:
+                new_prefetch = max(st.SYMBOLS_PREFETCH_MIN, prefetch // 2)
+            elif fill < 0.5 and self.metrics.lag < st.SYMBOLS_TARGET_LAG:
+                new_prefetch = min(st.SYMBOLS_PREFETCH_MAX, prefetch + self.workers)
+            else:
+                new_prefetch = prefetch
+            nacked = self.metrics.nacked
+
+            if new_prefetch != prefetch:
+                prefetch = new_prefetch
+                self.consumer.set_prefetch(prefetch)
+                self.metrics.prefetch_count = prefetch
+                st.logger.info("Symbols consumer prefetch set to {}, ingestion metrics: {}"
+                               .format(prefetch, self.metrics.to_dict()))
+
+    def __process_partition(self, partition: int) -> None:
+        """
+        Processes, in order, the messages of the tickers that belong to the partition.
+        """
         while True:
             try:
-                symbol_message = self.__consumers_queue.get(timeout=0.5)
+                symbol_message = self.__consumers_queue.get(partition, timeout=0.5)
             except queue.Empty:
                 if not self.consumer.connected:
                     break
                 continue
-            else:
-                try:
-                    self.__process_symbol_data_message(symbol_message)
-                except MessageNotValid:
-                    continue
+            self.__settle(symbol_message)
+
+    def __settle(self, symbol_message: ConsumedMessage) -> None:
+        """
+        Processes the message and acks it once it has been stored, if it could not be stored it is
+        nacked so the broker delivers it again. Not valid messages are acked and dropped, the messages that fail
+        with any other error are dropped too, nacked without requeue so the broker dead-letters them if it has to.
+        """
+        started_at = time.monotonic()
+        try:
+            self.__process_symbol_data_message(symbol_message)
+        except MessageNotValid:
+            self.metrics.increment('dropped')
+            self.consumer.acknowledge(symbol_message.delivery_tag)
+            self.metrics.increment('acked')
+        except RepositoryException:
+            self.consumer.reject(symbol_message.delivery_tag, requeue=True)
+            self.metrics.increment('nacked')
+        except BrokenProcessPool as e:
+            st.logger.exception(e)
+            self.consumer.reject(symbol_message.delivery_tag, requeue=True)
+            self.metrics.increment('nacked')
+            self.__start_decoders()
+        except Exception as e:
+            # Would fail again on every delivery, the partition thread keeps processing the rest.
+            st.logger.error("Message for symbol: {} cannot be processed, it is dropped".format(
+                symbol_message.ticker or 'unknown ticker'))
+            st.logger.exception(e)
+            # Not counted as nacked, the prefetch window only shrinks under backpressure.
+            self.consumer.reject(symbol_message.delivery_tag, requeue=False)
+            self.metrics.increment('dropped')
+        else:
+            self.consumer.acknowledge(symbol_message.delivery_tag)
+            self.metrics.increment('acked')
+        finally:
+            self.__consumers_queue.done(symbol_message)
+            self.metrics.increment('processed')
+            self.metrics.observe(lag=started_at - symbol_message.received_at,
+                                 processing_latency=time.monotonic() - started_at)
+            timings.record('ingestion.lag', started_at - symbol_message.received_at)
+            timings.record('ingestion.message', time.monotonic() - started_at)
 
     def save_stock(self, stock_info: dict) -> None:
-        closures = stock_info['historic']['close']
-        dividends = stock_info['historic']['dividends']
-        stock = self.domain_service.create_symbol_entity(ticker=stock_info['ticker'], isin=stock_info['isin'],
-                                                         name=stock_info['name'], closures=closures,
-                                                         exchange=stock_info['exchange'], dividends=dividends)
+        with timings.span('ingestion.entity'):
+            closures, daily_returns, dividends = self.__historic_data(stock_info['historic'])
+            # Computed by the decoder processes, this process only wraps them.
+            derived = stock_info.get('derived') or {}
+            total_returns = derived.get('total_returns')
+            if total_returns is not None:
+                total_returns = pd.Series(total_returns, index=closures.index)
+            stock = self.domain_service.create_symbol_entity(ticker=stock_info['ticker'], isin=stock_info['isin'],
+                                                             name=stock_info['name'], closures=closures,
+                                                             exchange=stock_info['exchange'], dividends=dividends,
+                                                             daily_returns=daily_returns, total_returns=total_returns,
+                                                             aggregates=derived.get('aggregates'),
+                                                             drawdown=derived.get('drawdown'),
+                                                             screen_metrics=derived.get('screen_metrics'))
+            if not stock.closures.empty:
+                # Materialized here, the repositories store them along the history. Only computed if the message
+                # was decoded without them.
+                stock.aggregates
+                stock.drawdown
+                stock.screen_metrics
         if stock.closures.empty or stock.daily_returns.empty:
             pass
         else:
             try:
-                self.repository.save_stock(stock)
+                with timings.span('ingestion.write'):
+                    self.repository.save_stock(stock, fingerprint=stock_info.get('fingerprint'))
             except RepositoryException as e:
                 st.logger.exception(e)
+                raise e
+            self.__fingerprints[stock.ticker] = stock_info.get('fingerprint')
+            symbols_data_version.bump(stock.ticker)
 
     def save_index(self, index_info: dict) -> None:
-        closures = index_info['historic']['close']
-        index = self.domain_service.create_symbol_entity(ticker=index_info['ticker'], name=index_info['name'],
-                                                         closures=closures)
+        with timings.span('ingestion.entity'):
+            closures, daily_returns, _ = self.__historic_data(index_info['historic'])
+            derived = index_info.get('derived') or {}
+            index = self.domain_service.create_symbol_entity(ticker=index_info['ticker'], name=index_info['name'],
+                                                             closures=closures, daily_returns=daily_returns,
+                                                             aggregates=derived.get('aggregates'),
+                                                             drawdown=derived.get('drawdown'),
+                                                             screen_metrics=derived.get('screen_metrics'))
+            if not index.closures.empty:
+                index.aggregates
+                index.drawdown
+                index.screen_metrics
         if index.closures.empty or index.daily_returns.empty:
             pass
         else:
             try:
-                self.repository.save_index(index)
+                with timings.span('ingestion.write'):
+                    self.repository.save_index(index, fingerprint=index_info.get('fingerprint'))
             except RepositoryException as e:
                 st.logger.exception(e)
+                raise e
+            self.__fingerprints[index.ticker] = index_info.get('fingerprint')
+            symbols_data_version.bump(index.ticker)
 
-    def __create_rabbit_consumer(self, rabbit_queue: str, exchange: str, routing_key: str) -> RabbitmqConsumer:
-        return RabbitmqConsumer(messages_received_queue=self.__consumers_queue, rabbit_queue=rabbit_queue,
-                                exchange=exchange, routing_key=routing_key)
+    def __load_fingerprints(self) -> None:
+        try:
+            self.__fingerprints = self.repository.get_fingerprints()
+        except RepositoryException as e:
+            # Without them every symbol is rewritten, as it was before fingerprinting.
+            st.logger.exception(e)
+            self.__fingerprints = {}
 
-    def __process_symbol_data_message(self, symbol_message: dict) -> None:
-        validation = self.__validate_message_format(symbol_message)
-        if not validation[0]:
-            st.logger.error("Message from {} received with missing key: {}".format(st.SYMBOLS_QUEUE,
-                                                                                   validation[1]))
+    def __touch_unchanged(self) -> None:
+        """
+        Refreshes the update date of the symbols skipped as unchanged, in a single write.
+        """
+        with self.__unchanged_lock:
+            tickers, self.__unchanged = tuple(self.__unchanged), []
+        if not tickers:
+            return
+        try:
+            self.repository.touch_symbols(tickers)
+        except RepositoryException as e:
+            st.logger.exception(e)
+
+    def __start_decoders(self) -> None:
+        # Messages are parsed and their entities computed in other processes, out of the GIL of the api threads.
+        self.__decoders = ProcessPoolExecutor(max_workers=st.SYMBOLS_DECODER_PROCESSES,
+                                              mp_context=multiprocessing.get_context('spawn'))
+
+    def __create_rabbit_consumer(self, bindings: dict[str, str], exchange: str) -> RabbitmqConsumer:
+        if not symbols_partitioning.enabled:
+            return RabbitmqConsumer(messages_received_queue=self.__consumers_queue, bindings=bindings,
+                                    exchange=exchange)
+        st.logger.info("Instance {} consumes the symbols partitions {}".format(symbols_partitioning.instance_id,
+                                                                               symbols_partitioning.partitions))
+        # While the partitions are moved between instances two of them may consume the same queue,
+        # only one at a time receives its messages so those of a ticker keep their order.
+        return RabbitmqConsumer(messages_received_queue=self.__consumers_queue, bindings=bindings,
+                                exchange=exchange, queue_arguments={'x-single-active-consumer': True})
+
+    def __process_symbol_data_message(self, symbol_message: ConsumedMessage) -> None:
+        # Symbols republished without changes are neither parsed nor rewritten.
+        with timings.span('ingestion.fingerprint'):
+            fingerprint = message_fingerprint(symbol_message.body)
+        if self.__fingerprints.get(symbol_message.ticker) == fingerprint:
+            with self.__unchanged_lock:
+                self.__unchanged.append(symbol_message.ticker)
+            self.metrics.increment('skipped')
+            return
+
+        try:
+            with timings.span('ingestion.decode'):
+                decoded_message = self.__decoders.submit(decode_symbol_message, symbol_message.body,
+                                                         symbol_message.routing_key,
+                                                         symbol_message.content_type).result()
+        except MessageNotValid as e:
+            st.logger.error("Message from {} received with missing key: {}".format(st.SYMBOLS_QUEUE, e))
+            raise e
+        except ValueError as e:
+            st.logger.error("Message from {} received with a not valid body: {}".format(st.SYMBOLS_QUEUE, e))
             raise MessageNotValid()
-        if symbol_message['routing_key'] == st.SYMBOLS_STOCK_ROUTING_KEY:
-            self.save_stock(symbol_message)
-        elif symbol_message['routing_key'] == st.SYMBOLS_INDEX_ROUTING_KEY:
-            self.save_index(symbol_message)
+        decoded_message['fingerprint'] = fingerprint
+        if decoded_message['routing_key'] == st.SYMBOLS_STOCK_ROUTING_KEY:
+            self.save_stock(decoded_message)
+        elif decoded_message['routing_key'] == st.SYMBOLS_INDEX_ROUTING_KEY:
+            self.save_index(decoded_message)
 
     @staticmethod
-    def __validate_message_format(symbol_message: dict) -> tuple[bool, str]:
+    def __historic_data(historic: dict) -> tuple:
         """
-        Validates the received message format.
-        :param symbol_message: Message received from the consumer.
-        :return: True,None if message is valid, False,Missing_key if is not valid.
+        :param historic: historic data of a message, as decoded arrays or as the original dicts.
+        :return: closures, daily_returns (None if they must be computed) and dividends (None if not present),
+        only the days with a payment are kept from the dividends arrays.
         """
-        if symbol_message.get('routing_key') is None:
-            symbol_message['routing_key'] = 'default'
-
-        historic = symbol_message.get('historic')
-
-        if symbol_message.get('ticker') is None:
-            key_error = 'ticker'
-        elif symbol_message.get('routing_key') != st.SYMBOLS_INDEX_ROUTING_KEY and \
-                symbol_message.get('isin') is None:
-            key_error = 'isin'
-        elif symbol_message.get('name') is None:
-            key_error = 'name'
-        elif historic is None:
-            key_error = 'historic'
-        elif historic.get('close') is None:
-            key_error = 'historic.close'
-        elif symbol_message.get('routing_key') == st.SYMBOLS_STOCK_ROUTING_KEY and \
-                historic.get('dividends') is None:
-            key_error = 'historic.dividends'
-        else:
-            key_error = None
+        if 'days' not in historic:
+            return historic['close'], None, historic.get('dividends')
 
-        return (True, None) if key_error is None else (False, key_error)
+        dates = pd.DatetimeIndex(historic['days'].astype('datetime64[D]'))
+        dividends = historic.get('dividends')
+        if dividends is not None:
+            paid = np.flatnonzero(np.nan_to_num(dividends))
+            dividends = pd.Series(dividends[paid], index=dates[paid])
+        return (pd.Series(historic['close'], index=dates), pd.Series(historic['daily_returns'], index=dates),
+                dividends)
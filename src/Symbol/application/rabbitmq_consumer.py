@@ -1,27 +1,53 @@
+import functools
 import socket
 import threading
 import queue
 
-import ujson as ujson
 from pika import PlainCredentials, BlockingConnection, ConnectionParameters
 from pika.adapters.blocking_connection import BlockingChannel
 from pika.exceptions import ConnectionWrongStateError, AMQPConnectionError, AMQPChannelError
 
+from src.Symbol.application.ingestion_metrics import ingestion_metrics
+from src.Symbol.application.message_decoder import peek_ticker
+from src.Symbol.application.partitioned_queue import PartitionedQueue, ConsumedMessage
+from src.Symbol.application.partitioning import symbol_routing_key
 from src.Utils.exceptions import DataConsumerException
 from src import settings as st
 
 
+def open_connection() -> BlockingConnection:
+    """
+    Opens a connection to rabbit.
+    :raises DataConsumerException: if rabbit cannot be reached.
+    """
+    credentials = PlainCredentials(username=st.RABBIT_USER, password=st.RABBIT_PASSW)
+    try:
+        return BlockingConnection(
+            ConnectionParameters(host=st.RABBIT_HOST, port=st.RABBIT_PORT,
+                                 virtual_host=st.RABBIT_VHOST, credentials=credentials,
+                                 connection_attempts=5,
+                                 retry_delay=3))
+    except (AMQPConnectionError, socket.gaierror) as e:
+        st.logger.exception(e)
+        raise DataConsumerException()
+
+
 class RabbitmqConsumer:
-    def __init__(self, messages_received_queue: queue.Queue, rabbit_queue: str,
-                 exchange: str, routing_key: str):
+    def __init__(self, messages_received_queue: PartitionedQueue, bindings: dict[str, str],
+                 exchange: str, prefetch_count: int = st.SYMBOLS_PREFETCH_COUNT, queue_arguments: dict = None):
+        """
+        :param bindings: by queue, the routing key it is bound to the exchange with, every queue is consumed.
+        :param queue_arguments: (optional) arguments the queues are declared with.
+        """
         super().__init__()
         self.connection = None
         self.channel = None
         self.connected = False
-        self.__rabbit_queue = rabbit_queue
+        self.__bindings = bindings
         self.__rabbit_exchange = exchange
-        self.__rabbit_routing_key = routing_key
+        self.__queue_arguments = queue_arguments
         self.__queue = messages_received_queue
+        self.__prefetch_count = prefetch_count
 
     def start_consumer(self):
         self.connection = self.connect()
@@ -31,7 +57,8 @@ class RabbitmqConsumer:
             self.disconnect()
             raise e
 
-        self.channel.basic_consume(on_message_callback=self.__on_message, queue=self.__rabbit_queue)
+        for rabbit_queue in self.__bindings:
+            self.channel.basic_consume(on_message_callback=self.__on_message, queue=rabbit_queue)
         thread = threading.Thread(target=self.channel.start_consuming)
         thread.start()
 
@@ -39,18 +66,11 @@ class RabbitmqConsumer:
         """
         Opens the connection to rabbit.
         """
-
-        credentials = PlainCredentials(username=st.RABBIT_USER, password=st.RABBIT_PASSW)
         try:
-            connection = BlockingConnection(
-                ConnectionParameters(host=st.RABBIT_HOST, port=st.RABBIT_PORT,
-                                     virtual_host=st.RABBIT_VHOST, credentials=credentials,
-                                     connection_attempts=5,
-                                     retry_delay=3))
-        except (AMQPConnectionError, socket.gaierror) as e:
-            st.logger.exception(e)
+            connection = open_connection()
+        except DataConsumerException as e:
             self.connected = False
-            raise DataConsumerException()
+            raise e
 
         st.logger.info("Symbol rabbitmq consumer connected")
         self.connected = True
@@ -65,17 +85,53 @@ class RabbitmqConsumer:
         finally:
             self.connected = False
 
+    def acknowledge(self, delivery_tag: int) -> None:
+        """
+        Acks a processed message, can be called from any thread.
+        """
+        self.__threadsafe(functools.partial(self.channel.basic_ack, delivery_tag=delivery_tag))
+
+    def reject(self, delivery_tag: int, requeue: bool = True) -> None:
+        """
+        Nacks a message, can be called from any thread.
+        """
+        self.__threadsafe(functools.partial(self.channel.basic_nack, delivery_tag=delivery_tag, requeue=requeue))
+
+    def set_prefetch(self, prefetch_count: int) -> None:
+        """
+        Changes the prefetch window, can be called from any thread.
+        """
+        self.__prefetch_count = prefetch_count
+        self.__threadsafe(functools.partial(self.channel.basic_qos, prefetch_count=prefetch_count, global_qos=True))
+
+    def __threadsafe(self, callback):
+        # pika channels are not thread-safe, the callback is run by the connection's thread.
+        try:
+            self.connection.add_callback_threadsafe(callback)
+        except (ConnectionWrongStateError, AttributeError) as e:
+            st.logger.warning("Message cannot be settled, the consumer is disconnected: {}".format(e))
+
     def __on_message(self, channel, basic_deliver, properties, body):
-        message = ujson.loads(body)
-        message['routing_key'] = basic_deliver.routing_key
+        # The body is decoded by the decoder processes, only the ticker is needed here to partition it.
+        ticker = self.__find_ticker(properties, body)
+        ingestion_metrics.increment('received')
         try:
-            self.__queue.put(message, timeout=1)
+            self.__queue.put(ConsumedMessage(delivery_tag=basic_deliver.delivery_tag, ticker=ticker,
+                                             routing_key=symbol_routing_key(basic_deliver.routing_key), body=body,
+                                             content_type=getattr(properties, 'content_type', None)), timeout=1)
         except queue.Full:
             st.logger.warning("Message for symbol: {} cannot be processed, "
-                              "will be resent to the exchange".format(message.get('ticker', 'unknown ticker')))
+                              "will be resent to the exchange".format(ticker or 'unknown ticker'))
             channel.basic_nack(delivery_tag=basic_deliver.delivery_tag)
-        else:
-            channel.basic_ack(delivery_tag=basic_deliver.delivery_tag)
+            ingestion_metrics.increment('nacked')
+
+    @staticmethod
+    def __find_ticker(properties, body: bytes) -> str:
+        headers = getattr(properties, 'headers', None) or {}
+        ticker = headers.get('ticker')
+        if ticker is not None:
+            return ticker.decode() if isinstance(ticker, bytes) else ticker
+        return peek_ticker(body, getattr(properties, 'content_type', None))
 
     def __setup_consumer(self) -> BlockingChannel:
         retry = 0
@@ -84,10 +140,11 @@ class RabbitmqConsumer:
                 channel = self.connection.channel()
 
                 channel.exchange_declare(exchange=st.SYMBOLS_EXCHANGE, exchange_type='topic', durable=True)
-                channel.queue_declare(queue=self.__rabbit_queue)
-                channel.basic_qos(prefetch_count=1)
-                channel.queue_bind(exchange=self.__rabbit_exchange, queue=self.__rabbit_queue,
-                                   routing_key=self.__rabbit_routing_key)
+                # The prefetch window is shared by the queues of the channel.
+                channel.basic_qos(prefetch_count=self.__prefetch_count, global_qos=True)
+                for rabbit_queue, routing_key in self.__bindings.items():
+                    channel.queue_declare(queue=rabbit_queue, arguments=self.__queue_arguments)
+                    channel.queue_bind(exchange=self.__rabbit_exchange, queue=rabbit_queue, routing_key=routing_key)
             except AMQPChannelError as e:
                 st.logger.exception(e)
                 self.connected = False
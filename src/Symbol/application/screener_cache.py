@@ -0,0 +1,76 @@
+import threading
+
+from src.Symbol.domain.domain_service import DomainService
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Symbol.domain.screener import ScreenerIndex
+from src.Utils.data_version import symbols_data_version
+from src.Utils.exceptions import RepositoryException
+
+
+class ScreenerCache:
+    """
+    Keeps the screener index of the symbols universe, built from the screen metrics saved by the ingestion on
+    the first query. The symbols whose data version is bumped are read again and patched into the index on the
+    next query, a bump without ticker rebuilds it.
+    """
+    def __init__(self, repository: RepositoryInterface, domain_service: DomainService):
+        self.repository = repository
+        self.domain_service = domain_service
+        self.__index = None
+        self.__stale = set()
+        self.__generation = 0
+        self.__lock = threading.Lock()
+        self.__build_lock = threading.Lock()
+        symbols_data_version.subscribe(self.__on_data_version)
+
+    def index(self) -> ScreenerIndex:
+        index = self.__index
+        if index is not None and not self.__stale:
+            return index
+        with self.__build_lock:
+            with self.__lock:
+                index, stale, generation = self.__index, self.__stale, self.__generation
+                self.__stale = set()
+            try:
+                if index is None:
+                    index = ScreenerIndex().patched(self.__complete(self.repository.get_screen_metrics()))
+                elif stale:
+                    entries = self.repository.get_screen_metrics(tuple(stale))
+                    index = index.patched(self.__complete({ticker: entries.get(ticker) for ticker in stale}))
+            except RepositoryException:
+                with self.__lock:
+                    self.__stale |= stale
+                raise
+            with self.__lock:
+                # Rebuilt from scratch on the next query if the whole data changed meanwhile.
+                if self.__generation == generation:
+                    self.__index = index
+        return index
+
+    def __complete(self, entries: dict[str, dict]) -> dict[str, dict]:
+        """
+        Computes the metrics of the symbols saved without them.
+        """
+        missing = tuple(ticker for ticker, entry in entries.items() if entry is not None and entry['metrics'] is None)
+        for symbol_data in (self.repository.get_symbols(missing) or ()) if missing else ():
+            symbol = self.domain_service.create_symbol_entity(ticker=symbol_data['ticker'],
+                                                              isin=symbol_data.get('isin'), name=symbol_data['name'],
+                                                              closures=symbol_data['closures'],
+                                                              exchange=symbol_data.get('exchange'),
+                                                              daily_returns=symbol_data.get('daily_returns'),
+                                                              dividends=symbol_data.get('dividends'),
+                                                              total_returns=symbol_data.get('total_returns'),
+                                                              drawdown=symbol_data.get('drawdown'))
+            entries[symbol.ticker] = dict(entries[symbol.ticker], metrics=symbol.screen_metrics)
+        # Deleted meanwhile.
+        return {ticker: entry if entry is None or entry['metrics'] is not None else None
+                for ticker, entry in entries.items()}
+
+    def __on_data_version(self, version: int, ticker: str):
+        with self.__lock:
+            if ticker is None:
+                self.__index = None
+                self.__stale = set()
+                self.__generation += 1
+            else:
+                self.__stale.add(ticker)
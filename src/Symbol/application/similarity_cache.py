@@ -0,0 +1,85 @@
+import threading
+from typing import Union
+
+import pandas as pd
+
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Symbol.domain.similarity import ReturnProfiles
+from src.Symbol.domain.symbol import Symbol
+from src.Utils.data_version import symbols_data_version
+from src.Utils.exceptions import RepositoryException
+
+
+class SimilarityCache:
+    """
+    Keeps the return profiles of the symbols universe, built from their stored daily returns on the first query.
+    The symbols whose data version is bumped are read again and patched into the profiles on the next query,
+    a bump without ticker rebuilds them.
+    """
+    def __init__(self, repository: RepositoryInterface, lookback: int):
+        """
+        :param lookback: business days of returns of each profile.
+        """
+        self.repository = repository
+        self.lookback = lookback
+        self.__profiles = None
+        self.__stale = set()
+        self.__generation = 0
+        self.__lock = threading.Lock()
+        self.__build_lock = threading.Lock()
+        symbols_data_version.subscribe(self.__on_data_version)
+
+    def profiles(self) -> ReturnProfiles:
+        profiles = self.__profiles
+        if profiles is not None and not self.__stale:
+            return profiles
+        with self.__build_lock:
+            with self.__lock:
+                profiles, stale, generation = self.__profiles, self.__stale, self.__generation
+                self.__stale = set()
+            try:
+                if profiles is None:
+                    profiles = ReturnProfiles(self.lookback).patched(
+                        {symbol_data['ticker']: self.__recent_returns(symbol_data)
+                         for symbol_data in self.repository.get_all_symbols()})
+                elif stale:
+                    updates = dict.fromkeys(stale)
+                    updates.update({symbol_data['ticker']: self.__recent_returns(symbol_data)
+                                    for symbol_data in self.repository.get_symbols(tuple(stale)) or ()})
+                    profiles = profiles.patched(updates)
+            except RepositoryException:
+                with self.__lock:
+                    self.__stale |= stale
+                raise
+            with self.__lock:
+                # Rebuilt from scratch on the next query if the whole data changed meanwhile.
+                if self.__generation == generation:
+                    self.__profiles = profiles
+        return profiles
+
+    def __recent_returns(self, symbol_data: dict) -> Union[pd.Series, None]:
+        """
+        :return: the daily returns of the last closures of the symbol, enough to cover the lookback.
+        """
+        # Twice the lookback, for the days without closure. The stored dicts are sorted by date.
+        size = 2 * self.lookback
+        closures, daily_returns = symbol_data['closures'], symbol_data.get('daily_returns')
+        if isinstance(closures, pd.Series):
+            closures = closures.iloc[-size:]
+            daily_returns = daily_returns.iloc[-size:] if daily_returns is not None else None
+        else:
+            closures = dict(list(closures.items())[-size:])
+            daily_returns = dict(list(daily_returns.items())[-size:]) if daily_returns is not None else None
+        if not len(closures):
+            return None
+        closures, daily_returns = Symbol._process_historical_data(closures, daily_returns)
+        return daily_returns if daily_returns is not None else closures.pct_change()
+
+    def __on_data_version(self, version: int, ticker: str):
+        with self.__lock:
+            if ticker is None:
+                self.__profiles = None
+                self.__stale = set()
+                self.__generation += 1
+            else:
+                self.__stale.add(ticker)
@@ -1,10 +1,15 @@
 import threading
+from typing import Union
 
 from src.Symbol.domain.ports.use_case_interface import UseCaseInterface
 from src.Symbol.domain.domain_service import DomainService
+from src.Symbol.domain.risk import RISK_DAYS
+from src.Symbol.application.data_version_broadcast import DataVersionBroadcast
+from src.Symbol.application.partitioning import symbols_partitioning
 from src.Symbol.application.rabbitmq_adapter import RabbitmqServiceAdapter
-from src.Symbol.infrastructure.mongodb_adapter import MongoRepositoryAdapter
-from src.Utils.exceptions import ServiceException
+from src.Symbol.infrastructure.repository_factory import create_repository
+from src.Utils.data_version import symbols_data_version
+from src.Utils.exceptions import ServiceException, RepositoryException
 from src import settings as st
 
 
@@ -16,7 +21,7 @@ class FetchSymbolsUseCase(UseCaseInterface):
         """
         st.logger.info("Starting fetch symbols use case")
         try:
-            rabbit_adapter = RabbitmqServiceAdapter(repository=MongoRepositoryAdapter(),
+            rabbit_adapter = RabbitmqServiceAdapter(repository=create_repository(),
                                                     domain_service=DomainService())
             thread = threading.Thread(target=rabbit_adapter.fetch_symbol_data)
             thread.start()
@@ -24,3 +29,99 @@ class FetchSymbolsUseCase(UseCaseInterface):
         except ServiceException:
             st.logger.error("Fetch symbols use case error, service restart is required!")
             return
+
+
+class CleanOldSymbolsUseCase(UseCaseInterface):
+    def __init__(self):
+        self.repository = create_repository()
+
+    def execute(self):
+        """
+        This use case deletes the symbols that have not been updated lately,
+        the data derived from them is discarded.
+        """
+        try:
+            tickers = self.repository.clean_old_symbols()
+        except RepositoryException:
+            st.logger.error("Clean old symbols use case error, it will be retried on its next run")
+            return
+        for ticker in tickers:
+            symbols_data_version.bump(ticker)
+
+
+class ComputeRiskUseCase(UseCaseInterface):
+    def __init__(self):
+        self.repository = create_repository()
+        self.domain_service = DomainService()
+        self.__changed = set()
+        self.__every_stock = True
+        self.__lock = threading.Lock()
+        symbols_data_version.subscribe(self.__on_data_version)
+
+    def execute(self):
+        """
+        This use case computes the beta, alpha, tracking error and information ratio of the stocks against the
+        benchmark of their exchange, over the latest rolling windows, and saves them.
+        Only the stocks updated since the previous run are computed again, all of them if a benchmark was updated.
+        Either way only the returns of the longest window are read, not the whole history of the stocks.
+        When several instances share the ingestion each one computes the stocks of its partitions.
+        """
+        with self.__lock:
+            changed, every_stock = self.__changed, self.__every_stock or bool(self.__changed & set(st.EXCHANGES))
+            self.__changed, self.__every_stock = set(), False
+        try:
+            self.__compute(None if every_stock else tuple(changed))
+        except RepositoryException:
+            st.logger.error("Compute risk use case error, it will be retried after the next ingestion wave")
+            self.__restore(changed, every_stock)
+        except Exception:
+            self.__restore(changed, every_stock)
+            raise
+
+    def __compute(self, tickers: Union[tuple[str, ...], None]):
+        """
+        :param tickers: tickers of the stocks to compute, every stock if None.
+        """
+        if tickers is None:
+            stocks = self.repository.get_latest_returns(RISK_DAYS, symbol_type='stock')
+        else:
+            tickers = tuple(ticker for ticker in tickers if ticker not in st.EXCHANGES)
+            stocks = self.repository.get_latest_returns(RISK_DAYS, tickers=tickers, symbol_type='stock') \
+                if tickers else {}
+        by_benchmark = {}
+        for ticker, stock in stocks.items():
+            if stock['exchange'] in st.EXCHANGES and symbols_partitioning.owns(ticker):
+                by_benchmark.setdefault(stock['exchange'], {})[ticker] = stock['daily_returns']
+        if not by_benchmark:
+            return
+
+        risk = {}
+        for benchmark, index in self.repository.get_latest_returns(RISK_DAYS, tickers=tuple(by_benchmark)).items():
+            risk.update(self.domain_service.compute_risk(benchmark, index['daily_returns'], by_benchmark[benchmark]))
+        self.repository.save_risk(risk)
+        st.logger.info("Risk of {} stocks computed".format(len(risk)))
+
+    def __restore(self, changed: set[str], every_stock: bool):
+        """
+        The stocks that were not computed are computed on the next run.
+        """
+        with self.__lock:
+            self.__changed |= changed
+            self.__every_stock = self.__every_stock or every_stock
+
+    def __on_data_version(self, version: int, ticker: str):
+        with self.__lock:
+            if ticker is None:
+                self.__every_stock = True
+            else:
+                self.__changed.add(ticker)
+
+
+class BroadcastDataVersionsUseCase(UseCaseInterface):
+    def execute(self):
+        """
+        This use case keeps the caches of the instances sharing the ingestion up to date, each one broadcasts the
+        symbols it writes and invalidates those written by the others.
+        """
+        st.logger.info("Starting data version broadcast of instance {}".format(st.INSTANCE_ID))
+        DataVersionBroadcast().start()
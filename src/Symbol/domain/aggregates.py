@@ -0,0 +1,131 @@
+from datetime import date
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import ujson
+
+# Frequencies materialized with the symbols history: weekly (weeks ending on friday), monthly and yearly.
+AGGREGATED_FREQUENCIES = ('W', 'M', 'Y')
+AGGREGATES_COLUMNS = ('close', 'return', 'volatility')
+
+
+def period_keys(days: np.ndarray, freq: str) -> np.ndarray:
+    """
+    :param days: days since 1970-01-01.
+    :param freq: 'W', 'M', 'Q' or 'Y'.
+    :return: a number identifying the period of each day, increasing with the days.
+    """
+    if freq == 'W':
+        # 1970-01-03 was a saturday, the first day of a week ending on friday.
+        return (days - 2) // 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    if freq == 'M':
+        return months
+    if freq == 'Q':
+        return months // 3
+    return months // 12
+
+
+def aggregate_history(closures: pd.Series, daily_returns: pd.Series, freq: str) -> pd.DataFrame:
+    """
+    Aggregates the daily history by period.
+    :param freq: 'W', 'M', 'Q' or 'Y'.
+    :return: last close, compounded return and realized volatility (standard deviation of the daily returns)
+    of each period, labeled with the date of its last closure. Periods without any closure are not included.
+    """
+    if closures.empty:
+        return pd.DataFrame(columns=AGGREGATES_COLUMNS, index=closures.index, dtype=np.float64)
+
+    keys = period_keys(closures.index.values.astype('datetime64[D]').astype(np.int64), freq)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.concatenate((starts[1:], [len(keys)])) - 1
+
+    values = closures.to_numpy(dtype=np.float64)
+    returns = daily_returns.to_numpy(dtype=np.float64)
+    # Missing returns do not count, as they are skipped by pandas.
+    valid = ~np.isnan(returns)
+    returns = np.where(valid, returns, 0.0)
+    count = np.add.reduceat(valid.astype(np.int64), starts)
+    total = np.add.reduceat(returns, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (np.add.reduceat(returns * returns, starts) - total * total / count) / (count - 1)
+    last_closure = np.maximum.reduceat(np.where(np.isnan(values), -1, np.arange(len(values))), starts)
+
+    aggregates = pd.DataFrame({'close': values[np.maximum(last_closure, 0)],
+                               'return': np.multiply.reduceat(returns + 1, starts) - 1,
+                               'volatility': np.sqrt(np.maximum(variance, 0))},
+                              index=closures.index[ends])
+    return aggregates[last_closure >= starts]
+
+
+def extend_aggregates(aggregates: pd.DataFrame, closures: pd.Series, daily_returns: pd.Series,
+                      freq: str) -> pd.DataFrame:
+    """
+    Brings materialized aggregates up to date with the history, the last aggregated period, which could be
+    still open, and the new ones are aggregated from the daily history, the rest are kept.
+    :return: the aggregates of the whole history.
+    """
+    labels = aggregates.index
+    dates = closures.index
+    if dates.empty or labels.empty or labels[0] < dates[0] or labels[-1] > dates[-1]:
+        # They do not belong to this history.
+        return aggregate_history(closures, daily_returns, freq)
+    if labels[-1] == dates[-1]:
+        return aggregates
+
+    tail = dates.searchsorted(labels[-2], side='right') if len(labels) > 1 else 0
+    return pd.concat((aggregates.iloc[:-1], aggregate_history(closures.iloc[tail:], daily_returns.iloc[tail:], freq)))
+
+
+def window_aggregates(aggregates: pd.DataFrame, closures: pd.Series, daily_returns: pd.Series, freq: str,
+                      initial_date: date = None, end_date: date = None) -> pd.DataFrame:
+    """
+    Aggregates of the periods of a date window, the whole periods are taken from the materialized aggregates,
+    only the periods cut by the edges of the window are aggregated from the daily history.
+    """
+    labels = aggregates.index
+    dates = closures.index
+    start = dates.searchsorted(pd.Timestamp(initial_date)) if initial_date is not None else 0
+    end = dates.searchsorted(pd.Timestamp(end_date), side='right') if end_date is not None else len(dates)
+
+    # Rows [first, last) are the periods ending within the window, the first one may start before it.
+    first = labels.searchsorted(dates[start]) if start < len(dates) else len(labels)
+    last = labels.searchsorted(dates[end - 1], side='right') if end > 0 else 0
+    if first < last and (dates.searchsorted(labels[first - 1], side='right') if first > 0 else 0) < start:
+        first += 1
+    if first >= last:
+        return aggregate_history(closures.iloc[start:end], daily_returns.iloc[start:end], freq)
+
+    head_end = dates.searchsorted(labels[first - 1], side='right') if first > 0 else 0
+    tail_start = dates.searchsorted(labels[last - 1], side='right')
+    return pd.concat((aggregate_history(closures.iloc[start:head_end], daily_returns.iloc[start:head_end], freq),
+                      aggregates.iloc[first:last],
+                      aggregate_history(closures.iloc[tail_start:end], daily_returns.iloc[tail_start:end], freq)))
+
+
+def encode_aggregates(aggregates: dict[str, pd.DataFrame]) -> dict:
+    """
+    :return: the aggregates by frequency as lists, with the days since 1970-01-01 and None instead of NaN,
+    to be stored as json.
+    """
+    return {freq: dict({'days': frame.index.values.astype('datetime64[D]').astype(np.int64).tolist()},
+                       **{column: [None if np.isnan(v) else v for v in frame[column].to_numpy(dtype=np.float64).tolist()]
+                          for column in AGGREGATES_COLUMNS})
+            for freq, frame in aggregates.items()}
+
+
+def decode_aggregates(aggregates: Union[str, dict[str, Union[dict, pd.DataFrame]]]) -> dict[str, pd.DataFrame]:
+    """
+    :param aggregates: aggregates by frequency, encoded (as json or dict) or already as pd.DataFrame.
+    """
+    if isinstance(aggregates, str):
+        aggregates = ujson.loads(aggregates)
+    ret = {}
+    for freq, frame in aggregates.items():
+        if not isinstance(frame, pd.DataFrame):
+            index = pd.DatetimeIndex(np.asarray(frame['days'], dtype=np.int64).astype('datetime64[D]'))
+            frame = pd.DataFrame({column: np.array(frame[column], dtype=np.float64) for column in AGGREGATES_COLUMNS},
+                                 index=index)
+        ret[freq] = frame
+    return ret
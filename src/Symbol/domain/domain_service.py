@@ -1,11 +1,23 @@
 import typing
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, date
 from typing import Union, Literal
 
+import numpy as np
+import pandas as pd
+
+from src.Symbol.domain.aggregates import AGGREGATED_FREQUENCIES, aggregate_history, window_aggregates, period_keys
+from src.Symbol.domain.drawdowns import DrawdownState, drawdown_episodes, episodes_to_json
+from src.Symbol.domain.prefix_sums import ReturnsPrefixSums
+from src.Symbol.domain.risk import latest_risk
+from src.Symbol.domain.screener import cagr, years_before
+from src.Symbol.domain.sampling import lttb_indices
 from src.Symbol.domain.symbol import Symbol, Index, Stock
 from src import settings as st
 
+# Frequencies the history can be aggregated by: weekly (weeks ending on friday), monthly, quarterly and yearly.
+RESAMPLING_FREQUENCIES = ('W', 'M', 'Q', 'Y')
+
 
 @dataclass
 class SymbolTransfer:
@@ -36,23 +48,30 @@ class SymbolTransfer:
 class SymbolStatisticsTransfer(SymbolTransfer):
     """
     cagr: {"3yr": float, "5yr": float}
+    volatility: {Year%month%day%: float}, realized volatility of each period, None if not aggregated.
     """
     cagr: dict
+    volatility: Union[dict, None]
 
     def to_json(self):
         json = super(SymbolStatisticsTransfer, self).to_json()
         json['cagr'] = {k: str(round(v, 4)) for k, v in self.cagr.items()}
+        if self.volatility is not None:
+            json['volatility'] = {k.strftime('%d-%m-%Y'): str(round(v, 4)).replace('nan', 'null')
+                                  for k, v in self.volatility.items()}
         return json
 
 
 @dataclass
 class StockTransfer(SymbolStatisticsTransfer):
     """
-    dividends: {Year%month%day%: float}
+    dividends: {Year%month%day%: float}, only the days with a payment.
+    risk: (optional) risk statistics against the benchmark of its exchange.
     """
     dividends: dict
     exchange: str
     isin: str
+    risk: Union['RiskTransfer', None] = None
 
     def to_json(self):
         json = super(StockTransfer, self).to_json()
@@ -60,6 +79,8 @@ class StockTransfer(SymbolStatisticsTransfer):
                              for k, v in self.dividends.items()}
         json['isin'] = self.isin
         json['exchange'] = self.exchange
+        if self.risk is not None:
+            json['risk'] = self.risk.to_json()
         return json
 
 
@@ -94,39 +115,312 @@ class StockInformationTransfer(SymbolInformationTransfer):
         return json
 
 
+@dataclass
+class WindowStatisticsTransfer:
+    """
+    Statistics of the daily returns of a date window, from its first closure to its last one.
+    first_date: Year%month%day%
+    last_date: Year%month%day%
+    total_return: compounded return with the dividends reinvested, None if the symbol is not a stock.
+    """
+    ticker: str
+    first_date: datetime.timestamp
+    last_date: datetime.timestamp
+    first_close: float
+    last_close: float
+    returns: int
+    compounded_return: float
+    mean_return: float
+    volatility: float
+    total_return: Union[float, None]
+
+    def to_json(self):
+        json = {'ticker': self.ticker,
+                'first_date': self.first_date.strftime('%d-%m-%Y'), 'last_date': self.last_date.strftime('%d-%m-%Y'),
+                'first_close': str(round(self.first_close, 4)).replace('nan', 'null'),
+                'last_close': str(round(self.last_close, 4)).replace('nan', 'null'),
+                'returns': self.returns,
+                'compounded_return': str(round(self.compounded_return, 4)).replace('nan', 'null'),
+                'mean_return': str(round(self.mean_return, 6)).replace('nan', 'null'),
+                'volatility': str(round(self.volatility, 4)).replace('nan', 'null'),
+                'annualized_volatility': str(round(self.volatility * np.sqrt(st.ANNUALIZATION_FACTOR), 4))
+                .replace('nan', 'null')}
+        if self.total_return is not None:
+            json['total_return'] = str(round(self.total_return, 4)).replace('nan', 'null')
+        return json
+
+
+@dataclass
+class DrawdownsTransfer:
+    """
+    Drawdown episodes of a date window, from each high-water mark to its recovery.
+    first_date: Year%month%day%
+    last_date: Year%month%day%
+    episodes: peak_date, trough_date, recovery_date (NaT if not recovered), depth and duration of each episode.
+    underwater: {Year%month%day%: float}, drawdown from the high-water mark of the window on each day.
+    current: drawdown at the last closure of the whole history.
+    """
+    ticker: str
+    first_date: datetime.timestamp
+    last_date: datetime.timestamp
+    max_drawdown: float
+    episodes: pd.DataFrame
+    underwater: pd.Series
+    current: DrawdownState
+
+    def to_json(self):
+        def to_date(day):
+            return pd.Timestamp(np.datetime64(day, 'D')).strftime('%d-%m-%Y')
+
+        json = {'ticker': self.ticker,
+                'first_date': self.first_date.strftime('%d-%m-%Y'), 'last_date': self.last_date.strftime('%d-%m-%Y'),
+                'max_drawdown': str(round(self.max_drawdown, 4)),
+                'episodes': episodes_to_json(self.episodes),
+                'underwater': {k.strftime('%d-%m-%Y'): str(round(v, 4)) for k, v in self.underwater.items()},
+                'current': {'depth': str(round(self.current.depth, 4)),
+                            'peak_date': to_date(self.current.peak_day), 'peak': str(round(self.current.peak, 4)),
+                            'trough_date': to_date(self.current.trough_day),
+                            'trough': str(round(self.current.trough, 4)),
+                            'max_drawdown': str(round(self.current.max_drawdown, 4))}}
+        return json
+
+
+@dataclass
+class RiskTransfer:
+    """
+    Risk statistics of a stock against the benchmark of its exchange, over the rolling windows ending on a date.
+    date: Year%month%day%, last closure of the benchmark in the windows.
+    windows: {window: {beta, alpha, tracking_error, information_ratio}}, None where there is not enough data.
+    """
+    ticker: str
+    benchmark: str
+    date: datetime.timestamp
+    windows: dict
+
+    def to_json(self):
+        json = {'ticker': self.ticker, 'benchmark': self.benchmark, 'date': self.date.strftime('%d-%m-%Y'),
+                'windows': {window: {metric: str(round(value, 4)) if value is not None else None
+                                     for metric, value in statistics.items()}
+                            for window, statistics in self.windows.items()}}
+        return json
+
+
+@dataclass
+class ScreenTransfer:
+    """
+    Page of the symbols that pass the screen filters.
+    total: number of symbols that pass them.
+    symbols: ticker, type and screen metrics of each symbol of the page, None where there is not enough history.
+    """
+    total: int
+    offset: int
+    limit: int
+    symbols: list
+
+    def to_json(self):
+        json = {'total': self.total, 'offset': self.offset, 'limit': self.limit,
+                'symbols': [dict({'ticker': symbol['ticker'], 'type': symbol['type']},
+                                 **{metric: str(round(value, 4)) if value is not None else None
+                                    for metric, value in symbol['metrics'].items()})
+                            for symbol in self.symbols]}
+        return json
+
+
+@dataclass
+class SimilarityTransfer:
+    """
+    Symbols most or least correlated with a symbol or a portfolio, by their daily returns of the lookback.
+    reference: ticker of the symbol or tickers of the portfolio.
+    first_date: Year%month%day%, first business day of the lookback.
+    last_date: Year%month%day%, last business day of the lookback.
+    symbols: ticker and correlation of each symbol, from the most (or least) correlated.
+    """
+    reference: tuple[str, ...]
+    least: bool
+    first_date: datetime.timestamp
+    last_date: datetime.timestamp
+    symbols: list
+
+    def to_json(self):
+        json = {'reference': list(self.reference), 'order': 'least' if self.least else 'most',
+                'first_date': self.first_date.strftime('%d-%m-%Y'), 'last_date': self.last_date.strftime('%d-%m-%Y'),
+                'symbols': [{'ticker': ticker, 'correlation': str(round(correlation, 4))}
+                            for ticker, correlation in self.symbols]}
+        return json
+
+
 class DomainService:
     @staticmethod
     def create_symbol_entity(ticker: str, closures: dict, name: str,
                              isin: str = None, exchange: str = None,
-                             dividends: dict = None, daily_returns: dict = None) -> Symbol:
+                             dividends: dict = None, daily_returns: dict = None, total_returns: dict = None,
+                             aggregates: dict = None, drawdown: dict = None, screen_metrics: dict = None) -> Symbol:
         if dividends is not None and exchange is not None:
-            return Stock(ticker=ticker, isin=isin, name=name, closures=closures,
-                         dividends=dividends, daily_returns=daily_returns, exchange=exchange)
+            return Stock(ticker=ticker, isin=isin, name=name, closures=closures, dividends=dividends,
+                         daily_returns=daily_returns, exchange=exchange, total_returns=total_returns,
+                         aggregates=aggregates, drawdown=drawdown, screen_metrics=screen_metrics)
         elif ticker in st.EXCHANGES:
-            return Index(ticker=ticker, name=name, closures=closures, daily_returns=daily_returns)
+            return Index(ticker=ticker, name=name, closures=closures, daily_returns=daily_returns,
+                         aggregates=aggregates, drawdown=drawdown, screen_metrics=screen_metrics)
 
         else:
-            return Symbol(ticker=ticker, name=name, closures=closures, daily_returns=daily_returns)
+            return Symbol(ticker=ticker, name=name, closures=closures, daily_returns=daily_returns,
+                          aggregates=aggregates, drawdown=drawdown, screen_metrics=screen_metrics)
 
     @staticmethod
-    def compute_cagr(entity: Union[Index, Stock], period: Literal['3yr', '5yr'] = '3yr') -> float:
+    def compute_cagr(entity: Union[Index, Stock], period: Literal['3yr', '5yr'] = '3yr',
+                     total_return: bool = False) -> float:
         """
         Compound annual growth rate
         :param entity: Entity for which compute the cagr.
         :param period: could be '3yr' or '5yr'
+        :param total_return: if True, the growth of stocks includes their dividends reinvested.
         """
         if period not in ["3yr", "5yr"]:
             raise AttributeError
 
-        today = entity.closures.index[-1]
-        today = datetime(today.year, today.month, today.day)
-        if period == '3yr':
-            n = 3
-            first_date = datetime(today.year - 3, today.month, today.day)
-        elif period == '5yr':
-            n = 5
-            first_date = datetime(today.year - 5, today.month, today.day)
-
-        closes = entity.closures[entity.closures.index >= first_date]
-        cagr = ((closes[-1] / closes[0]) ** (1 / n)) - 1
-        return cagr
+        n = 3 if period == '3yr' else 5
+        first_date = years_before(entity.closures.index[-1], n)
+
+        if total_return and isinstance(entity, Stock):
+            # The return of the first day of the period comes from the previous close.
+            growth = entity.prefix_sums.window(initial_date=first_date)['total_return'] + 1
+            return growth ** (1 / n) - 1
+
+        return cagr(entity.closures, n)
+
+    @staticmethod
+    def compute_window_statistics(ticker: str, prefix_sums: ReturnsPrefixSums, initial_date: date = None,
+                                  end_date: date = None) -> Union[WindowStatisticsTransfer, None]:
+        """
+        Statistics of the returns of a date window, in constant time from the prefix sums of the symbol.
+        :param initial_date: (optional) first date of the window.
+        :param end_date: (optional) last date of the window.
+        :return: the statistics or None if there is no data in the window.
+        """
+        window = prefix_sums.window(initial_date=initial_date, end_date=end_date)
+        if window is None:
+            return None
+        return WindowStatisticsTransfer(ticker=ticker, first_date=window['first_date'], last_date=window['last_date'],
+                                        first_close=window['first_close'], last_close=window['last_close'],
+                                        returns=window['returns'], compounded_return=window['compounded_return'],
+                                        mean_return=window['mean'], volatility=np.sqrt(window['variance']),
+                                        total_return=window['total_return'])
+
+    @staticmethod
+    def compute_drawdowns(entity: Symbol, initial_date: date = None, end_date: date = None,
+                          min_depth: float = 0) -> Union[DrawdownsTransfer, None]:
+        """
+        Drawdown episodes of the closures of a date window.
+        :param initial_date: (optional) first date of the window.
+        :param end_date: (optional) last date of the window.
+        :param min_depth: (optional) episodes not deeper than it, as a positive fraction, are left out.
+        :return: the episodes or None if there is no data in the window.
+        """
+        closures = entity.closures
+        if initial_date is not None or end_date is not None:
+            closures = closures.loc[pd.Timestamp(initial_date) if initial_date is not None else None:
+                                    pd.Timestamp(end_date) if end_date is not None else None]
+        episodes, underwater = drawdown_episodes(closures)
+        if underwater.empty:
+            return None
+        return DrawdownsTransfer(ticker=entity.ticker, first_date=underwater.index[0],
+                                 last_date=underwater.index[-1], max_drawdown=underwater.min(),
+                                 episodes=episodes[episodes['depth'] < -min_depth] if min_depth else episodes,
+                                 underwater=underwater, current=entity.drawdown)
+
+    @staticmethod
+    def compute_risk(benchmark: str, benchmark_returns: pd.Series,
+                     stocks_returns: dict[str, pd.Series]) -> dict[str, dict]:
+        """
+        Risk statistics of the stocks against their benchmark, over the rolling windows ending on its last closure.
+        Only the last RISK_DAYS daily returns of the benchmark and the stocks are needed.
+        :param benchmark: ticker of the benchmark.
+        :param stocks_returns: daily returns by ticker of the stocks.
+        :return: by ticker, the benchmark, the day (since 1970-01-01) the windows end and the statistics of each one.
+        """
+        if benchmark_returns.empty or not stocks_returns:
+            return {}
+        day = int(benchmark_returns.index[-1:].values.astype('datetime64[D]').astype(np.int64)[0])
+        risk = latest_risk(benchmark_returns, list(stocks_returns.values()))
+        return {ticker: {'benchmark': benchmark, 'day': day, 'windows': windows}
+                for ticker, windows in zip(stocks_returns, risk)}
+
+    @staticmethod
+    def risk_transfer(ticker: str, risk: dict) -> RiskTransfer:
+        """
+        :param risk: risk statistics of the stock as saved in the repository.
+        """
+        return RiskTransfer(ticker=ticker, benchmark=risk['benchmark'],
+                            date=pd.Timestamp(np.datetime64(int(risk['day']), 'D')), windows=risk['windows'])
+
+    @staticmethod
+    def reduce_history(entity: Symbol, initial_date: date = None, end_date: date = None,
+                       freq: Literal['W', 'M', 'Q', 'Y'] = None, points: int = None) \
+            -> tuple[pd.Series, pd.Series, Union[pd.Series, None], Union[pd.Series, None]]:
+        """
+        Reduces the historic data of the symbol before serializing it.
+        :param entity: Entity whose history will be reduced.
+        :param initial_date: (optional) first date of the window.
+        :param end_date: (optional) last date of the window.
+        :param freq: (optional) aggregation frequency, weekly, monthly, quarterly or yearly.
+        :param points: (optional) max number of points to keep, using LTTB over the closures.
+        :return: closures, daily_returns, the sparse dividends (None if the symbol is not a stock) and the
+        realized volatility of each period (None if the history is not aggregated by freq).
+        """
+        closures = entity.closures
+        daily_returns = entity.daily_returns
+        dividends = getattr(entity, 'dividends', None)
+        volatility = None
+
+        if initial_date is not None or end_date is not None:
+            start = pd.Timestamp(initial_date) if initial_date is not None else None
+            end = pd.Timestamp(end_date) if end_date is not None else None
+            closures = closures.loc[start:end]
+            daily_returns = daily_returns.loc[start:end]
+            if dividends is not None:
+                dividends = dividends.loc[start:end]
+
+        if freq is not None:
+            if freq in AGGREGATED_FREQUENCIES:
+                # The whole periods come from the materialized aggregates, only the edges of the window are
+                # aggregated from the daily history.
+                periods = window_aggregates(entity.aggregates[freq], entity.closures, entity.daily_returns, freq,
+                                            initial_date=initial_date, end_date=end_date)
+            else:
+                periods = aggregate_history(closures, daily_returns, freq)
+            closures, daily_returns, volatility = periods['close'], periods['return'], periods['volatility']
+            if dividends is not None:
+                # Only the periods with a payment and a closure are kept.
+                labels_keys = period_keys(closures.index.values.astype('datetime64[D]').astype(np.int64), freq)
+                keys = period_keys(dividends.index.values.astype('datetime64[D]').astype(np.int64), freq)
+                keys, starts = np.unique(keys, return_index=True)
+                paid = np.add.reduceat(dividends.to_numpy(dtype=np.float64), starts) if len(keys) else np.empty(0)
+                positions = labels_keys.searchsorted(keys)
+                kept = positions < len(labels_keys)
+                kept[kept] = labels_keys[positions[kept]] == keys[kept]
+                kept &= paid != 0
+                dividends = pd.Series(paid[kept], index=closures.index[positions[kept]])
+
+        if points is not None and len(closures) > points:
+            x = closures.index.values.astype('datetime64[D]').astype(np.float64)
+            y = closures.fillna(method='ffill').fillna(method='bfill').to_numpy(dtype=np.float64)
+            idx = lttb_indices(x, y, points)
+
+            # Returns and dividends are aggregated between the selected points, so nothing is lost.
+            growth = daily_returns.fillna(0).add(1).cumprod().iloc[idx]
+            sampled_returns = growth / growth.shift(1) - 1
+            sampled_returns.iloc[0] = daily_returns.iloc[idx[0]]
+            if dividends is not None:
+                # Paid up to each selected date, the first one includes every payment until it.
+                dates = closures.index[idx]
+                paid = np.concatenate(([0.0], dividends.to_numpy(dtype=np.float64).cumsum()))
+                sampled_dividends = np.diff(paid[dividends.index.searchsorted(dates, side='right')], prepend=0.0)
+                paying = sampled_dividends != 0
+                dividends = pd.Series(sampled_dividends[paying], index=dates[paying])
+            closures = closures.iloc[idx]
+            daily_returns = sampled_returns
+            # The volatility is only given for whole periods.
+            volatility = None
+
+        return closures, daily_returns, dividends, volatility
@@ -0,0 +1,118 @@
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+DRAWDOWN_STATE_FIELDS = ('day', 'close', 'peak_day', 'peak', 'trough_day', 'trough', 'max_drawdown')
+EPISODES_COLUMNS = ('peak_date', 'trough_date', 'recovery_date', 'depth', 'duration')
+
+
+class DrawdownState:
+    """
+    Drawdown of a symbol at its last closure: its high-water mark, the lowest closure since then and the deepest
+    drawdown of its whole history. Kept with the symbol and brought up to date with the new closures only,
+    so the current drawdown is known without going through the history.
+    Days are days since 1970-01-01.
+    """
+    __slots__ = DRAWDOWN_STATE_FIELDS
+
+    def __init__(self, day: int, close: float, peak_day: int, peak: float, trough_day: int, trough: float,
+                 max_drawdown: float):
+        self.day = int(day)
+        self.close = float(close)
+        self.peak_day = int(peak_day)
+        self.peak = float(peak)
+        self.trough_day = int(trough_day)
+        self.trough = float(trough)
+        self.max_drawdown = float(max_drawdown)
+
+    @property
+    def depth(self) -> float:
+        """
+        Current drawdown, 0 at a high-water mark.
+        """
+        return self.close / self.peak - 1
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in DRAWDOWN_STATE_FIELDS}
+
+
+def drawdown_state(closures: pd.Series, previous: DrawdownState = None) -> Union[DrawdownState, None]:
+    """
+    :param previous: (optional) state up to a previous closure, only the closures after it are gone through.
+    :return: the state at the last closure, None if there is no closure.
+    """
+    closures = closures.dropna()
+    days = closures.index.values.astype('datetime64[D]').astype(np.int64)
+    values = closures.to_numpy(dtype=np.float64)
+    if previous is not None:
+        tail = days.searchsorted(previous.day, side='right')
+        if tail == len(days):
+            return previous
+        # Nothing before the high-water mark changes the current drawdown, the current episode starts from it.
+        head_days, head_values = [previous.peak_day], [previous.peak]
+        if previous.trough_day != previous.peak_day:
+            head_days.append(previous.trough_day)
+            head_values.append(previous.trough)
+        days = np.concatenate((head_days, days[tail:]))
+        values = np.concatenate((head_values, values[tail:]))
+    if not len(values):
+        return None
+
+    running = np.maximum.accumulate(values)
+    max_drawdown = (values / running - 1).min()
+    if previous is not None:
+        max_drawdown = min(max_drawdown, previous.max_drawdown)
+    peak = np.flatnonzero(values == running[-1])[-1]
+    trough = peak + np.argmin(values[peak:])
+    return DrawdownState(day=days[-1], close=values[-1], peak_day=days[peak], peak=values[peak],
+                         trough_day=days[trough], trough=values[trough], max_drawdown=max_drawdown)
+
+
+def decode_drawdown_state(state: Union[dict, DrawdownState]) -> DrawdownState:
+    return state if isinstance(state, DrawdownState) else DrawdownState(**state)
+
+
+def drawdown_episodes(values: pd.Series) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Finds every drawdown episode of the values (closures or net asset value) in a linear pass.
+    An episode goes from a high-water mark to the first value that recovers it.
+    :return: the episodes, with the dates of their peak, trough and recovery (NaT if not recovered yet),
+    their depth and duration (closures from the peak to the recovery, or to the last one), and the underwater curve.
+    """
+    values = values.dropna()
+    dates = values.index
+    values = values.to_numpy(dtype=np.float64)
+    if not len(values):
+        return pd.DataFrame(columns=EPISODES_COLUMNS), pd.Series(dtype=np.float64)
+
+    underwater = values / np.maximum.accumulate(values) - 1
+    below = underwater < 0
+    edges = np.diff(np.concatenate(([False], below, [False])).astype(np.int8))
+    # The first value is always a peak, every episode starts after one.
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not len(starts):
+        return pd.DataFrame(columns=EPISODES_COLUMNS), pd.Series(underwater, index=dates)
+
+    # The days between episodes are not under water, they do not change the minimum of the previous one.
+    depths = np.minimum.reduceat(underwater, starts)
+    episode = np.cumsum(edges[:-1] == 1) - 1
+    candidates = np.flatnonzero(below)
+    candidates = candidates[underwater[candidates] == depths[episode[candidates]]]
+    troughs = candidates[np.concatenate(([True], episode[candidates][1:] != episode[candidates][:-1]))]
+    recovered = ends < len(values)
+
+    episodes = pd.DataFrame({'peak_date': dates[starts - 1], 'trough_date': dates[troughs],
+                             'recovery_date': dates[np.where(recovered, ends, 0)].where(recovered, pd.NaT),
+                             'depth': depths,
+                             'duration': np.where(recovered, ends, len(values) - 1) - (starts - 1)})
+    return episodes, pd.Series(underwater, index=dates)
+
+
+def episodes_to_json(episodes: pd.DataFrame) -> list[dict]:
+    return [{'peak_date': peak_date.strftime('%d-%m-%Y'), 'trough_date': trough_date.strftime('%d-%m-%Y'),
+             'recovery_date': recovery_date.strftime('%d-%m-%Y') if not pd.isna(recovery_date) else None,
+             'depth': str(round(depth, 4)), 'duration': int(duration)}
+            for peak_date, trough_date, recovery_date, depth, duration
+            in zip(*(episodes[column] for column in EPISODES_COLUMNS))]
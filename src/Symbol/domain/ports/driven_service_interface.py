@@ -30,6 +30,7 @@ class DrivenServiceInterface(metaclass=ABCMeta):
     def save_stock(self, stock_info: dict) -> None:
         """
         Saves a symbol of type stock.
+        :raises RepositoryException: if the stock could not be stored.
         """
         raise NotImplemented
 
@@ -37,5 +38,6 @@ class DrivenServiceInterface(metaclass=ABCMeta):
     def save_index(self, index_info: dict) -> None:
         """
         Saves a symbol of type index.
+        :raises RepositoryException: if the index could not be stored.
         """
         raise NotImplemented
@@ -1,9 +1,11 @@
 from abc import ABCMeta, abstractmethod
-from typing import Union
+from datetime import date
+from typing import Union, Literal
 
 from src.Symbol.domain.ports.repository_interface import RepositoryInterface
 from src.Symbol.domain.domain_service import DomainService, SymbolInformationTransfer, SymbolStatisticsTransfer, \
-    StockInformationTransfer
+    StockInformationTransfer, WindowStatisticsTransfer, DrawdownsTransfer, RiskTransfer, ScreenTransfer, \
+    SimilarityTransfer
 
 
 class DriverServiceInterface(metaclass=ABCMeta):
@@ -14,7 +16,19 @@ class DriverServiceInterface(metaclass=ABCMeta):
                 hasattr(subclass, 'get_stocks_info') and
                 callable(subclass.get_stocks_info) and
                 hasattr(subclass, 'get_indexes_info') and
-                callable(subclass.get_indexes_info)) or NotImplemented
+                callable(subclass.get_indexes_info) and
+                hasattr(subclass, 'get_window') and
+                callable(subclass.get_window) and
+                hasattr(subclass, 'get_drawdowns') and
+                callable(subclass.get_drawdowns) and
+                hasattr(subclass, 'get_risk') and
+                callable(subclass.get_risk) and
+                hasattr(subclass, 'screen') and
+                callable(subclass.screen) and
+                hasattr(subclass, 'get_similar') and
+                callable(subclass.get_similar) and
+                hasattr(subclass, 'get_similar_to_portfolio') and
+                callable(subclass.get_similar_to_portfolio)) or NotImplemented
 
     def __init__(self, repository: RepositoryInterface, domain_service: DomainService):
         self.repository = repository
@@ -39,11 +53,98 @@ class DriverServiceInterface(metaclass=ABCMeta):
         raise NotImplemented
 
     @abstractmethod
-    def get_symbol(self, symbol_ticker: str) -> Union[SymbolStatisticsTransfer, bool]:
+    def get_symbol(self, symbol_ticker: str, initial_date: date = None, end_date: date = None,
+                   freq: Literal['W', 'M', 'Q', 'Y'] = None, points: int = None,
+                   total_return: bool = False) -> Union[SymbolStatisticsTransfer, bool]:
         """
         Looks for the symbol using the ticker provided, and returns its info and statistics.
 
         :param symbol_ticker: ticker of the symbol.
+        :param initial_date: (optional) first date of the returned history.
+        :param end_date: (optional) last date of the returned history.
+        :param freq: (optional) aggregation frequency of the returned history: 'W', 'M', 'Q' or 'Y'.
+        :param points: (optional) max number of points of the returned history.
+        :param total_return: (optional) if True, the cagr of stocks includes their dividends reinvested.
         :return: symbol's info and statistics or False if symbol not found.
         """
         raise NotImplemented
+
+    @abstractmethod
+    def get_window(self, symbol_ticker: str, initial_date: date = None,
+                   end_date: date = None) -> Union[WindowStatisticsTransfer, bool]:
+        """
+        Computes the statistics of the returns of the symbol in a date window.
+
+        :param symbol_ticker: ticker of the symbol.
+        :param initial_date: (optional) first date of the window.
+        :param end_date: (optional) last date of the window.
+        :return: the window statistics or False if symbol not found.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_drawdowns(self, symbol_ticker: str, initial_date: date = None, end_date: date = None,
+                      min_depth: float = 0) -> Union[DrawdownsTransfer, bool]:
+        """
+        Finds the drawdown episodes of the symbol in a date window.
+
+        :param symbol_ticker: ticker of the symbol.
+        :param initial_date: (optional) first date of the window.
+        :param end_date: (optional) last date of the window.
+        :param min_depth: (optional) episodes not deeper than it are left out.
+        :return: the drawdown episodes or False if symbol not found.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_risk(self, tickers: tuple[str, ...] = None) -> tuple[RiskTransfer, ...]:
+        """
+        Gets the risk statistics of the stocks against the benchmark of their exchange.
+
+        :param tickers: (optional) tickers of the stocks, every stock if None.
+        :return: the risk statistics of the stocks that have them.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def screen(self, filters: dict[str, tuple[Union[float, None], Union[float, None]]] = None,
+               symbol_type: Literal['stock', 'index'] = None, order_by: str = None, descending: bool = False,
+               offset: int = 0, limit: int = 50) -> ScreenTransfer:
+        """
+        Finds the symbols whose screen metrics are within the ranges of the filters.
+
+        :param filters: (optional) by metric, its lowest and highest values, None if unbounded.
+        :param symbol_type: (optional) 'stock' or 'index'.
+        :param order_by: (optional) metric the symbols are ordered by, by ticker if None.
+        :param descending: (optional) orders from the highest value.
+        :param offset: (optional) symbols skipped, for pagination.
+        :param limit: (optional) max number of symbols returned.
+        :return: the number of symbols that pass the filters and the requested page of them.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_similar(self, symbol_ticker: str, k: int = 20, least: bool = False) -> Union[SimilarityTransfer, bool]:
+        """
+        Finds the symbols whose daily returns are most (or least) correlated with those of the symbol.
+
+        :param symbol_ticker: ticker of the symbol.
+        :param k: (optional) number of symbols found.
+        :param least: (optional) finds the least correlated symbols instead.
+        :return: the symbols found or False if symbol not found.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_similar_to_portfolio(self, n_shares_per_symbol: dict[str, int], k: int = 20,
+                                 least: bool = False) -> Union[SimilarityTransfer, bool]:
+        """
+        Finds the symbols whose daily returns are most (or least) correlated with those of the portfolio,
+        its symbols are left out.
+
+        :param n_shares_per_symbol: shares of each symbol of the portfolio.
+        :param k: (optional) number of symbols found.
+        :param least: (optional) finds the least correlated symbols instead.
+        :return: the symbols found or False if none of the symbols of the portfolio is found.
+        """
+        raise NotImplemented
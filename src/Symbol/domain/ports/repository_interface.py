@@ -18,20 +18,36 @@ class RepositoryInterface(metaclass=ABCMeta):
                 hasattr(subclass, 'get_all_symbols') and
                 callable(subclass.get_all_symbols) and
                 hasattr(subclass, 'clean_old_symbols') and
-                callable(subclass.clean_old_symbols)
+                callable(subclass.clean_old_symbols) and
+                hasattr(subclass, 'get_fingerprints') and
+                callable(subclass.get_fingerprints) and
+                hasattr(subclass, 'touch_symbols') and
+                callable(subclass.touch_symbols) and
+                hasattr(subclass, 'save_risk') and
+                callable(subclass.save_risk) and
+                hasattr(subclass, 'get_risk') and
+                callable(subclass.get_risk) and
+                hasattr(subclass, 'get_screen_metrics') and
+                callable(subclass.get_screen_metrics) and
+                hasattr(subclass, 'get_latest_returns') and
+                callable(subclass.get_latest_returns) and
+                hasattr(subclass, 'acquire_lease') and
+                callable(subclass.acquire_lease)
                 ) or NotImplemented
 
     @abstractmethod
-    def save_stock(self, stock: Stock) -> None:
+    def save_stock(self, stock: Stock, fingerprint: str = None) -> None:
         """
         Save a stock entity into the db
+        :param fingerprint: fingerprint of the message the stock was built from.
         """
         raise NotImplemented
 
     @abstractmethod
-    def save_index(self, index: Index) -> None:
+    def save_index(self, index: Index, fingerprint: str = None) -> None:
         """
         Save a index entity into the db
+        :param fingerprint: fingerprint of the message the index was built from.
         """
         raise NotImplemented
 
@@ -64,8 +80,75 @@ class RepositoryInterface(metaclass=ABCMeta):
         raise NotImplemented
 
     @abstractmethod
-    def clean_old_symbols(self) -> None:
+    def clean_old_symbols(self) -> tuple[str, ...]:
         """
         Finds symbols not updated and cleans it.
+        :return: tickers of the cleaned symbols.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_fingerprints(self) -> dict[str, str]:
+        """
+        Gets the fingerprints of the stored symbols.
+        :return: fingerprint by ticker, symbols stored without fingerprint are not included.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def touch_symbols(self, tickers: tuple[str, ...]) -> None:
+        """
+        Marks the symbols as updated without rewriting them, so they are not cleaned as old.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def save_risk(self, risk: dict[str, dict]) -> None:
+        """
+        Saves the risk statistics of the stocks against their benchmark, replacing the previous ones.
+        :param risk: by ticker, the benchmark, the day (since 1970-01-01) of the last closure of the windows and
+        the statistics of each window.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_risk(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        """
+        Gets the risk statistics of the stocks.
+        :param tickers: (optional) tickers of the stocks, every stock if None.
+        :return: risk statistics by ticker, the stocks without them are not included.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_screen_metrics(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        """
+        Gets the screen metrics of the symbols, saved along with them, without their history.
+        :param tickers: (optional) tickers of the symbols, every symbol if None.
+        :return: by ticker, the type of the symbol ('stock' or 'index') and its metrics,
+        None if it was saved without them. The missing symbols are not included.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def get_latest_returns(self, days: int, tickers: tuple[str, ...] = None,
+                           symbol_type: Literal['stock', 'index', 'all'] = 'all') -> dict[str, dict]:
+        """
+        Gets the last daily returns of the symbols, without the rest of their history.
+        :param days: trading days of returns to read.
+        :param tickers: (optional) tickers of the symbols, every symbol if None.
+        :param symbol_type: Filter by symbols type.
+        :return: by ticker, the type of the symbol, its exchange (None for the indexes) and the daily returns
+        of its last days as pd.Series. The missing symbols are not included.
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, seconds: float) -> bool:
+        """
+        Takes the lease, or renews it if the owner already holds it. A lease is held by a single owner among all
+        the processes and instances sharing the repository until it expires.
+        :param seconds: seconds until the lease expires.
+        :return: True if the owner holds the lease.
         """
         raise NotImplemented
@@ -0,0 +1,63 @@
+import sys
+from datetime import date
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+
+class ReturnsPrefixSums:
+    """
+    Cumulative sums of the daily returns of a symbol: of their logarithmic growth, of the returns and of their
+    squares. The compounded return, mean and variance of the returns of any date window are computed from the
+    sums at its edges, found with two binary searches, without scanning the window.
+
+    Missing returns do not count, as they are skipped by pandas.
+    """
+    __slots__ = ('days', 'closures', 'log_growth', 'total', 'squares', 'count', 'total_log_growth', 'nbytes')
+
+    def __init__(self, closures: pd.Series, daily_returns: pd.Series, total_returns: pd.Series = None):
+        """
+        :param total_returns: (optional) returns with the dividends reinvested, of the stocks.
+        """
+        self.days = closures.index.values.astype('datetime64[D]').astype(np.int32)
+        self.closures = closures.to_numpy(dtype=np.float64)
+        returns = daily_returns.to_numpy(dtype=np.float64)
+        valid = ~np.isnan(returns)
+        returns = np.where(valid, returns, 0.0)
+        self.log_growth = np.cumsum(np.log1p(returns))
+        self.total = np.cumsum(returns)
+        self.squares = np.cumsum(returns * returns)
+        self.count = np.cumsum(valid, dtype=np.int32)
+        self.total_log_growth = (np.cumsum(np.log1p(np.nan_to_num(total_returns.to_numpy(dtype=np.float64))))
+                                 if total_returns is not None else None)
+        arrays = (self.days, self.closures, self.log_growth, self.total, self.squares, self.count,
+                  self.total_log_growth)
+        self.nbytes = sys.getsizeof(self) + sum(sys.getsizeof(array) for array in arrays if array is not None)
+
+    def window(self, initial_date: date = None, end_date: date = None) -> Union[dict, None]:
+        """
+        Statistics of the returns of the days after the first one of the window, so the compounded return goes
+        from its first closure to its last one.
+        :return: first and last dates and closures, number of returns, compounded return, mean and variance
+        of the returns and compounded total return (None if not a stock), or None if there is no data in the window.
+        """
+        first = (self.days.searchsorted(np.datetime64(initial_date, 'D').astype(np.int64))
+                 if initial_date is not None else 0)
+        last = (self.days.searchsorted(np.datetime64(end_date, 'D').astype(np.int64), side='right')
+                if end_date is not None else len(self.days)) - 1
+        if first > last:
+            return None
+
+        count = int(self.count[last] - self.count[first])
+        total = self.total[last] - self.total[first]
+        squares = self.squares[last] - self.squares[first]
+        return {'first_date': pd.Timestamp(np.datetime64(int(self.days[first]), 'D')),
+                'last_date': pd.Timestamp(np.datetime64(int(self.days[last]), 'D')),
+                'first_close': self.closures[first], 'last_close': self.closures[last],
+                'returns': count,
+                'compounded_return': np.expm1(self.log_growth[last] - self.log_growth[first]),
+                'mean': total / count if count > 0 else np.nan,
+                'variance': max(squares - total * total / count, 0) / (count - 1) if count > 1 else np.nan,
+                'total_return': (np.expm1(self.total_log_growth[last] - self.total_log_growth[first])
+                                 if self.total_log_growth is not None else None)}
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from src import settings as st
+
+# Rolling windows, in trading days of the benchmark, the risk statistics are computed over.
+RISK_WINDOWS = {'3m': 63, '1yr': 252, '3yr': 756}
+# Days of returns the statistics need, those of the longest window.
+RISK_DAYS = max(RISK_WINDOWS.values())
+RISK_METRICS = ('beta', 'alpha', 'tracking_error', 'information_ratio')
+
+
+def rolling_risk(benchmark_returns: np.ndarray, returns: np.ndarray, window: int) -> dict[str, np.ndarray]:
+    """
+    Rolling regressions of the returns of many symbols against the same benchmark at once, every window comes
+    from the cumulative sums of the returns, their squares and products at its edges.
+    Only the days both the symbol and the benchmark have a return count, a window with less than half of its
+    days counted is NaN.
+    :param benchmark_returns: (days,) daily returns of the benchmark.
+    :param returns: (days, symbols) daily returns of the symbols, aligned to the days of the benchmark.
+    :param window: days of each window.
+    :return: (days, symbols) beta, annualized alpha, annualized tracking error and information ratio
+    of the window ending on each day, NaN for the first window - 1 days.
+    """
+    x = np.broadcast_to(benchmark_returns[:, None], returns.shape)
+    valid = ~np.isnan(x) & ~np.isnan(returns)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, returns, 0.0)
+
+    def window_sums(values: np.ndarray) -> np.ndarray:
+        sums = np.cumsum(values, axis=0)
+        sums[window:] = sums[window:] - sums[:-window]
+        sums[:window - 1] = np.nan
+        return sums
+
+    count = window_sums(valid.astype(np.float64))
+    sx, sy = window_sums(x), window_sums(y)
+    sxx, syy, sxy = window_sums(x * x), window_sums(y * y), window_sums(x * y)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        count = np.where(count >= max(2, window // 2), count, np.nan)
+        variance = (sxx - sx * sx / count) / (count - 1)
+        covariance = (sxy - sx * sy / count) / (count - 1)
+        beta = covariance / variance
+        alpha = (sy - beta * sx) / count * st.ANNUALIZATION_FACTOR
+        # Active returns, of the symbol over the benchmark.
+        active = sy - sx
+        active_variance = (syy - 2 * sxy + sxx - active * active / count) / (count - 1)
+        tracking_error = np.sqrt(np.maximum(active_variance, 0) * st.ANNUALIZATION_FACTOR)
+        information_ratio = active / count * st.ANNUALIZATION_FACTOR / tracking_error
+    return {'beta': beta, 'alpha': alpha, 'tracking_error': tracking_error, 'information_ratio': information_ratio}
+
+
+def aligned_returns(calendar: pd.DatetimeIndex, symbols_returns: list[pd.Series]) -> np.ndarray:
+    """
+    :return: (days, symbols) returns of the symbols on the days of the calendar, NaN the days they have not.
+    """
+    days = calendar.values.astype('datetime64[D]').astype(np.int64)
+    matrix = np.full((len(days), len(symbols_returns)), np.nan)
+    for column, returns in enumerate(symbols_returns):
+        symbol_days = returns.index.values.astype('datetime64[D]').astype(np.int64)
+        positions = days.searchsorted(symbol_days)
+        inside = positions < len(days)
+        inside[inside] = days[positions[inside]] == symbol_days[inside]
+        matrix[positions[inside], column] = returns.to_numpy(dtype=np.float64)[inside]
+    return matrix
+
+
+def latest_risk(benchmark_returns: pd.Series, symbols_returns: list[pd.Series]) -> list[dict]:
+    """
+    Risk statistics of the last window of each rolling window, only the days of the longest one are gone through.
+    :return: by symbol, the statistics of each window, None where there is not enough data.
+    """
+    benchmark_returns = benchmark_returns.iloc[-RISK_DAYS:]
+    returns = aligned_returns(benchmark_returns.index, symbols_returns)
+    benchmark = benchmark_returns.to_numpy(dtype=np.float64)
+
+    risk = [{} for _ in symbols_returns]
+    for name, window in RISK_WINDOWS.items():
+        if window > len(benchmark):
+            last = {metric: np.full(len(symbols_returns), np.nan) for metric in RISK_METRICS}
+        else:
+            last = {metric: values[-1] for metric, values in
+                    rolling_risk(benchmark[-window:], returns[-window:], window).items()}
+        for column, symbol_risk in enumerate(risk):
+            symbol_risk[name] = {metric: None if np.isnan(last[metric][column]) else float(last[metric][column])
+                                 for metric in RISK_METRICS}
+    return risk
@@ -0,0 +1,187 @@
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from src.Symbol.domain.drawdowns import DrawdownState
+from src import settings as st
+
+# Metrics the symbols can be screened by: CAGR of the last 3 and 5 years, annualized volatility and Sharpe ratio of
+# the last year, current and maximum drawdown of the whole history and return of the last day.
+SCREEN_METRICS = ('cagr_3yr', 'cagr_5yr', 'volatility', 'sharpe_ratio', 'drawdown', 'max_drawdown', 'last_return')
+
+
+def years_before(day, years: int) -> pd.Timestamp:
+    """
+    :return: the same day some years before, the 29th of February rolls back to the 28th.
+    """
+    return pd.Timestamp(day).normalize() - pd.DateOffset(years=years)
+
+
+def cagr(closures: pd.Series, years: int) -> float:
+    """
+    Compound annual growth rate of the closures from the same day, some years before the last one.
+    """
+    first_date = years_before(closures.index[-1], years)
+    first = closures.index.searchsorted(first_date)
+    return ((closures.iloc[-1] / closures.iloc[first]) ** (1 / years)) - 1
+
+
+def screen_metrics(closures: pd.Series, daily_returns: pd.Series,
+                   drawdown: Union[DrawdownState, None]) -> dict[str, Union[float, None]]:
+    """
+    :return: the screen metrics of the symbol, None for those there is not enough history for.
+    """
+    closures = closures.dropna()
+    metrics = dict.fromkeys(SCREEN_METRICS)
+    if closures.empty:
+        return metrics
+
+    last_date = closures.index[-1]
+    for years in (3, 5):
+        if closures.index[0] <= years_before(last_date, years):
+            metrics['cagr_{}yr'.format(years)] = float(cagr(closures, years))
+
+    year = daily_returns.iloc[-st.ANNUALIZATION_FACTOR:].dropna()
+    if len(year) > 1:
+        volatility = year.std() * np.sqrt(st.ANNUALIZATION_FACTOR)
+        metrics['volatility'] = float(volatility)
+        if volatility > 0:
+            metrics['sharpe_ratio'] = float((year.mean() * st.ANNUALIZATION_FACTOR - st.RISK_FREE_RATIO) / volatility)
+    if drawdown is not None:
+        metrics['drawdown'] = float(drawdown.depth)
+        metrics['max_drawdown'] = float(drawdown.max_drawdown)
+    if not daily_returns.empty and not np.isnan(daily_returns.iloc[-1]):
+        metrics['last_return'] = float(daily_returns.iloc[-1])
+    return metrics
+
+
+class ScreenerIndex:
+    """
+    Screen metrics of the symbols universe, as a matrix with a row per symbol (sorted by ticker) and, for each
+    metric, the rows sorted by its value along with the sorted values, the symbols without it last.
+
+    A range filter is a pair of binary searches on the sorted values of its metric. The filters are intersected
+    starting from the narrowest range, whose rows are then checked against the bounds of the others, and the
+    result is ordered by walking the sorted rows of the ordering metric, so a query does not sort the universe.
+    The index is never modified, patching it returns a new one that merges the changed rows into the sorted ones.
+    """
+    def __init__(self):
+        self.tickers = np.empty(0, dtype=object)
+        self.types = np.empty(0, dtype=object)
+        self.values = np.empty((0, len(SCREEN_METRICS)))
+        # By metric, the rows sorted by its value (NaN last), their sorted values and the number of them not NaN.
+        self.orders = [np.empty(0, dtype=np.int64) for _ in SCREEN_METRICS]
+        self.sorted_values = [np.empty(0) for _ in SCREEN_METRICS]
+        self.counts = [0 for _ in SCREEN_METRICS]
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def patched(self, updates: dict[str, Union[dict, None]]) -> 'ScreenerIndex':
+        """
+        :param updates: by ticker, the type ('stock' or 'index') and screen metrics of the symbol,
+        None if it has been deleted.
+        :return: a new index with the symbols updated, added or deleted.
+        """
+        changed = np.isin(self.tickers, np.array(list(updates), dtype=object))
+        kept_tickers = self.tickers[~changed]
+        added = sorted(ticker for ticker, entry in updates.items() if entry is not None)
+        added_tickers = np.array(added, dtype=object)
+        positions = kept_tickers.searchsorted(added_tickers)
+        # The new rows of the kept ones are shifted by the number of symbols added before them.
+        kept_rows = np.arange(len(kept_tickers))
+        kept_rows = kept_rows + positions.searchsorted(kept_rows, side='right')
+        added_rows = positions + np.arange(len(added))
+
+        index = ScreenerIndex()
+        index.tickers = np.insert(kept_tickers, positions, added_tickers)
+        index.types = np.insert(self.types[~changed], positions, np.array([updates[ticker]['type'] for ticker in added],
+                                                                          dtype=object))
+        index.values = np.empty((len(index.tickers), len(SCREEN_METRICS)))
+        index.values[kept_rows] = self.values[~changed]
+        index.values[added_rows] = [[np.nan if updates[ticker]['metrics'].get(metric) is None
+                                     else updates[ticker]['metrics'][metric] for metric in SCREEN_METRICS]
+                                    for ticker in added] if added else np.empty((0, len(SCREEN_METRICS)))
+
+        # Old row -> new row of the kept symbols, -1 for the changed ones.
+        remap = np.full(len(self.tickers), -1, dtype=np.int64)
+        remap[~changed] = kept_rows
+        for column in range(len(SCREEN_METRICS)):
+            order = remap[self.orders[column]]
+            order = order[order >= 0]
+            added_values = index.values[added_rows, column]
+            added_order = np.argsort(added_values, kind='stable')
+            inserted_at = index.values[order, column].searchsorted(added_values[added_order], side='right')
+            order = np.insert(order, inserted_at, added_rows[added_order])
+            index.orders[column] = order
+            index.sorted_values[column] = index.values[order, column]
+            index.counts[column] = int(np.count_nonzero(~np.isnan(index.sorted_values[column])))
+        return index
+
+    def query(self, filters: dict[str, tuple[Union[float, None], Union[float, None]]] = None,
+              symbol_type: str = None, order_by: str = None, descending: bool = False,
+              offset: int = 0, limit: int = 50) -> tuple[int, list[dict]]:
+        """
+        :param filters: (optional) by metric, its lowest and highest values (both included), None if unbounded.
+        The symbols without a filtered metric are left out.
+        :param symbol_type: (optional) 'stock' or 'index'.
+        :param order_by: (optional) metric the result is ordered by, the symbols without it last.
+        By ticker if None.
+        :param descending: orders from the highest value.
+        :return: the number of symbols that pass the filters and the page of them, with their type and metrics.
+        """
+        ranges = []
+        for metric, (low, high) in (filters or {}).items():
+            column = SCREEN_METRICS.index(metric)
+            first = self.sorted_values[column].searchsorted(low, side='left') if low is not None else 0
+            last = (self.sorted_values[column][:self.counts[column]].searchsorted(high, side='right')
+                    if high is not None else self.counts[column])
+            ranges.append((max(last - first, 0), column, first, last, low, high))
+        ranges.sort(key=lambda r: r[0])
+
+        rows = None
+        if ranges:
+            _, column, first, last, _, _ = ranges[0]
+            rows = self.orders[column][first:last]
+            for _, column, _, _, low, high in ranges[1:]:
+                if not len(rows):
+                    break
+                values = self.values[rows, column]
+                inside = ~np.isnan(values)
+                if low is not None:
+                    inside &= values >= low
+                if high is not None:
+                    inside &= values <= high
+                rows = rows[inside]
+        if symbol_type is not None:
+            rows = (rows[self.types[rows] == symbol_type] if rows is not None
+                    else np.flatnonzero(self.types == symbol_type))
+
+        if order_by is None:
+            ranked = np.sort(rows) if rows is not None else np.arange(len(self.tickers))
+            if descending:
+                ranked = ranked[::-1]
+        else:
+            column = SCREEN_METRICS.index(order_by)
+            order = self.orders[column]
+            if rows is None:
+                ranked = order
+            elif len(rows) * 8 >= len(order):
+                # Most of the universe, the sorted rows are walked.
+                selected = np.zeros(len(order), dtype=bool)
+                selected[rows] = True
+                ranked = order[selected[order]]
+            else:
+                ranked = rows[np.argsort(self.values[rows, column], kind='stable')]
+            if descending:
+                valid = np.count_nonzero(~np.isnan(self.values[ranked, column]))
+                ranked = np.concatenate((ranked[:valid][::-1], ranked[valid:]))
+
+        page = ranked[offset:offset + limit]
+        return len(ranked), [{'ticker': ticker, 'type': symbol_type,
+                              'metrics': {metric: None if value != value else value
+                                          for metric, value in zip(SCREEN_METRICS, values)}}
+                             for ticker, symbol_type, values in zip(self.tickers[page].tolist(),
+                                                                    self.types[page].tolist(),
+                                                                    self.values[page].tolist())]
@@ -0,0 +1,141 @@
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from src.Symbol.domain.risk import aligned_returns
+
+# Rows of the profiles multiplied at once by the query vectors, bounds the scores held in memory.
+SIMILARITY_BLOCK = 4096
+
+
+class ReturnProfiles:
+    """
+    Daily returns of the symbols over the last business days, one row per symbol, along with their standardized
+    profiles: centered and scaled to unit norm, so the correlation of two symbols is the dot product of their
+    profiles and the correlations against the whole universe are a single matrix product.
+
+    The days a symbol has no return count as its mean return, and the symbols with returns on less than half of
+    the days are left out of the results. The profiles are never modified, patching them returns new ones: the
+    days are shifted as new ones arrive and only the rows of the changed symbols are computed again.
+    """
+    def __init__(self, lookback: int):
+        """
+        :param lookback: business days of returns of each profile.
+        """
+        self.lookback = lookback
+        self.calendar = pd.DatetimeIndex([])
+        self.tickers = np.empty(0, dtype=object)
+        self.returns = np.empty((0, lookback))
+        self.profiles = np.empty((0, lookback), dtype=np.float32)
+        self.usable = np.empty(0, dtype=bool)
+        self.rows = {}
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def patched(self, updates: dict[str, Union[pd.Series, None]]) -> 'ReturnProfiles':
+        """
+        :param updates: by ticker, the latest daily returns of the symbol, None if it has been deleted.
+        :return: new profiles with the symbols updated, added or deleted, up to the last day of any of them.
+        """
+        added = [(ticker, returns.dropna()) for ticker, returns in updates.items() if returns is not None]
+        ends = [returns.index[-1] for _, returns in added if not returns.empty]
+        if len(self.calendar):
+            ends.append(self.calendar[-1])
+        if not ends:
+            return self
+
+        profiles = ReturnProfiles(self.lookback)
+        profiles.calendar = pd.bdate_range(end=max(ends), periods=self.lookback)
+        kept = ~np.isin(self.tickers, np.array(list(updates), dtype=object))
+        returns = self.returns[kept]
+        if not profiles.calendar.equals(self.calendar):
+            # New days, the kept returns are shifted to them.
+            shifted = np.full(returns.shape, np.nan)
+            columns = profiles.calendar.get_indexer(self.calendar)
+            inside = columns >= 0
+            shifted[:, columns[inside]] = returns[:, inside]
+            returns = shifted
+        new_returns = aligned_returns(profiles.calendar, [returns for _, returns in added]).T
+
+        profiles.tickers = np.concatenate((self.tickers[kept], np.array([ticker for ticker, _ in added],
+                                                                        dtype=object)))
+        profiles.returns = np.concatenate((returns, new_returns))
+        if profiles.calendar.equals(self.calendar):
+            new_profiles, new_usable = standardize(new_returns)
+            profiles.profiles = np.concatenate((self.profiles[kept], new_profiles))
+            profiles.usable = np.concatenate((self.usable[kept], new_usable))
+        else:
+            profiles.profiles, profiles.usable = standardize(profiles.returns)
+        profiles.rows = {ticker: row for row, ticker in enumerate(profiles.tickers)}
+        return profiles
+
+    def profile(self, ticker: str) -> Union[np.ndarray, None]:
+        """
+        :return: the profile of the symbol, None if it has not enough returns.
+        """
+        row = self.rows.get(ticker)
+        if row is None or not self.usable[row]:
+            return None
+        return self.profiles[row]
+
+    def portfolio_profile(self, weights: dict[str, float]) -> Union[np.ndarray, None]:
+        """
+        :param weights: weight of each symbol of the portfolio, the days a symbol has no return count as 0.
+        :return: the profile of the weighted returns, None if there is no usable symbol.
+        """
+        rows = [(self.rows[ticker], weight) for ticker, weight in weights.items()
+                if ticker in self.rows and self.usable[self.rows[ticker]]]
+        if not rows:
+            return None
+        returns = np.nan_to_num(self.returns[[row for row, _ in rows]]).T @ np.array([weight for _, weight in rows])
+        profile, usable = standardize(returns[None, :])
+        return profile[0] if usable[0] else None
+
+    def most_correlated(self, profile: np.ndarray, k: int, least: bool = False,
+                        exclude: tuple[str, ...] = ()) -> list[tuple[str, float]]:
+        """
+        Top-k correlations of the profile against the universe, computed by blocks of rows, each block's best
+        candidates are kept with an argpartition.
+        :param least: finds the least correlated symbols instead.
+        :param exclude: tickers left out of the result.
+        :return: ticker and correlation of each symbol found, from the most (or least) correlated.
+        """
+        sign = -1.0 if least else 1.0
+        excluded = np.zeros(len(self.tickers), dtype=bool)
+        excluded[[self.rows[ticker] for ticker in exclude if ticker in self.rows]] = True
+        query = profile.astype(np.float32) * np.float32(sign)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(self.tickers), SIMILARITY_BLOCK):
+            block = slice(start, start + SIMILARITY_BLOCK)
+            scores = self.profiles[block] @ query
+            candidates = np.flatnonzero(self.usable[block] & ~excluded[block])
+            rows = np.concatenate((best_rows, candidates + start))
+            scores = np.concatenate((best_scores, scores[candidates]))
+            if len(scores) > k:
+                best = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[best], scores[best]
+            best_rows, best_scores = rows, scores
+        order = np.argsort(-best_scores, kind='stable')
+        return [(self.tickers[row], float(np.clip(score * sign, -1, 1)))
+                for row, score in zip(best_rows[order], best_scores[order])]
+
+
+def standardize(returns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :param returns: (symbols, days) returns, NaN the days without one.
+    :return: (symbols, days) centered returns scaled to unit norm, 0 the days without return, and whether each
+    symbol has returns on at least half of the days.
+    """
+    valid = ~np.isnan(returns)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, returns, 0.0).sum(axis=1) / count
+        centered = np.where(valid, returns - mean[:, None], 0.0)
+        norm = np.sqrt((centered * centered).sum(axis=1))
+        profiles = centered / norm[:, None]
+    usable = (count >= max(2, returns.shape[1] // 2)) & (norm > 0)
+    profiles[~usable] = 0.0
+    return profiles.astype(np.float32), usable
@@ -1,25 +1,109 @@
 from datetime import datetime
 from typing import Union, Any
 
+import numpy as np
 import pandas as pd
 
+from src.Symbol.domain.aggregates import AGGREGATED_FREQUENCIES, aggregate_history, extend_aggregates, \
+    decode_aggregates
+from src.Symbol.domain.drawdowns import DrawdownState, drawdown_state, decode_drawdown_state
+from src.Symbol.domain.prefix_sums import ReturnsPrefixSums
+from src.Symbol.domain.screener import screen_metrics
+
 
 class Symbol:
-    def __init__(self, ticker: str, name: str, closures: dict, daily_returns: dict = None):
+    def __init__(self, ticker: str, name: str, closures: dict, daily_returns: dict = None, aggregates: dict = None,
+                 drawdown: dict = None, screen_metrics: dict = None):
         self.ticker = ticker
         self.name = name
         self.closures, processed_daily_returns = self._process_historical_data(closures, daily_returns)
         self.daily_returns = (self._compute_daily_returns()
                               if processed_daily_returns is None else processed_daily_returns)
+        self.__stored_aggregates = aggregates
+        self.__aggregates = None
+        self.__stored_drawdown = drawdown
+        self.__drawdown = None
+        self.__prefix_sums = None
+        self.__screen_metrics = screen_metrics
+
+    @property
+    def prefix_sums(self) -> ReturnsPrefixSums:
+        """
+        Cumulative sums of the returns, computed on first use, for the date window statistics.
+        """
+        if self.__prefix_sums is None:
+            self.__prefix_sums = ReturnsPrefixSums(self.closures, self.daily_returns,
+                                                   getattr(self, 'total_returns', None))
+        return self.__prefix_sums
+
+    @property
+    def aggregates(self) -> dict[str, pd.DataFrame]:
+        """
+        Weekly, monthly and yearly aggregates of the history, by frequency. The stored ones are brought up to
+        date with the history, the missing ones are computed on first use.
+        """
+        if self.__aggregates is None:
+            self.__aggregates = self._process_aggregates(self.closures, self.daily_returns, self.__stored_aggregates)
+        return self.__aggregates
+
+    @property
+    def drawdown(self) -> Union[DrawdownState, None]:
+        """
+        Drawdown at the last closure, None without closures. The stored one is brought up to date with the
+        closures after it, otherwise it is computed on first use.
+        """
+        if self.__drawdown is None:
+            self.__drawdown = self._process_drawdown(self.closures, self.__stored_drawdown)
+        return self.__drawdown
+
+    @property
+    def screen_metrics(self) -> dict[str, Union[float, None]]:
+        """
+        Metrics the symbols are screened by, computed on first use if they were not given.
+        """
+        if self.__screen_metrics is None:
+            self.__screen_metrics = screen_metrics(self.closures, self.daily_returns, self.drawdown)
+        return self.__screen_metrics
+
+    @staticmethod
+    def _process_drawdown(closures: pd.Series, drawdown: Union[dict, DrawdownState] = None) \
+            -> Union[DrawdownState, None]:
+        """
+        :param drawdown: (optional) stored drawdown state, as dict or DrawdownState.
+        """
+        if drawdown is not None:
+            drawdown = decode_drawdown_state(drawdown)
+            last_day = closures.index[-1:].values.astype('datetime64[D]').astype(np.int64)
+            # It does not belong to this history.
+            if not len(last_day) or drawdown.day > last_day[0]:
+                drawdown = None
+        return drawdown_state(closures, previous=drawdown)
 
     @staticmethod
-    def _process_historical_data(closures: dict, daily_returns: dict = None) -> tuple[pd.Series,
-                                                                                      Union[pd.Series, None]]:
+    def _process_aggregates(closures: pd.Series, daily_returns: pd.Series,
+                            aggregates: dict = None) -> dict[str, pd.DataFrame]:
         """
-        :param closures: closures of the symbol as dict
-        :param daily_returns: (optional) daily_returns of the symbol as dict, if None, would be computed.
+        :param aggregates: (optional) stored aggregates by frequency, encoded or as pd.DataFrame.
+        """
+        stored = decode_aggregates(aggregates) if aggregates is not None else {}
+        return {freq: (extend_aggregates(stored[freq], closures, daily_returns, freq) if freq in stored
+                       else aggregate_history(closures, daily_returns, freq))
+                for freq in AGGREGATED_FREQUENCIES}
+
+    @staticmethod
+    def _process_historical_data(closures: Union[dict, pd.Series],
+                                 daily_returns: Union[dict, pd.Series] = None) -> tuple[pd.Series,
+                                                                                        Union[pd.Series, None]]:
+        """
+        :param closures: closures of the symbol as dict, or as pd.Series if they are already decoded.
+        :param daily_returns: (optional) daily_returns of the symbol as dict or pd.Series, if None, would be computed.
         :return: historic data of the symbol with properly pd.Series
         """
+        if isinstance(closures, pd.Series):
+            if daily_returns is not None and not isinstance(daily_returns, pd.Series):
+                daily_returns = pd.Series(data=list(daily_returns.values()), index=closures.index, dtype='float64')
+            return closures, daily_returns
+
         try:
             indexes = tuple(datetime.strptime(i, '%Y-%m-%d %H:%M:%S').date() for i in tuple(closures.keys()))
         except ValueError:
@@ -53,16 +137,55 @@ class Index(Symbol):
 
 class Stock(Symbol):
     def __init__(self, ticker: str, isin: str, name: str, closures: dict, dividends: dict,
-                 exchange: str, daily_returns: dict = None):
-        super(Stock, self).__init__(ticker=ticker, name=name, closures=closures, daily_returns=daily_returns)
+                 exchange: str, daily_returns: dict = None, total_returns: dict = None, aggregates: dict = None,
+                 drawdown: dict = None, screen_metrics: dict = None):
+        super(Stock, self).__init__(ticker=ticker, name=name, closures=closures, daily_returns=daily_returns,
+                                    aggregates=aggregates, drawdown=drawdown, screen_metrics=screen_metrics)
         self.dividends = self._process_dividends_data(dividends)
+        self.total_returns = self._process_total_returns(self.closures, self.dividends, total_returns)
         self.isin = isin
         self.exchange = exchange
 
-    def _process_dividends_data(self, dividends: dict) -> pd.Series:
+    @staticmethod
+    def _process_total_returns(closures: pd.Series, dividends: pd.Series,
+                               total_returns: Union[dict, pd.Series] = None) -> pd.Series:
+        """
+        :param closures: decoded closures.
+        :param dividends: decoded sparse dividends.
+        :param total_returns: (optional) precomputed total returns as dict or pd.Series, if None, would be computed.
+        :return: daily returns with the dividends reinvested at the close of the day they are paid.
+        """
+        if total_returns is not None:
+            return Symbol._process_historical_data(closures, total_returns)[1]
+
+        income = np.zeros(len(closures))
+        positions = closures.index.get_indexer(dividends.index)
+        paid = positions >= 0
+        np.add.at(income, positions[paid], dividends.to_numpy(dtype=np.float64)[paid])
+        # Missing closures are filled forward, as pct_change does for the price returns.
+        values = closures.ffill().to_numpy(dtype=np.float64)
+        total_returns = np.full(len(values), np.nan)
+        total_returns[1:] = (values[1:] + income[1:]) / values[:-1] - 1
+        return pd.Series(total_returns, index=closures.index)
+
+    @staticmethod
+    def _process_dividends_data(dividends: Union[dict, pd.Series]) -> pd.Series:
         """
-        :param dividends: dict
-        :return: historic data of the symbol with properly pd.Series
+        :param dividends: dict by date, or pd.Series if they are already decoded. Either sparse or with a value
+        for every closure (0 when nothing was paid).
+        :return: the dividends paid as a sparse pd.Series, with only the dates of the payments.
+        """
+        if isinstance(dividends, pd.Series):
+            paid = dividends.notna() & (dividends != 0)
+            sparse = dividends if paid.all() else dividends[paid]
+        else:
+            # Zeros are dropped before parsing, the dense dicts hold a key per trading day.
+            paid = {k: v for k, v in dividends.items() if v and v == v}
+            sparse = pd.Series(data=list(paid.values()), index=pd.to_datetime(list(paid.keys())), dtype='float64')
+        return sparse if sparse.index.is_monotonic_increasing else sparse.sort_index()
+
+    def dense_dividends(self) -> pd.Series:
+        """
+        :return: the dividends aligned to the closures, 0 on the days nothing was paid.
         """
-        pd_dividends = pd.Series(data=dividends.values(), index=self.closures.index)
-        return pd_dividends
+        return self.dividends.reindex(self.closures.index, fill_value=0.0)
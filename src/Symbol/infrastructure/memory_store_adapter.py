@@ -0,0 +1,233 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Union, Literal
+
+import numpy as np
+import pandas as pd
+
+from src.Symbol.domain.symbol import Symbol, Stock, Index
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Utils.data_version import symbols_data_version
+from src.Utils.timing import timings
+
+
+class _StoredSymbol:
+    """
+    Compact copy of a symbol: trading days as int32 ordinals (days since 1970-01-01) and
+    the closures, daily returns and total returns as float64 or float32 arrays, the dividends as the days and
+    amounts of the payments.
+    """
+    __slots__ = ('info', 'days', 'closures', 'daily_returns', 'total_returns', 'dividends_days', 'dividends',
+                 'nbytes')
+
+    def __init__(self, symbol_data: dict, value_dtype: np.dtype):
+        closures, daily_returns = Symbol._process_historical_data(symbol_data['closures'],
+                                                                  symbol_data.get('daily_returns'))
+        if daily_returns is None:
+            daily_returns = closures.pct_change()
+        self.info = {key: symbol_data[key] for key in ('ticker', 'name', 'isin', 'exchange', 'drawdown')
+                     if key in symbol_data}
+        self.days = closures.index.values.astype('datetime64[D]').astype(np.int32)
+        self.closures = closures.to_numpy(dtype=value_dtype)
+        self.daily_returns = daily_returns.to_numpy(dtype=value_dtype)
+        self.total_returns = self.dividends_days = self.dividends = None
+        if symbol_data.get('dividends') is not None:
+            dividends = Stock._process_dividends_data(symbol_data['dividends'])
+            self.dividends_days = dividends.index.values.astype('datetime64[D]').astype(np.int32)
+            self.dividends = dividends.to_numpy(dtype=value_dtype)
+            total_returns = Stock._process_total_returns(closures, dividends, symbol_data.get('total_returns'))
+            self.total_returns = total_returns.to_numpy(dtype=value_dtype)
+
+        arrays = (self.days, self.closures, self.daily_returns, self.total_returns, self.dividends_days,
+                  self.dividends)
+        self.nbytes = (sys.getsizeof(self) + sys.getsizeof(self.info)
+                       + sum(sys.getsizeof(value) for value in self.info.values())
+                       + sum(sys.getsizeof(array) for array in arrays if array is not None))
+
+    def symbol(self) -> dict:
+        """
+        :return: the symbol as the repositories return it, the values are always served as float64.
+        """
+        dates = pd.DatetimeIndex(self.days.astype('datetime64[D]'))
+        ret = dict(self.info)
+        ret['closures'] = pd.Series(self.closures.astype(np.float64, copy=False), index=dates, copy=False)
+        ret['daily_returns'] = pd.Series(self.daily_returns.astype(np.float64, copy=False), index=dates, copy=False)
+        if self.total_returns is not None:
+            ret['total_returns'] = pd.Series(self.total_returns.astype(np.float64, copy=False), index=dates,
+                                             copy=False)
+        if self.dividends is not None:
+            ret['dividends'] = pd.Series(self.dividends.astype(np.float64, copy=False), copy=False,
+                                         index=pd.DatetimeIndex(self.dividends_days.astype('datetime64[D]')))
+        return ret
+
+
+class MemoryStoreRepositoryAdapter(RepositoryInterface):
+    """
+    Keeps the symbols read from the fallback repository in memory, in compact arrays, so they are
+    not fetched and decoded on every request.
+
+    The memory held by each symbol is accounted, once the total exceeds the budget the least recently
+    read symbols are evicted, they are read again from the fallback repository when needed.
+    The symbols are dropped as soon as their data version is bumped.
+    """
+    def __init__(self, fallback: RepositoryInterface, budget_bytes: int, float32: bool = False):
+        """
+        :param budget_bytes: memory the stored symbols can take.
+        :param float32: stores the values in single precision, halving their size at the cost
+        of ~7 significant digits.
+        """
+        self.fallback = fallback
+        self.budget_bytes = budget_bytes
+        self.value_dtype = np.dtype(np.float32 if float32 else np.float64)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__symbols = OrderedDict()
+        self.__nbytes = 0
+        self.__lock = threading.Lock()
+        symbols_data_version.subscribe(self.__on_data_version)
+
+    @property
+    def nbytes(self) -> int:
+        return self.__nbytes
+
+    def __len__(self) -> int:
+        return len(self.__symbols)
+
+    def symbols_nbytes(self) -> dict[str, int]:
+        """
+        :return: memory held by each stored symbol, by ticker.
+        """
+        with self.__lock:
+            return {ticker: stored.nbytes for ticker, stored in self.__symbols.items()}
+
+    @staticmethod
+    def estimate_nbytes(symbols: int, history_days: int, float32: bool = False,
+                        dividend_density: float = 0.01) -> int:
+        """
+        Estimates the memory needed to keep a whole universe, to size the budget.
+        :param symbols: symbols in the universe.
+        :param history_days: trading days of history per symbol.
+        :param dividend_density: fraction of the trading days paying a dividend.
+        """
+        value_size = 4 if float32 else 8
+        per_day = 4 + 3 * value_size + dividend_density * (4 + value_size)
+        # Array headers, symbol info and the bookkeeping of the entry.
+        per_symbol_overhead = 1024
+        return int(symbols * (history_days * per_day + per_symbol_overhead))
+
+    def save_stock(self, stock: Stock, fingerprint: str = None) -> None:
+        self.fallback.save_stock(stock, fingerprint=fingerprint)
+        self.__discard(stock.ticker)
+
+    def save_index(self, index: Index, fingerprint: str = None) -> None:
+        self.fallback.save_index(index, fingerprint=fingerprint)
+        self.__discard(index.ticker)
+
+    def get_symbol(self, ticker: str) -> Union[dict, bool]:
+        stored = self.__get(ticker)
+        if stored is not None:
+            return stored.symbol()
+
+        version = symbols_data_version.value
+        symbol_data = self.fallback.get_symbol(ticker)
+        if not symbol_data:
+            return symbol_data
+        return self.__store(symbol_data, version).symbol()
+
+    def get_symbols(self, tickers: tuple[str, ...]) -> Union[tuple[dict, ...], bool]:
+        stored = [self.__get(ticker) for ticker in tickers]
+        missing = tuple(ticker for ticker, symbol in zip(tickers, stored) if symbol is None)
+        symbols = [symbol.symbol() for symbol in stored if symbol is not None]
+        if missing:
+            version = symbols_data_version.value
+            symbols.extend(self.__store(symbol_data, version).symbol()
+                           for symbol_data in self.fallback.get_symbols(missing) or ())
+        if not symbols:
+            return False
+        return tuple(symbols)
+
+    def get_all_symbols(self, symbol_type: Literal['stock', 'index', 'all'] = 'all') -> tuple[dict, ...]:
+        # Reading the whole universe would evict every symbol in use, it is not stored.
+        return self.fallback.get_all_symbols(symbol_type=symbol_type)
+
+    def clean_old_symbols(self) -> tuple[str, ...]:
+        tickers = self.fallback.clean_old_symbols()
+        for ticker in tickers:
+            self.__discard(ticker)
+        return tickers
+
+    def get_fingerprints(self) -> dict[str, str]:
+        return self.fallback.get_fingerprints()
+
+    def touch_symbols(self, tickers: tuple[str, ...]) -> None:
+        self.fallback.touch_symbols(tickers)
+
+    def save_risk(self, risk: dict[str, dict]) -> None:
+        self.fallback.save_risk(risk)
+
+    def get_risk(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        # Small and rewritten apart from the symbols data, they are always read from the fallback.
+        return self.fallback.get_risk(tickers)
+
+    def get_screen_metrics(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        return self.fallback.get_screen_metrics(tickers)
+
+    def get_latest_returns(self, days: int, tickers: tuple[str, ...] = None,
+                           symbol_type: Literal['stock', 'index', 'all'] = 'all') -> dict[str, dict]:
+        # Read without the whole history, they are not stored.
+        return self.fallback.get_latest_returns(days, tickers=tickers, symbol_type=symbol_type)
+
+    def acquire_lease(self, name: str, owner: str, seconds: float) -> bool:
+        return self.fallback.acquire_lease(name, owner, seconds)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__symbols.clear()
+            self.__nbytes = 0
+
+    def __get(self, ticker: str) -> Union[_StoredSymbol, None]:
+        with self.__lock:
+            stored = self.__symbols.get(ticker)
+            if stored is None:
+                self.misses += 1
+                return None
+            self.__symbols.move_to_end(ticker)
+            self.hits += 1
+            return stored
+
+    def __store(self, symbol_data: dict, version: int) -> _StoredSymbol:
+        """
+        :param version: data version before reading the symbol, it is not stored if it has changed since.
+        """
+        with timings.span('memory_store.encode'):
+            stored = _StoredSymbol(symbol_data, self.value_dtype)
+        ticker = stored.info['ticker']
+        with self.__lock:
+            if symbols_data_version.value != version:
+                return stored
+            previous = self.__symbols.pop(ticker, None)
+            if previous is not None:
+                self.__nbytes -= previous.nbytes
+            if stored.nbytes > self.budget_bytes:
+                return stored
+            self.__symbols[ticker] = stored
+            self.__nbytes += stored.nbytes
+            while self.__nbytes > self.budget_bytes:
+                _, evicted = self.__symbols.popitem(last=False)
+                self.__nbytes -= evicted.nbytes
+                self.evictions += 1
+        return stored
+
+    def __discard(self, ticker: str):
+        with self.__lock:
+            stored = self.__symbols.pop(ticker, None)
+            if stored is not None:
+                self.__nbytes -= stored.nbytes
+
+    def __on_data_version(self, version: int, ticker: str):
+        if ticker is None:
+            self.clear()
+        else:
+            self.__discard(ticker)
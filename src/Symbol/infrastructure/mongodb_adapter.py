@@ -1,36 +1,60 @@
+import os
+import threading
 from datetime import datetime, timedelta
 from typing import Union, Literal
 
+import numpy as np
+import pandas as pd
 import ujson
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 
+from src.Symbol.domain.aggregates import encode_aggregates
+from src.Symbol.domain.risk import RISK_DAYS
 from src.Symbol.domain.symbol import Stock, Index
 from src.Symbol.domain.ports.repository_interface import RepositoryInterface
 from src.Utils.exceptions import RepositoryException
+from src.Utils.timing import timings
 from src import settings as st
 
 
 class MongoRepositoryAdapter(RepositoryInterface):
 
+    # Shared by every adapter, it is connected on first use so building an adapter does not block.
     __db_client = None
+    __connection_lock = threading.Lock()
+    # Databases whose indexes have been created by this process.
+    __indexed_databases = set()
 
-    def __init__(self):
+    def __init__(self, database: str = 'fincalcs'):
+        self.database = database
+
+    @property
+    def symbols_collection(self):
+        # Resolved on each access, so a client reset after a fork is picked up by every adapter.
+        self.__connect_to_db()
+        collection = self.__db_client[self.database]['symbols']
+        if self.database not in self.__indexed_databases:
+            # The cleanup reads a range of update dates.
+            collection.create_index("date")
+            self.__indexed_databases.add(self.database)
+        return collection
+
+    @property
+    def risk_collection(self):
+        self.__connect_to_db()
+        return self.__db_client[self.database]['risk']
+
+    @property
+    def leases_collection(self):
         self.__connect_to_db()
-        self.symbols_collection = self.__db_client['fincalcs']['symbols']
+        return self.__db_client[self.database]['leases']
 
-    def save_stock(self, stock: Stock):
+    def save_stock(self, stock: Stock, fingerprint: str = None):
         st.logger.info("Updating symbol {}".format(stock.ticker))
 
         doc_filter = {'_id': stock.ticker}
-        doc_values = {"$set": {"isin": stock.isin,
-                               "name": stock.name,
-                               "date": datetime.utcnow(),
-                               "closures": ujson.dumps(stock.closures.to_dict()),
-                               "dividends": ujson.dumps(stock.dividends.to_dict()),
-                               "daily_returns": ujson.dumps(stock.daily_returns.to_dict()),
-                               "exchange": stock.exchange,
-                               "type": "stock"}}
+        doc_values = {"$set": self._stock_document(stock, fingerprint)}
 
         try:
             self.symbols_collection.update_one(filter=doc_filter, update=doc_values, upsert=True)
@@ -41,15 +65,11 @@ class MongoRepositoryAdapter(RepositoryInterface):
         else:
             st.logger.info("Symbol {} updated".format(stock.ticker))
 
-    def save_index(self, index: Index):
+    def save_index(self, index: Index, fingerprint: str = None):
         st.logger.info("Updating index {}".format(index.ticker))
 
         doc_filter = {'_id': index.ticker}
-        doc_values = {"$set": {"name": index.name,
-                               "date": datetime.utcnow(),
-                               "closures": ujson.dumps(index.closures.to_dict()),
-                               "daily_returns": ujson.dumps(index.daily_returns.to_dict()),
-                               "type": "index"}}
+        doc_values = {"$set": self._index_document(index, fingerprint)}
 
         try:
             self.symbols_collection.update_one(filter=doc_filter, update=doc_values, upsert=True)
@@ -62,57 +82,27 @@ class MongoRepositoryAdapter(RepositoryInterface):
 
     def get_symbol(self, ticker: str) -> Union[dict, bool]:
         try:
-            data = self.symbols_collection.find_one({"_id": ticker})
+            with timings.span('mongo.read'):
+                data = self.symbols_collection.find_one({"_id": ticker})
         except PyMongoError as e:
             st.logger.exception(e)
             raise RepositoryException
         if data is None:
             return False
 
-        closures = ujson.loads(data['closures'])
-        ret = {'ticker': data['_id'], 'name': data['name'], 'closures': closures}
-
-        isin = data.get('isin')
-        if isin is not None:
-            ret['isin'] = isin
-        dividends = data.get('dividends')
-        if dividends is not None:
-            ret['dividends'] = ujson.loads(dividends)
-        daily_returns = data.get('daily_returns')
-        if daily_returns is not None:
-            ret['daily_returns'] = ujson.loads(daily_returns.replace("NaN","null"))
-        exchange = data.get('exchange')
-        if exchange is not None:
-            ret['exchange'] = exchange
-
-        return ret
+        with timings.span('repository.decode'):
+            return self._symbol_info(data)
 
     def get_symbols(self, tickers: tuple[str, ...]) -> Union[tuple[dict, ...], bool]:
         try:
-            data = self.symbols_collection.find({"_id": {"$in": tickers}})
+            with timings.span('mongo.read'):
+                data = list(self.symbols_collection.find({"_id": {"$in": tickers}}))
         except PyMongoError as e:
             st.logger.exception(e)
             raise RepositoryException
 
-        symbols = list()
-        for d in data:
-            closures = ujson.loads(d['closures'])
-            symbol_info = {'ticker': d['_id'], 'name': d['name'], 'closures': closures}
-
-            isin = d.get('isin')
-            if isin is not None:
-                symbol_info['isin'] = isin
-            dividends = d.get('dividends')
-            if dividends is not None:
-                symbol_info['dividends'] = ujson.loads(dividends)
-            daily_returns = d.get('daily_returns')
-            if daily_returns is not None:
-                symbol_info['daily_returns'] = ujson.loads(daily_returns.replace("NaN","null"))
-            exchange = d.get('exchange')
-            if exchange is not None:
-                symbol_info['exchange'] = exchange
-
-            symbols.append(symbol_info)
+        with timings.span('repository.decode'):
+            symbols = [self._symbol_info(d) for d in data]
 
         if not symbols:
             return False
@@ -122,65 +112,232 @@ class MongoRepositoryAdapter(RepositoryInterface):
     def get_all_symbols(self, symbol_type: Literal['stock', 'index', 'all'] = 'all') -> tuple[dict, ...]:
         query = {"type": symbol_type} if symbol_type != 'all' else {}
         try:
-            data = self.symbols_collection.find(query)
+            with timings.span('mongo.read'):
+                data = list(self.symbols_collection.find(query))
         except PyMongoError as e:
             st.logger.exception(e)
             raise RepositoryException
 
-        symbols = list()
-        for d in data:
-            symbol_info = {'ticker': d['_id'], 'name': d['name'], 'closures': ujson.loads(d['closures'])}
-
-            isin = d.get('isin')
-            if isin is not None:
-                symbol_info['isin'] = isin
-            dividends = d.get('dividends')
-            if dividends is not None:
-                symbol_info['dividends'] = ujson.loads(dividends)
-            daily_returns = d.get('daily_returns')
-            if daily_returns is not None:
-                symbol_info['daily_returns'] = ujson.loads(daily_returns.replace("NaN", "null"))
-            exchange = d.get('exchange')
-            if exchange is not None:
-                symbol_info['exchange'] = exchange
-
-            symbols.append(symbol_info)
+        with timings.span('repository.decode'):
+            return tuple(self._symbol_info(d) for d in data)
 
-        return tuple(symbols)
+    def clean_old_symbols(self) -> tuple[str, ...]:
+        date_limit = datetime.combine(datetime.utcnow().date() - timedelta(days=5), datetime.min.time())
+        # A range on the indexed update date, only the tickers are read, never the history payloads.
+        old_symbols = {"date": {"$lt": date_limit}}
+        try:
+            tickers = tuple(d['_id'] for d in self.symbols_collection.find(old_symbols, projection={"_id": 1}))
+            if not tickers:
+                return ()
+            st.logger.info("Cleaning symbols with tickers: {}".format(tickers))
+            # The symbols touched meanwhile are kept.
+            self.symbols_collection.delete_many(dict(old_symbols, _id={"$in": tickers}))
+            self.risk_collection.delete_many({"_id": {"$in": tickers}})
+        except PyMongoError as e:
+            st.logger.exception(e)
+            raise RepositoryException
+        return tickers
 
-    def clean_old_symbols(self) -> None:
+    def get_fingerprints(self) -> dict[str, str]:
         try:
-            data = self.symbols_collection.find({})
+            data = self.symbols_collection.find({"fingerprint": {"$ne": None}}, projection={"fingerprint": 1})
+            return {d['_id']: d['fingerprint'] for d in data}
         except PyMongoError as e:
             st.logger.exception(e)
             raise RepositoryException
 
-        date_limit = datetime.utcnow().date() - timedelta(days=5)
-        symbols_to_delete = []
-        for symbol in data:
-            if symbol['date'].date() < date_limit:
-                symbols_to_delete.append(symbol['ticker'])
+    def touch_symbols(self, tickers: tuple[str, ...]) -> None:
+        try:
+            self.symbols_collection.update_many({"_id": {"$in": tickers}}, {"$set": {"date": datetime.utcnow()}})
+        except PyMongoError as e:
+            st.logger.exception(e)
+            raise RepositoryException
 
-        if not symbols_to_delete:
+    def save_risk(self, risk: dict[str, dict]) -> None:
+        if not risk:
             return
         try:
-            st.logger("Cleaning symbols with tickers: {}".format(symbols_to_delete))
-            self.symbols_collection.delete_many({"_id": {"$in": symbols_to_delete}})
+            self.risk_collection.bulk_write([ReplaceOne({"_id": ticker}, dict(stock_risk, _id=ticker), upsert=True)
+                                             for ticker, stock_risk in risk.items()], ordered=False)
         except PyMongoError as e:
             st.logger.exception(e)
             raise RepositoryException
 
+    def get_risk(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        try:
+            data = self.risk_collection.find({"_id": {"$in": tickers}} if tickers is not None else {})
+            return {d.pop('_id'): d for d in data}
+        except PyMongoError as e:
+            st.logger.exception(e)
+            raise RepositoryException
+
+    def get_screen_metrics(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        try:
+            with timings.span('mongo.read'):
+                data = self.symbols_collection.find({"_id": {"$in": tickers}} if tickers is not None else {},
+                                                    projection={"type": 1, "screen": 1})
+                return {d['_id']: {'type': d['type'], 'metrics': d.get('screen')} for d in data}
+        except PyMongoError as e:
+            st.logger.exception(e)
+            raise RepositoryException
+
+    def get_latest_returns(self, days: int, tickers: tuple[str, ...] = None,
+                           symbol_type: Literal['stock', 'index', 'all'] = 'all') -> dict[str, dict]:
+        """
+        Up to RISK_DAYS are read from the latest returns stored along with the symbols, longer windows and
+        the symbols saved before they were stored are read from their whole daily returns.
+        """
+        query = {"type": symbol_type} if symbol_type != 'all' else {}
+        if tickers is not None:
+            query["_id"] = {"$in": tickers}
+        try:
+            with timings.span('mongo.read'):
+                data = list(self.symbols_collection.find(query, projection={"type": 1, "exchange": 1,
+                                                                            "latest_returns": 1}))
+                whole = tuple(d['_id'] for d in data if days > RISK_DAYS or d.get('latest_returns') is None)
+                daily_returns = {d['_id']: d.get('daily_returns') for d in self.symbols_collection.find(
+                    {"_id": {"$in": whole}}, projection={"daily_returns": 1})} if whole else {}
+        except PyMongoError as e:
+            st.logger.exception(e)
+            raise RepositoryException
+
+        with timings.span('repository.decode'):
+            latest_returns = {}
+            for d in data:
+                if d['_id'] in daily_returns:
+                    returns = self._decode_returns(daily_returns[d['_id']])
+                else:
+                    returns = pd.Series(np.array(d['latest_returns']['returns'], dtype=np.float64), copy=False,
+                                        index=pd.DatetimeIndex(np.array(d['latest_returns']['days'],
+                                                                        dtype='datetime64[D]')))
+                latest_returns[d['_id']] = {'type': d['type'], 'exchange': d.get('exchange'),
+                                            'daily_returns': returns.iloc[-days:]}
+            return latest_returns
+
+    def acquire_lease(self, name: str, owner: str, seconds: float) -> bool:
+        now = datetime.utcnow()
+        try:
+            # Only an expired lease or one of the owner matches, otherwise the upsert collides with the lease held.
+            lease = {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}
+            self.leases_collection.update_one({"_id": name, "$or": [{"expires_at": {"$lte": now}}, {"owner": owner}]},
+                                              {"$set": lease}, upsert=True)
+        except DuplicateKeyError:
+            return False
+        except PyMongoError as e:
+            st.logger.exception(e)
+            raise RepositoryException
+        return True
+
+    @staticmethod
+    def _stock_document(stock: Stock, fingerprint: str = None) -> dict:
+        return {"isin": stock.isin,
+                "name": stock.name,
+                "date": datetime.utcnow(),
+                "closures": ujson.dumps(stock.closures.to_dict()),
+                "dividends": ujson.dumps(stock.dividends.to_dict()),
+                "daily_returns": ujson.dumps(stock.daily_returns.to_dict()),
+                "total_returns": ujson.dumps(stock.total_returns.to_dict()),
+                "aggregates": ujson.dumps(encode_aggregates(stock.aggregates)),
+                "drawdown": stock.drawdown.to_dict() if stock.drawdown is not None else None,
+                "screen": stock.screen_metrics,
+                "latest_returns": MongoRepositoryAdapter._latest_returns(stock),
+                "exchange": stock.exchange,
+                "fingerprint": fingerprint,
+                "type": "stock"}
+
+    @staticmethod
+    def _index_document(index: Index, fingerprint: str = None) -> dict:
+        return {"name": index.name,
+                "date": datetime.utcnow(),
+                "closures": ujson.dumps(index.closures.to_dict()),
+                "daily_returns": ujson.dumps(index.daily_returns.to_dict()),
+                "aggregates": ujson.dumps(encode_aggregates(index.aggregates)),
+                "drawdown": index.drawdown.to_dict() if index.drawdown is not None else None,
+                "screen": index.screen_metrics,
+                "latest_returns": MongoRepositoryAdapter._latest_returns(index),
+                "fingerprint": fingerprint,
+                "type": "index"}
+
+    @staticmethod
+    def _latest_returns(symbol: Union[Stock, Index]) -> dict:
+        """
+        The last RISK_DAYS daily returns, stored as arrays so they are read without decoding the whole history.
+        """
+        daily_returns = symbol.daily_returns.iloc[-RISK_DAYS:]
+        return {"days": daily_returns.index.values.astype('datetime64[D]').astype(np.int64).tolist(),
+                "returns": daily_returns.to_numpy(dtype=np.float64).tolist()}
+
+    @staticmethod
+    def _decode_returns(daily_returns: Union[str, None]) -> pd.Series:
+        """
+        :return: the stored daily returns as pd.Series, empty if the symbol was saved without them.
+        """
+        if daily_returns is None:
+            return pd.Series(dtype='float64')
+        daily_returns = ujson.loads(daily_returns.replace("NaN", "null"))
+        return pd.Series(np.array(list(daily_returns.values()), dtype=np.float64), copy=False,
+                         index=pd.to_datetime(list(daily_returns.keys())))
+
+    @staticmethod
+    def _symbol_info(document: dict) -> dict:
+        """
+        Decodes a stored symbol document.
+        """
+        symbol_info = {'ticker': document['_id'], 'name': document['name'],
+                       'closures': ujson.loads(document['closures'])}
+
+        isin = document.get('isin')
+        if isin is not None:
+            symbol_info['isin'] = isin
+        dividends = document.get('dividends')
+        if dividends is not None:
+            symbol_info['dividends'] = ujson.loads(dividends)
+        daily_returns = document.get('daily_returns')
+        if daily_returns is not None:
+            symbol_info['daily_returns'] = ujson.loads(daily_returns.replace("NaN", "null"))
+        total_returns = document.get('total_returns')
+        if total_returns is not None:
+            symbol_info['total_returns'] = ujson.loads(total_returns.replace("NaN", "null"))
+        aggregates = document.get('aggregates')
+        if aggregates is not None:
+            # Kept encoded, the entities decode them only if they are used.
+            symbol_info['aggregates'] = aggregates
+        drawdown = document.get('drawdown')
+        if drawdown is not None:
+            symbol_info['drawdown'] = drawdown
+        exchange = document.get('exchange')
+        if exchange is not None:
+            symbol_info['exchange'] = exchange
+
+        return symbol_info
+
     @classmethod
     def __connect_to_db(cls):
         """
         Singleton method to initialize mongo database object
         """
-        if cls.__db_client is None:
+        if cls.__db_client is not None:
+            return
+        with cls.__connection_lock:
+            if cls.__db_client is not None:
+                return
             try:
                 st.logger.info("Connecting to mongodb database.")
-                cls.__db_client = MongoClient(f'mongodb://{st.MONGO_HOST}:{st.MONGO_PORT}/', connect=False)
+                db_client = MongoClient(f'mongodb://{st.MONGO_HOST}:{st.MONGO_PORT}/', connect=False)
                 # Forces a connection status check
-                cls.__db_client.server_info()
+                db_client.server_info()
             except PyMongoError as e:
                 st.logger.exception(e)
                 raise RepositoryException()
+            cls.__db_client = db_client
+
+    @classmethod
+    def _reset_connection(cls):
+        """
+        Drops the client inherited from the parent process, MongoClient is not fork-safe.
+        """
+        cls.__db_client = None
+        cls.__connection_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=MongoRepositoryAdapter._reset_connection)
@@ -0,0 +1,13 @@
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Symbol.infrastructure.mongodb_adapter import MongoRepositoryAdapter
+from src.Symbol.infrastructure.sqlite_adapter import SqliteRepositoryAdapter
+from src import settings as st
+
+
+def create_repository() -> RepositoryInterface:
+    """
+    :return: an adapter of the repository selected by REPOSITORY_BACKEND.
+    """
+    if st.REPOSITORY_BACKEND == 'sqlite':
+        return SqliteRepositoryAdapter(path=st.SQLITE_PATH)
+    return MongoRepositoryAdapter()
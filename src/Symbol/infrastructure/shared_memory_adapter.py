@@ -0,0 +1,513 @@
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Union, Literal
+
+import numpy as np
+import pandas as pd
+import ujson
+
+from src.Symbol.domain.symbol import Symbol, Stock, Index
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Utils.data_version import symbols_data_version
+from src.Utils.exceptions import RepositoryException
+from src import settings as st
+
+# sequence, generation, name of the data segment. The sequence is odd while the control is being written.
+_CONTROL_FORMAT = '<QQ64s'
+_CONTROL_SIZE = struct.calcsize(_CONTROL_FORMAT)
+# length of the json index, number of points and of dividends of all the symbols.
+_HEADER_FORMAT = '<QQQ'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+
+def _control_segment_name() -> str:
+    return '{}_control'.format(st.SHM_NAMESPACE)
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+# Entries of the index locating the blocks of a symbol in a generation.
+_BLOCK_OFFSETS = ('start', 'length', 'dividends_start', 'dividends_length')
+
+
+class _Generation:
+    """
+    Read-only view of a published generation.
+
+    Layout: header | json index | days (int32) | closures (float64) | daily_returns (float64)
+            | total_returns (float64, NaN for the indexes) | dividends days (int32) | dividends (float64)
+    The json index holds the symbols and, by generation, the tickers changed since the previous one
+    for the last generations published.
+    """
+    def __init__(self, generation: int, segment: shared_memory.SharedMemory):
+        self.generation = generation
+        self.segment = segment
+        index_length, total, total_dividends = struct.unpack_from(_HEADER_FORMAT, segment.buf, 0)
+        index = ujson.loads(bytes(segment.buf[_HEADER_SIZE:_HEADER_SIZE + index_length]))
+        self.index = index['symbols']
+        self.changes = {int(generation): tickers for generation, tickers in index['changes'].items()}
+
+        offset = _align(_HEADER_SIZE + index_length)
+        self.days = np.ndarray((total,), dtype=np.int32, buffer=segment.buf, offset=offset)
+        offset = _align(offset + self.days.nbytes)
+        self.closures = np.ndarray((total,), dtype=np.float64, buffer=segment.buf, offset=offset)
+        offset += self.closures.nbytes
+        self.daily_returns = np.ndarray((total,), dtype=np.float64, buffer=segment.buf, offset=offset)
+        offset += self.daily_returns.nbytes
+        self.total_returns = np.ndarray((total,), dtype=np.float64, buffer=segment.buf, offset=offset)
+        offset += self.total_returns.nbytes
+        self.dividends_days = np.ndarray((total_dividends,), dtype=np.int32, buffer=segment.buf, offset=offset)
+        offset = _align(offset + self.dividends_days.nbytes)
+        self.dividends = np.ndarray((total_dividends,), dtype=np.float64, buffer=segment.buf, offset=offset)
+        for array in (self.days, self.closures, self.daily_returns, self.total_returns, self.dividends_days,
+                      self.dividends):
+            array.flags.writeable = False
+
+    def symbol(self, ticker: str) -> Union[dict, None]:
+        info = self.index.get(ticker)
+        if info is None:
+            return None
+
+        window = slice(info['start'], info['start'] + info['length'])
+        dates = pd.DatetimeIndex(self.days[window].astype('datetime64[D]'))
+        ret = {'ticker': ticker, 'name': info['name'],
+               'closures': pd.Series(self.closures[window], index=dates, copy=False),
+               'daily_returns': pd.Series(self.daily_returns[window], index=dates, copy=False)}
+        if info['type'] == 'stock':
+            ret['total_returns'] = pd.Series(self.total_returns[window], index=dates, copy=False)
+            window = slice(info['dividends_start'], info['dividends_start'] + info['dividends_length'])
+            ret['dividends'] = pd.Series(self.dividends[window], copy=False,
+                                         index=pd.DatetimeIndex(self.dividends_days[window].astype('datetime64[D]')))
+            ret['isin'] = info['isin']
+            ret['exchange'] = info['exchange']
+        return ret
+
+    def block(self, ticker: str) -> tuple:
+        """
+        :return: the info of the symbol without its offsets, and views of its days, closures, daily returns,
+        total returns, dividends days and dividends, to be copied into the next generation.
+        """
+        info = self.index[ticker]
+        window = slice(info['start'], info['start'] + info['length'])
+        dividends_window = slice(info.get('dividends_start', 0),
+                                 info.get('dividends_start', 0) + info.get('dividends_length', 0))
+        return ({key: value for key, value in info.items() if key not in _BLOCK_OFFSETS}, self.days[window],
+                self.closures[window], self.daily_returns[window], self.total_returns[window],
+                self.dividends_days[dividends_window], self.dividends[dividends_window])
+
+    def latest_returns(self, ticker: str, days: int) -> Union[dict, None]:
+        info = self.index.get(ticker)
+        if info is None:
+            return None
+
+        end = info['start'] + info['length']
+        window = slice(max(info['start'], end - days), end)
+        return {'type': info['type'], 'exchange': info.get('exchange'),
+                'daily_returns': pd.Series(self.daily_returns[window], copy=False,
+                                           index=pd.DatetimeIndex(self.days[window].astype('datetime64[D]')))}
+
+    def changed_since(self, generation: Union[int, None]) -> Union[set[str], None]:
+        """
+        :return: the tickers changed since the generation, None if they are not known (every symbol may have).
+        """
+        if generation is None:
+            return None
+        changed = set()
+        for published in range(generation + 1, self.generation + 1):
+            tickers = self.changes.get(published)
+            if tickers is None:
+                return None
+            changed.update(tickers)
+        return changed
+
+    def drop_views(self) -> None:
+        """
+        Drops the arrays over the segment, it can only be closed once no view of it is left.
+        """
+        self.days = self.closures = self.daily_returns = self.total_returns = None
+        self.dividends_days = self.dividends = None
+
+    def release(self) -> bool:
+        """
+        :return: True if the segment could be closed, False if there are still views in use.
+        """
+        self.drop_views()
+        try:
+            self.segment.close()
+        except BufferError:
+            return False
+        return True
+
+
+class SharedMemoryPublisher:
+    """
+    Publishes the decoded symbols of the repository into shared memory, so every api worker
+    maps the same data read-only instead of keeping its own copy.
+
+    Each publication is a new generation in its own segment, the control segment is switched
+    to it once it is complete, so readers never see a generation half written. Only the symbols changed since
+    the previous generation are read from the repository, the blocks of the rest are copied from it.
+    """
+    def __init__(self, repository: RepositoryInterface):
+        self.repository = repository
+        self.__control = self.__create_control_segment()
+        self.__generation = 0
+        self.__published_version = None
+        self.__current = None
+        self.__retired = []
+        self.__running = False
+        self.__thread = None
+        # Tickers changed since the last generation (None if every symbol may have) and those of the last ones.
+        self.__changed = None
+        self.__changes = {}
+        self.__lock = threading.Lock()
+        symbols_data_version.subscribe(self.__on_data_version)
+
+    def start(self) -> None:
+        """
+        Starts publishing a new generation each time the symbols data changes.
+        """
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__running = False
+        for segment, _ in self.__retired:
+            self.__unlink(segment)
+        self.__retired = []
+        if self.__current is not None:
+            self.__unlink(self.__current)
+            self.__current = None
+        self.__unlink(self.__control)
+
+    def publish(self) -> int:
+        """
+        Packs all the symbols into a new generation and makes it the current one. Every symbol is read from the
+        repository for the first generation, or when the changed symbols are not known.
+        :return: the published generation.
+        """
+        version = symbols_data_version.value
+        with self.__lock:
+            changed, self.__changed = self.__changed, set()
+        changes = dict(self.__changes)
+        changes[self.__generation + 1] = sorted(changed) if changed is not None else None
+        changes = {generation: tickers for generation, tickers in changes.items()
+                   if generation > self.__generation + 1 - st.SHM_CHANGES_HISTORY}
+        previous = _Generation(self.__generation, self.__current) \
+            if self.__current is not None and changed is not None else None
+        try:
+            segment = self.__pack(self.__blocks(previous, changed), changes)
+        except RepositoryException as e:
+            # Published with the next generation.
+            with self.__lock:
+                if changed is None or self.__changed is None:
+                    self.__changed = None
+                else:
+                    self.__changed |= changed
+            raise e
+        finally:
+            if previous is not None:
+                previous.drop_views()
+        self.__generation += 1
+        self.__changes = changes
+
+        struct.pack_into('<Q', self.__control.buf, 0, 2 * self.__generation - 1)
+        struct.pack_into(_CONTROL_FORMAT, self.__control.buf, 0, 2 * self.__generation - 1,
+                         self.__generation, segment.name.encode())
+        struct.pack_into('<Q', self.__control.buf, 0, 2 * self.__generation)
+
+        if self.__current is not None:
+            self.__retired.append((self.__current, time.monotonic() + st.SHM_GENERATION_GRACE))
+        self.__current = segment
+        self.__published_version = version
+        st.logger.info("Symbols data generation {} published in shared memory".format(self.__generation))
+        return self.__generation
+
+    def __run(self):
+        while self.__running:
+            if symbols_data_version.value != self.__published_version:
+                try:
+                    self.publish()
+                except RepositoryException as e:
+                    st.logger.exception(e)
+            self.__retire_old_generations()
+            time.sleep(st.SHM_PUBLISH_INTERVAL)
+
+    def __on_data_version(self, version: int, ticker: str):
+        with self.__lock:
+            if ticker is None:
+                self.__changed = None
+            elif self.__changed is not None:
+                self.__changed.add(ticker)
+
+    def __retire_old_generations(self):
+        now = time.monotonic()
+        retired = []
+        for segment, unlink_at in self.__retired:
+            if unlink_at <= now:
+                self.__unlink(segment)
+            else:
+                retired.append((segment, unlink_at))
+        self.__retired = retired
+
+    def __blocks(self, previous: Union[_Generation, None], changed: Union[set[str], None]) -> dict[str, tuple]:
+        """
+        :param previous: generation the unchanged symbols are copied from, None to read every symbol.
+        :return: by ticker, the block of the symbol, as _Generation.block returns it.
+        """
+        if previous is None:
+            return {data['ticker']: self.__block(data) for data in self.repository.get_all_symbols(symbol_type='all')}
+
+        updated = {data['ticker']: data for data in self.repository.get_symbols(tuple(changed)) or ()} \
+            if changed else {}
+        blocks = {}
+        for ticker in previous.index:
+            # The changed symbols not found have been deleted.
+            if ticker in updated:
+                blocks[ticker] = self.__block(updated.pop(ticker))
+            elif ticker not in changed:
+                blocks[ticker] = previous.block(ticker)
+        blocks.update((ticker, self.__block(data)) for ticker, data in updated.items())
+        return blocks
+
+    @staticmethod
+    def __block(data: dict) -> tuple:
+        """
+        Decodes a symbol read from the repository into its block.
+        """
+        closures, daily_returns = Symbol._process_historical_data(data['closures'], data.get('daily_returns'))
+        if daily_returns is None:
+            daily_returns = closures.pct_change()
+        info = {'name': data['name'], 'type': 'stock' if data.get('dividends') is not None else 'index'}
+        total_returns = np.full(len(closures), np.nan)
+        dividends_days, dividends = np.empty(0, dtype=np.int32), np.empty(0)
+        if info['type'] == 'stock':
+            stock_dividends = Stock._process_dividends_data(data['dividends'])
+            total_returns = Stock._process_total_returns(closures, stock_dividends, data.get('total_returns'))
+            total_returns = total_returns.to_numpy(dtype=np.float64)
+            dividends_days = stock_dividends.index.values.astype('datetime64[D]').astype(np.int32)
+            dividends = stock_dividends.to_numpy(dtype=np.float64)
+            info.update(isin=data.get('isin'), exchange=data.get('exchange'))
+        return (info, closures.index.values.astype('datetime64[D]').astype(np.int32),
+                closures.to_numpy(dtype=np.float64), daily_returns.to_numpy(dtype=np.float64), total_returns,
+                dividends_days, dividends)
+
+    def __pack(self, blocks: dict[str, tuple], changes: dict[int, Union[list[str], None]]) \
+            -> shared_memory.SharedMemory:
+        index = {}
+        columns = []
+        dividends_columns = []
+        total = total_dividends = 0
+        for ticker, (info, days, closures, daily_returns, total_returns, dividends_days, dividends) in blocks.items():
+            info = dict(info, start=total, length=len(days))
+            if info['type'] == 'stock':
+                info.update(dividends_start=total_dividends, dividends_length=len(dividends_days))
+                dividends_columns.append((dividends_days, dividends))
+                total_dividends += len(dividends_days)
+            columns.append((days, closures, daily_returns, total_returns))
+            index[ticker] = info
+            total += len(days)
+
+        index_bytes = ujson.dumps({'symbols': index, 'changes': changes}).encode()
+        days_offset = _align(_HEADER_SIZE + len(index_bytes))
+        values_offset = _align(days_offset + 4 * total)
+        dividends_days_offset = values_offset + 3 * 8 * total
+        dividends_offset = _align(dividends_days_offset + 4 * total_dividends)
+        size = max(dividends_offset + 8 * total_dividends, 1)
+
+        name = '{}_{}_{}'.format(st.SHM_NAMESPACE, os.getpid(), self.__generation + 1)
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        struct.pack_into(_HEADER_FORMAT, segment.buf, 0, len(index_bytes), total, total_dividends)
+        segment.buf[_HEADER_SIZE:_HEADER_SIZE + len(index_bytes)] = index_bytes
+
+        days = np.ndarray((total,), dtype=np.int32, buffer=segment.buf, offset=days_offset)
+        values = np.ndarray((3, total), dtype=np.float64, buffer=segment.buf, offset=values_offset)
+        position = 0
+        for symbol_days, closures, daily_returns, total_returns in columns:
+            window = slice(position, position + len(symbol_days))
+            days[window] = symbol_days
+            values[0, window] = closures
+            values[1, window] = daily_returns
+            values[2, window] = total_returns
+            position += len(symbol_days)
+
+        dividends_days = np.ndarray((total_dividends,), dtype=np.int32, buffer=segment.buf,
+                                    offset=dividends_days_offset)
+        dividends = np.ndarray((total_dividends,), dtype=np.float64, buffer=segment.buf, offset=dividends_offset)
+        position = 0
+        for symbol_dividends_days, symbol_dividends in dividends_columns:
+            window = slice(position, position + len(symbol_dividends_days))
+            dividends_days[window] = symbol_dividends_days
+            dividends[window] = symbol_dividends
+            position += len(symbol_dividends_days)
+        del days, values, dividends_days, dividends
+        return segment
+
+    @staticmethod
+    def __create_control_segment() -> shared_memory.SharedMemory:
+        try:
+            stale = shared_memory.SharedMemory(name=_control_segment_name())
+        except FileNotFoundError:
+            pass
+        else:
+            stale.close()
+            stale.unlink()
+        control = shared_memory.SharedMemory(name=_control_segment_name(), create=True, size=_CONTROL_SIZE)
+        struct.pack_into(_CONTROL_FORMAT, control.buf, 0, 0, 0, b'')
+        return control
+
+    @staticmethod
+    def __unlink(segment: shared_memory.SharedMemory):
+        try:
+            segment.close()
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemoryRepositoryAdapter(RepositoryInterface):
+    """
+    Serves the symbols from the current shared memory generation, the rest of the operations
+    and the symbols not published yet are delegated to the fallback repository.
+
+    Meant to be used from processes forked by the publisher's process, so they share its resource tracker.
+    """
+    def __init__(self, fallback: RepositoryInterface):
+        self.fallback = fallback
+        self.__control = None
+        self.__current = None
+        self.__retired = []
+        self.__lock = threading.Lock()
+
+    def save_stock(self, stock: Stock, fingerprint: str = None) -> None:
+        self.fallback.save_stock(stock, fingerprint=fingerprint)
+
+    def save_index(self, index: Index, fingerprint: str = None) -> None:
+        self.fallback.save_index(index, fingerprint=fingerprint)
+
+    def get_symbol(self, ticker: str) -> Union[dict, bool]:
+        generation = self.__current_generation()
+        symbol = generation.symbol(ticker) if generation is not None else None
+        if symbol is None:
+            return self.fallback.get_symbol(ticker)
+        return symbol
+
+    def get_symbols(self, tickers: tuple[str, ...]) -> Union[tuple[dict, ...], bool]:
+        generation = self.__current_generation()
+        if generation is None:
+            return self.fallback.get_symbols(tickers)
+
+        symbols = [generation.symbol(ticker) for ticker in tickers]
+        missing = tuple(ticker for ticker, symbol in zip(tickers, symbols) if symbol is None)
+        symbols = [symbol for symbol in symbols if symbol is not None]
+        if missing:
+            symbols.extend(self.fallback.get_symbols(missing) or ())
+        if not symbols:
+            return False
+        return tuple(symbols)
+
+    def get_all_symbols(self, symbol_type: Literal['stock', 'index', 'all'] = 'all') -> tuple[dict, ...]:
+        generation = self.__current_generation()
+        if generation is None:
+            return self.fallback.get_all_symbols(symbol_type=symbol_type)
+        return tuple(generation.symbol(ticker) for ticker, info in generation.index.items()
+                     if symbol_type == 'all' or info['type'] == symbol_type)
+
+    def clean_old_symbols(self) -> tuple[str, ...]:
+        return self.fallback.clean_old_symbols()
+
+    def get_fingerprints(self) -> dict[str, str]:
+        return self.fallback.get_fingerprints()
+
+    def touch_symbols(self, tickers: tuple[str, ...]) -> None:
+        self.fallback.touch_symbols(tickers)
+
+    def save_risk(self, risk: dict[str, dict]) -> None:
+        self.fallback.save_risk(risk)
+
+    def get_risk(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        # Small and rewritten apart from the symbols data, they are always read from the fallback.
+        return self.fallback.get_risk(tickers)
+
+    def get_screen_metrics(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        return self.fallback.get_screen_metrics(tickers)
+
+    def get_latest_returns(self, days: int, tickers: tuple[str, ...] = None,
+                           symbol_type: Literal['stock', 'index', 'all'] = 'all') -> dict[str, dict]:
+        generation = self.__current_generation()
+        if generation is None:
+            return self.fallback.get_latest_returns(days, tickers=tickers, symbol_type=symbol_type)
+
+        if tickers is None:
+            tickers = tuple(ticker for ticker, info in generation.index.items()
+                            if symbol_type == 'all' or info['type'] == symbol_type)
+        latest_returns = {ticker: generation.latest_returns(ticker, days) for ticker in tickers}
+        missing = tuple(ticker for ticker, returns in latest_returns.items() if returns is None)
+        latest_returns = {ticker: returns for ticker, returns in latest_returns.items()
+                          if returns is not None and (symbol_type == 'all' or returns['type'] == symbol_type)}
+        if missing:
+            latest_returns.update(self.fallback.get_latest_returns(days, tickers=missing, symbol_type=symbol_type))
+        return latest_returns
+
+    def acquire_lease(self, name: str, owner: str, seconds: float) -> bool:
+        return self.fallback.acquire_lease(name, owner, seconds)
+
+    def refresh(self) -> None:
+        """
+        Attaches the latest generation, if there is a new one the local data version is bumped for each symbol
+        changed since the previous one, so the data derived from them is discarded. If they are not known,
+        after the first generation or many skipped ones, it is bumped once for every symbol.
+        """
+        previous = self.__current
+        current = self.__current_generation()
+        if current is previous:
+            return
+        changed = current.changed_since(previous.generation if previous is not None else None)
+        if changed is None:
+            symbols_data_version.bump()
+        else:
+            for ticker in changed:
+                symbols_data_version.bump(ticker)
+
+    def __current_generation(self) -> Union[_Generation, None]:
+        with self.__lock:
+            control = self.__read_control()
+            if control is None:
+                return None
+            generation, name = control
+            if self.__current is None or self.__current.generation != generation:
+                try:
+                    segment = shared_memory.SharedMemory(name=name)
+                except FileNotFoundError:
+                    return self.__current
+                # The generation being replaced may still be in use by other request threads,
+                # it is released on the next switch.
+                self.__retired = [retired for retired in self.__retired if not retired.release()]
+                if self.__current is not None:
+                    self.__retired.append(self.__current)
+                self.__current = _Generation(generation, segment)
+            return self.__current
+
+    def __read_control(self) -> Union[tuple[int, str], None]:
+        if self.__control is None:
+            try:
+                self.__control = shared_memory.SharedMemory(name=_control_segment_name())
+            except FileNotFoundError:
+                return None
+
+        while True:
+            sequence, generation, name = struct.unpack_from(_CONTROL_FORMAT, self.__control.buf, 0)
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            if struct.unpack_from('<Q', self.__control.buf, 0)[0] == sequence:
+                break
+        if generation == 0:
+            return None
+        return generation, name.rstrip(b'\0').decode()
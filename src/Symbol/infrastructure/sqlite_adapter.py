@@ -0,0 +1,419 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Union, Literal
+
+import numpy as np
+import pandas as pd
+
+from src.Symbol.domain.aggregates import AGGREGATES_COLUMNS
+from src.Symbol.domain.drawdowns import DRAWDOWN_STATE_FIELDS
+from src.Symbol.domain.risk import RISK_METRICS
+from src.Symbol.domain.screener import SCREEN_METRICS
+from src.Symbol.domain.symbol import Symbol, Stock, Index
+from src.Symbol.domain.ports.repository_interface import RepositoryInterface
+from src.Utils.exceptions import RepositoryException
+from src.Utils.timing import timings
+from src import settings as st
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS symbols (
+        ticker TEXT PRIMARY KEY,
+        type TEXT NOT NULL,
+        name TEXT,
+        isin TEXT,
+        exchange TEXT,
+        fingerprint TEXT,
+        date REAL NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS symbols_date ON symbols (date)",
+    # day: days since 1970-01-01. The primary key keeps the history of each symbol sorted and contiguous.
+    """CREATE TABLE IF NOT EXISTS history (
+        ticker TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        close REAL,
+        daily_return REAL,
+        total_return REAL,
+        PRIMARY KEY (ticker, day)) WITHOUT ROWID""",
+    # Only the days with a payment.
+    """CREATE TABLE IF NOT EXISTS dividends (
+        ticker TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (ticker, day)) WITHOUT ROWID""",
+    # Weekly, monthly and yearly aggregates, day: last day of the period.
+    """CREATE TABLE IF NOT EXISTS aggregates (
+        ticker TEXT NOT NULL,
+        freq TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        close REAL,
+        period_return REAL,
+        volatility REAL,
+        PRIMARY KEY (ticker, freq, day)) WITHOUT ROWID""",
+    # Drawdown at the last closure, days since 1970-01-01.
+    """CREATE TABLE IF NOT EXISTS drawdowns (
+        ticker TEXT PRIMARY KEY,
+        day INTEGER NOT NULL,
+        close REAL NOT NULL,
+        peak_day INTEGER NOT NULL,
+        peak REAL NOT NULL,
+        trough_day INTEGER NOT NULL,
+        trough REAL NOT NULL,
+        max_drawdown REAL NOT NULL)""",
+    # Screen metrics, NULL where there is not enough history.
+    """CREATE TABLE IF NOT EXISTS screen (
+        ticker TEXT PRIMARY KEY,
+        {})""".format(',\n        '.join('{} REAL'.format(metric) for metric in SCREEN_METRICS)),
+    # Risk against the benchmark of the stock, one row per rolling window, day: last day of the windows.
+    """CREATE TABLE IF NOT EXISTS risk (
+        ticker TEXT NOT NULL,
+        window TEXT NOT NULL,
+        benchmark TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        beta REAL,
+        alpha REAL,
+        tracking_error REAL,
+        information_ratio REAL,
+        PRIMARY KEY (ticker, window)) WITHOUT ROWID""",
+    # Leases of the jobs run by a single process, expires_at: unix time.
+    """CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL)""",
+)
+_SYMBOL_COLUMNS = 'ticker, type, name, isin, exchange'
+_EPOCH = date(1970, 1, 1)
+
+
+class SqliteRepositoryAdapter(RepositoryInterface):
+    """
+    Embedded repository, for single node deployments and CI, without any external service.
+
+    The symbols info is kept in one table and their history and dividends in others keyed by (ticker, day),
+    so the history is written with a single executemany and a date window is an indexed range query.
+    The database is opened in WAL mode, so the api reads while the ingestion writes.
+    """
+    def __init__(self, path: str = None):
+        """
+        :param path: database file, ':memory:' is not supported as every thread opens its own connection.
+        """
+        self.path = path or st.SQLITE_PATH
+        self.__local = threading.local()
+        try:
+            connection = self.__connection()
+            with connection:
+                for statement in _SCHEMA:
+                    connection.execute(statement)
+                # Databases created before the total returns were stored.
+                if 'total_return' not in {row[1] for row in connection.execute('PRAGMA table_info(history)')}:
+                    connection.execute('ALTER TABLE history ADD COLUMN total_return REAL')
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException()
+
+    def save_stock(self, stock: Stock, fingerprint: str = None) -> None:
+        st.logger.info("Updating symbol {}".format(stock.ticker))
+        self.__save(stock, 'stock', fingerprint, isin=stock.isin, exchange=stock.exchange, dividends=stock.dividends)
+        st.logger.info("Symbol {} updated".format(stock.ticker))
+
+    def save_index(self, index: Index, fingerprint: str = None) -> None:
+        st.logger.info("Updating index {}".format(index.ticker))
+        self.__save(index, 'index', fingerprint)
+        st.logger.info("Index {} updated".format(index.ticker))
+
+    def get_symbol(self, ticker: str, initial_date: date = None, end_date: date = None) -> Union[dict, bool]:
+        """
+        :param initial_date: (optional) first day of the history to read.
+        :param end_date: (optional) last day of the history to read.
+        """
+        symbols = self.get_symbols((ticker,), initial_date=initial_date, end_date=end_date)
+        return symbols[0] if symbols else False
+
+    def get_symbols(self, tickers: tuple[str, ...], initial_date: date = None,
+                    end_date: date = None) -> Union[tuple[dict, ...], bool]:
+        """
+        :param initial_date: (optional) first day of the history to read.
+        :param end_date: (optional) last day of the history to read.
+        """
+        tickers = tuple(tickers)
+        if not tickers:
+            return False
+        symbols = self.__read_symbols('SELECT {} FROM symbols WHERE ticker IN ({})'.format(
+            _SYMBOL_COLUMNS, ', '.join('?' * len(tickers))), tickers, initial_date, end_date)
+        return symbols if symbols else False
+
+    def get_all_symbols(self, symbol_type: Literal['stock', 'index', 'all'] = 'all') -> tuple[dict, ...]:
+        if symbol_type == 'all':
+            return self.__read_symbols('SELECT {} FROM symbols'.format(_SYMBOL_COLUMNS), ())
+        return self.__read_symbols('SELECT {} FROM symbols WHERE type = ?'.format(_SYMBOL_COLUMNS), (symbol_type,))
+
+    def clean_old_symbols(self) -> tuple[str, ...]:
+        date_limit = datetime.combine(datetime.utcnow().date() - timedelta(days=5), datetime.min.time())
+        try:
+            connection = self.__connection()
+            with connection:
+                tickers = tuple(row[0] for row in connection.execute('SELECT ticker FROM symbols WHERE date < ?',
+                                                                     (date_limit.timestamp(),)))
+                if not tickers:
+                    return ()
+                st.logger.info("Cleaning symbols with tickers: {}".format(tickers))
+                connection.executemany('DELETE FROM history WHERE ticker = ?', ((ticker,) for ticker in tickers))
+                connection.executemany('DELETE FROM dividends WHERE ticker = ?', ((ticker,) for ticker in tickers))
+                connection.executemany('DELETE FROM aggregates WHERE ticker = ?', ((ticker,) for ticker in tickers))
+                connection.executemany('DELETE FROM drawdowns WHERE ticker = ?', ((ticker,) for ticker in tickers))
+                connection.executemany('DELETE FROM risk WHERE ticker = ?', ((ticker,) for ticker in tickers))
+                connection.executemany('DELETE FROM screen WHERE ticker = ?', ((ticker,) for ticker in tickers))
+                connection.executemany('DELETE FROM symbols WHERE ticker = ?', ((ticker,) for ticker in tickers))
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+        return tickers
+
+    def get_fingerprints(self) -> dict[str, str]:
+        try:
+            rows = self.__connection().execute(
+                'SELECT ticker, fingerprint FROM symbols WHERE fingerprint IS NOT NULL').fetchall()
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+        return dict(rows)
+
+    def touch_symbols(self, tickers: tuple[str, ...]) -> None:
+        now = time.time()
+        try:
+            connection = self.__connection()
+            with connection:
+                connection.executemany('UPDATE symbols SET date = ? WHERE ticker = ?',
+                                       ((now, ticker) for ticker in tickers))
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+
+    def save_risk(self, risk: dict[str, dict]) -> None:
+        rows = [(ticker, window, stock_risk['benchmark'], stock_risk['day'])
+                + tuple(statistics[metric] for metric in RISK_METRICS)
+                for ticker, stock_risk in risk.items() for window, statistics in stock_risk['windows'].items()]
+        try:
+            connection = self.__connection()
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO risk (ticker, window, benchmark, day, {}) '
+                                       'VALUES (?, ?, ?, ?, {})'.format(', '.join(RISK_METRICS),
+                                                                        ', '.join('?' * len(RISK_METRICS))), rows)
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+
+    def get_risk(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        query = 'SELECT ticker, window, benchmark, day, {} FROM risk'.format(', '.join(RISK_METRICS))
+        if tickers is not None:
+            tickers = tuple(tickers)
+            if not tickers:
+                return {}
+            query += ' WHERE ticker IN ({})'.format(', '.join('?' * len(tickers)))
+        try:
+            rows = self.__connection().execute(query, tickers or ()).fetchall()
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+        risk = {}
+        for ticker, window, benchmark, day, *statistics in rows:
+            stock_risk = risk.setdefault(ticker, {'benchmark': benchmark, 'day': day, 'windows': {}})
+            stock_risk['windows'][window] = dict(zip(RISK_METRICS, statistics))
+        return risk
+
+    def get_screen_metrics(self, tickers: tuple[str, ...] = None) -> dict[str, dict]:
+        query = 'SELECT symbols.ticker, type, screen.ticker IS NOT NULL, {} FROM symbols ' \
+                'LEFT JOIN screen ON screen.ticker = symbols.ticker'.format(', '.join(SCREEN_METRICS))
+        if tickers is not None:
+            tickers = tuple(tickers)
+            if not tickers:
+                return {}
+            query += ' WHERE symbols.ticker IN ({})'.format(', '.join('?' * len(tickers)))
+        try:
+            rows = self.__connection().execute(query, tickers or ()).fetchall()
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+        return {ticker: {'type': symbol_type, 'metrics': dict(zip(SCREEN_METRICS, metrics)) if saved else None}
+                for ticker, symbol_type, saved, *metrics in rows}
+
+    def get_latest_returns(self, days: int, tickers: tuple[str, ...] = None,
+                           symbol_type: Literal['stock', 'index', 'all'] = 'all') -> dict[str, dict]:
+        query = 'SELECT ticker, type, exchange FROM symbols'
+        conditions, parameters = [], ()
+        if tickers is not None:
+            tickers = tuple(tickers)
+            if not tickers:
+                return {}
+            conditions.append('ticker IN ({})'.format(', '.join('?' * len(tickers))))
+            parameters += tickers
+        if symbol_type != 'all':
+            conditions.append('type = ?')
+            parameters += (symbol_type,)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        try:
+            connection = self.__connection()
+            with timings.span('sqlite.read'):
+                symbols_rows = connection.execute(query, parameters).fetchall()
+                # The last days of each history, walking the primary key backwards.
+                histories = [connection.execute('SELECT day, daily_return FROM history WHERE ticker = ? '
+                                                'ORDER BY day DESC LIMIT ?', (row[0], days)).fetchall()
+                             for row in symbols_rows]
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+
+        with timings.span('repository.decode'):
+            latest_returns = {}
+            for (ticker, stored_type, exchange), history in zip(symbols_rows, histories):
+                values = np.array(history[::-1], dtype=np.float64).reshape(len(history), 2)
+                latest_returns[ticker] = {'type': stored_type, 'exchange': exchange,
+                                          'daily_returns': pd.Series(values[:, 1], copy=False,
+                                                                     index=pd.DatetimeIndex(
+                                                                         values[:, 0].astype('datetime64[D]')))}
+            return latest_returns
+
+    def acquire_lease(self, name: str, owner: str, seconds: float) -> bool:
+        now = time.time()
+        try:
+            connection = self.__connection()
+            with connection:
+                cursor = connection.execute('INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) '
+                                            'ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, '
+                                            'expires_at = excluded.expires_at '
+                                            'WHERE leases.expires_at <= ? OR leases.owner = excluded.owner',
+                                            (name, owner, now + seconds, now))
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+        return cursor.rowcount == 1
+
+    def __save(self, symbol: Symbol, symbol_type: str, fingerprint: Union[str, None], isin: str = None,
+               exchange: str = None, dividends: pd.Series = None):
+        days = self.__days(symbol.closures.index)
+        total_returns = getattr(symbol, 'total_returns', None)
+        columns = [days, symbol.closures.to_numpy(dtype=np.float64).tolist(),
+                   symbol.daily_returns.to_numpy(dtype=np.float64).tolist(),
+                   total_returns.to_numpy(dtype=np.float64).tolist() if total_returns is not None
+                   else [None] * len(days)]
+        try:
+            connection = self.__connection()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO symbols (ticker, type, name, isin, exchange, fingerprint, '
+                                   'date) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   (symbol.ticker, symbol_type, symbol.name, isin, exchange, fingerprint, time.time()))
+                connection.execute('DELETE FROM history WHERE ticker = ?', (symbol.ticker,))
+                connection.executemany('INSERT INTO history (ticker, day, close, daily_return, total_return) '
+                                       'VALUES (?, ?, ?, ?, ?)', zip([symbol.ticker] * len(days), *columns))
+                connection.execute('DELETE FROM dividends WHERE ticker = ?', (symbol.ticker,))
+                if dividends is not None:
+                    connection.executemany('INSERT INTO dividends (ticker, day, amount) VALUES (?, ?, ?)',
+                                           zip([symbol.ticker] * len(dividends), self.__days(dividends.index),
+                                               dividends.to_numpy(dtype=np.float64).tolist()))
+                connection.execute('DELETE FROM aggregates WHERE ticker = ?', (symbol.ticker,))
+                for freq, aggregates in symbol.aggregates.items():
+                    connection.executemany('INSERT INTO aggregates (ticker, freq, day, close, period_return, '
+                                           'volatility) VALUES (?, ?, ?, ?, ?, ?)',
+                                           zip([symbol.ticker] * len(aggregates), [freq] * len(aggregates),
+                                               self.__days(aggregates.index),
+                                               *(aggregates[column].to_numpy(dtype=np.float64).tolist()
+                                                 for column in AGGREGATES_COLUMNS)))
+                connection.execute('DELETE FROM drawdowns WHERE ticker = ?', (symbol.ticker,))
+                if symbol.drawdown is not None:
+                    connection.execute('INSERT INTO drawdowns (ticker, {}) VALUES (?, {})'.format(
+                        ', '.join(DRAWDOWN_STATE_FIELDS), ', '.join('?' * len(DRAWDOWN_STATE_FIELDS))),
+                        (symbol.ticker,) + tuple(getattr(symbol.drawdown, field) for field in DRAWDOWN_STATE_FIELDS))
+                connection.execute('INSERT OR REPLACE INTO screen (ticker, {}) VALUES (?, {})'.format(
+                    ', '.join(SCREEN_METRICS), ', '.join('?' * len(SCREEN_METRICS))),
+                    (symbol.ticker,) + tuple(symbol.screen_metrics[metric] for metric in SCREEN_METRICS))
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            st.logger.info("Symbol {} not updated due to an error".format(symbol.ticker))
+            raise RepositoryException()
+
+    def __read_symbols(self, query: str, parameters: tuple, initial_date: date = None,
+                       end_date: date = None) -> tuple[dict, ...]:
+        window = ' AND day >= ?' if initial_date is not None else ''
+        window += ' AND day <= ?' if end_date is not None else ''
+        window_parameters = tuple((day - _EPOCH).days for day in (initial_date, end_date) if day is not None)
+        try:
+            connection = self.__connection()
+            with timings.span('sqlite.read'):
+                symbols_rows = connection.execute(query, parameters).fetchall()
+                histories = [connection.execute('SELECT day, close, daily_return, total_return FROM history '
+                                                'WHERE ticker = ?{} ORDER BY day'.format(window),
+                                                (row[0],) + window_parameters).fetchall()
+                             for row in symbols_rows]
+                dividends = [connection.execute('SELECT day, amount FROM dividends WHERE ticker = ?{} '
+                                                'ORDER BY day'.format(window),
+                                                (row[0],) + window_parameters).fetchall()
+                             if row[1] == 'stock' else None for row in symbols_rows]
+                # The aggregates cover the whole history, a window of it gets its own computed.
+                aggregates = [connection.execute('SELECT freq, day, close, period_return, volatility FROM aggregates '
+                                                 'WHERE ticker = ? ORDER BY freq, day', (row[0],)).fetchall()
+                              if not window else None for row in symbols_rows]
+                drawdowns = [connection.execute('SELECT {} FROM drawdowns WHERE ticker = ?'.format(
+                    ', '.join(DRAWDOWN_STATE_FIELDS)), (row[0],)).fetchone()
+                             if not window else None for row in symbols_rows]
+        except sqlite3.Error as e:
+            st.logger.exception(e)
+            raise RepositoryException
+
+        with timings.span('repository.decode'):
+            return tuple(self._symbol_info(*symbol_rows)
+                         for symbol_rows in zip(symbols_rows, histories, dividends, aggregates, drawdowns))
+
+    @staticmethod
+    def _symbol_info(row: tuple, history: list[tuple], dividends: Union[list[tuple], None],
+                     aggregates: Union[list[tuple], None] = None, drawdown: Union[tuple, None] = None) -> dict:
+        """
+        Decodes a symbol row and its history, dividends, aggregates and drawdown rows, they are returned as
+        pd.Series and pd.DataFrame over numpy arrays.
+        """
+        ticker, symbol_type, name, isin, exchange = row
+        # NULLs (NaN returns, total returns of the indexes) are read as None, which numpy converts to NaN.
+        values = np.array(history, dtype=np.float64).reshape(len(history), 4)
+        dates = pd.DatetimeIndex(values[:, 0].astype('datetime64[D]'))
+        symbol_info = {'ticker': ticker, 'name': name,
+                       'closures': pd.Series(values[:, 1], index=dates, copy=False),
+                       'daily_returns': pd.Series(values[:, 2], index=dates, copy=False)}
+        if symbol_type == 'stock':
+            paid = np.array(dividends, dtype=np.float64).reshape(len(dividends), 2)
+            symbol_info['dividends'] = pd.Series(paid[:, 1], copy=False,
+                                                 index=pd.DatetimeIndex(paid[:, 0].astype('datetime64[D]')))
+            # Stocks saved before the total returns were stored get them computed from the closures.
+            if not np.isnan(values[:, 3]).all():
+                symbol_info['total_returns'] = pd.Series(values[:, 3], index=dates, copy=False)
+            symbol_info['isin'] = isin
+            symbol_info['exchange'] = exchange
+        if aggregates:
+            freqs = np.array([aggregate[0] for aggregate in aggregates])
+            periods = np.array([aggregate[1:] for aggregate in aggregates], dtype=np.float64)
+            symbol_info['aggregates'] = {
+                str(freq): pd.DataFrame(periods[freqs == freq, 1:], columns=AGGREGATES_COLUMNS,
+                                        index=pd.DatetimeIndex(periods[freqs == freq, 0].astype('datetime64[D]')))
+                for freq in np.unique(freqs)}
+        if drawdown is not None:
+            symbol_info['drawdown'] = dict(zip(DRAWDOWN_STATE_FIELDS, drawdown))
+        return symbol_info
+
+    @staticmethod
+    def __days(dates: pd.DatetimeIndex) -> list[int]:
+        """
+        :return: the dates as days since 1970-01-01.
+        """
+        return dates.values.astype('datetime64[D]').astype(np.int64).tolist()
+
+    def __connection(self) -> sqlite3.Connection:
+        """
+        Each thread uses its own connection, they are not shared with forked processes either.
+        """
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None or self.__local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.__local.connection, self.__local.pid = connection, os.getpid()
+        return connection
@@ -0,0 +1,54 @@
+import threading
+from typing import Callable
+
+
+class DataVersion:
+    """
+    Monotonic version of the symbols data, bumped each time a symbol is written.
+    Derived data (shared memory generations, caches...) compare it to know when they are stale.
+    """
+    def __init__(self):
+        self.__value = 0
+        # Version of the last bump of each ticker, and of the last one of every symbol.
+        self.__tickers = {}
+        self.__all = 0
+        self.__lock = threading.Lock()
+        self.__listeners = []
+
+    @property
+    def value(self) -> int:
+        return self.__value
+
+    def of(self, ticker: str) -> int:
+        """
+        :return: the version the symbol last changed at, data derived from it only needs to compare this one.
+        """
+        return max(self.__tickers.get(ticker, 0), self.__all)
+
+    def bump(self, ticker: str = None) -> int:
+        """
+        Increments the version.
+        :param ticker: (optional) ticker of the symbol that has changed.
+        :return: the new version.
+        """
+        with self.__lock:
+            self.__value += 1
+            value = self.__value
+            if ticker is None:
+                self.__all = value
+            else:
+                self.__tickers[ticker] = value
+            listeners = tuple(self.__listeners)
+        for listener in listeners:
+            listener(value, ticker)
+        return value
+
+    def subscribe(self, listener: Callable[[int, str], None]) -> None:
+        """
+        :param listener: called with the new version and the changed ticker (or None) after each bump.
+        """
+        with self.__lock:
+            self.__listeners.append(listener)
+
+
+symbols_data_version = DataVersion()
@@ -14,3 +14,9 @@ class PortfolioException(Exception):
     def __init__(self, error: str):
         super(PortfolioException, self).__init__()
         self.error = error
+
+
+class SymbolException(Exception):
+    def __init__(self, error: str):
+        super(SymbolException, self).__init__()
+        self.error = error
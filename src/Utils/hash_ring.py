@@ -0,0 +1,31 @@
+import bisect
+import hashlib
+from typing import Iterable, Union
+
+
+class HashRing:
+    """
+    Consistent hashing of keys to nodes. Each node is placed at many points of a ring of 64 bits hashes and a key
+    belongs to the node of the first point after its hash, so adding or removing a node only moves the keys of
+    its points, about 1/n of them, and the keys are spread evenly across the nodes.
+    """
+    def __init__(self, nodes: Iterable[str], virtual_nodes: int):
+        """
+        :param virtual_nodes: points of each node on the ring.
+        """
+        points = sorted((self.hash('{}#{}'.format(node, point)), node)
+                        for node in set(nodes) for point in range(virtual_nodes))
+        self.__hashes = [point_hash for point_hash, _ in points]
+        self.__nodes = [node for _, node in points]
+
+    def node(self, key: str) -> Union[str, None]:
+        """
+        :return: the node the key belongs to, None if the ring is empty.
+        """
+        if not self.__nodes:
+            return None
+        return self.__nodes[bisect.bisect(self.__hashes, self.hash(key)) % len(self.__nodes)]
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
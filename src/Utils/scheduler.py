@@ -0,0 +1,192 @@
+import os
+import random
+import threading
+import time
+from typing import Callable, Union
+
+from src.Utils.data_version import symbols_data_version
+from src.Utils.timing import timings
+from src import settings as st
+
+
+class _Job:
+    def __init__(self, name: str, job: Callable[[], object], interval: Union[float, None], jitter: float,
+                 lease: Callable[[str, str, float], bool] = None):
+        """
+        :param interval: seconds between runs, None if it runs after the ingestion waves.
+        :param lease: takes the lease of the job for an owner and some seconds, None if every process runs it.
+        """
+        self.name = name
+        self.job = job
+        self.interval = interval
+        self.jitter = jitter
+        self.lease = lease
+        self.next_run_at = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration = None
+        self.lock = threading.Lock()
+
+    def schedule_next(self, now: float) -> None:
+        self.next_run_at = now + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def leased(self) -> bool:
+        """
+        Takes the lease until the earliest next run, so a single process of all the instances runs each interval.
+        If the process holding it stops, another one takes it once it has expired.
+        :return: whether this process runs the job.
+        """
+        if self.lease is None:
+            return True
+        return self.lease(self.name, '{}:{}'.format(st.INSTANCE_ID, os.getpid()), self.interval * (1 - self.jitter))
+
+
+class Scheduler:
+    """
+    Runs the maintenance jobs of the process in background: periodic ones, with their interval randomly
+    stretched or shrunk by the jitter so processes and nodes do not run them at once, and jobs run once each
+    ingestion wave has finished, when the symbols data version has changed and then stayed quiet for a while.
+
+    A job never runs twice at the same time, a run due while the previous one is still running is skipped.
+    The periodic jobs given a lease are run by a single process of all the instances sharing it, the others
+    skip their runs while it is held.
+    Each run takes its own daemon thread, lowered in priority so it yields the CPU to the request threads.
+    """
+    def __init__(self, tick: float = 1, wave_quiet: float = st.INGESTION_WAVE_QUIET):
+        """
+        :param tick: seconds between checks for due jobs.
+        :param wave_quiet: seconds without data changes for an ingestion wave to be finished.
+        """
+        self.tick = tick
+        self.wave_quiet = wave_quiet
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__stopped = threading.Event()
+        self.__wave_pending = False
+        self.__last_change_at = 0.0
+        symbols_data_version.subscribe(self.__on_data_version)
+
+    def every(self, name: str, interval: float, job: Callable[[], object], jitter: float = st.SCHEDULER_JITTER,
+              run_at_start: bool = False, lease: Callable[[str, str, float], bool] = None) -> None:
+        """
+        :param interval: seconds between runs.
+        :param jitter: fraction of the interval each run is randomly delayed or advanced.
+        :param run_at_start: runs it as soon as the scheduler starts, otherwise after a first interval.
+        :param lease: (optional) takes the lease of the job, e.g. RepositoryInterface.acquire_lease,
+        if set only the process holding it runs the job.
+        """
+        scheduled = _Job(name, job, interval, jitter, lease)
+        if run_at_start:
+            scheduled.next_run_at = time.monotonic()
+        else:
+            scheduled.schedule_next(time.monotonic())
+        with self.__lock:
+            self.__jobs[name] = scheduled
+
+    def after_ingestion_waves(self, name: str, job: Callable[[], object]) -> None:
+        with self.__lock:
+            self.__jobs[name] = _Job(name, job, None, 0)
+
+    def run_now(self, name: str) -> bool:
+        """
+        Runs the job in background.
+        :return: False if it is already running.
+        """
+        with self.__lock:
+            job = self.__jobs[name]
+        return self.__launch(job)
+
+    def stats(self) -> dict[str, dict]:
+        """
+        :return: by job: runs, failures, skipped runs and duration of the last run.
+        """
+        with self.__lock:
+            jobs = tuple(self.__jobs.values())
+        return {job.name: {'runs': job.runs, 'failures': job.failures, 'skipped': job.skipped,
+                           'last_duration': job.last_duration} for job in jobs}
+
+    def start(self) -> None:
+        if self.__thread is not None:
+            return
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name='scheduler', daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        self.__thread = None
+
+    def _reset(self) -> None:
+        """
+        Drops the jobs and the thread inherited from the parent process, the child schedules its own.
+        """
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__stopped = threading.Event()
+        self.__wave_pending = False
+
+    def __run(self):
+        while not self.__stopped.wait(self.tick):
+            now = time.monotonic()
+            wave_finished = self.__wave_pending and now - self.__last_change_at >= self.wave_quiet
+            if wave_finished:
+                self.__wave_pending = False
+            with self.__lock:
+                jobs = tuple(self.__jobs.values())
+            for job in jobs:
+                if job.interval is None:
+                    if wave_finished:
+                        self.__launch(job)
+                elif now >= job.next_run_at:
+                    job.schedule_next(now)
+                    self.__launch(job)
+
+    def __launch(self, job: _Job) -> bool:
+        if not job.lock.acquire(blocking=False):
+            job.skipped += 1
+            st.logger.warning("Job {} is still running, this run is skipped".format(job.name))
+            return False
+        threading.Thread(target=self.__execute, args=(job,), name='job {}'.format(job.name), daemon=True).start()
+        return True
+
+    @staticmethod
+    def __execute(job: _Job):
+        try:
+            _lower_thread_priority()
+            started_at = time.monotonic()
+            try:
+                if not job.leased():
+                    job.skipped += 1
+                    st.logger.info("Job {} is run by another process, this run is skipped".format(job.name))
+                    return
+                job.job()
+            except Exception as e:
+                job.failures += 1
+                st.logger.exception(e)
+                st.logger.warning("Job {} failed, it will run again on its next schedule".format(job.name))
+            job.runs += 1
+            job.last_duration = time.monotonic() - started_at
+            timings.record('job.{}'.format(job.name), job.last_duration)
+        finally:
+            job.lock.release()
+
+    def __on_data_version(self, version: int, ticker: str):
+        self.__last_change_at = time.monotonic()
+        self.__wave_pending = True
+
+
+def _lower_thread_priority() -> None:
+    """
+    Raises the niceness of the calling thread, on Linux each thread is scheduled apart.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), st.SCHEDULER_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+
+scheduler = Scheduler()
+os.register_at_fork(after_in_child=scheduler._reset)
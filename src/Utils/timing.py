@@ -0,0 +1,100 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator
+
+# Upper bounds, in seconds, of the histograms buckets.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def copy(self) -> 'Histogram':
+        histogram = Histogram(self.buckets)
+        histogram.counts, histogram.sum, histogram.count = list(self.counts), self.sum, self.count
+        return histogram
+
+    def cumulative_counts(self) -> list[int]:
+        """
+        :return: observations less than or equal to each bucket bound, the last one is +Inf.
+        """
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class Timings:
+    """
+    Durations of the instrumented stages (spans) of the requests and of the ingestion.
+    Every span is observed in a histogram by its name, and added to the breakdown of the
+    request being served, if any, which is kept in a context variable.
+    """
+    def __init__(self):
+        self.__histograms = {}
+        self.__lock = threading.Lock()
+        self.__request_spans = contextvars.ContextVar('request_spans', default=None)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started_at)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = Histogram()
+            histogram.observe(seconds)
+            spans = self.__request_spans.get()
+            if spans is not None:
+                spans[name] = spans.get(name, 0.0) + seconds
+
+    def start_request(self) -> contextvars.Token:
+        """
+        Starts collecting the breakdown of a request in the current context.
+        """
+        return self.__request_spans.set({})
+
+    def end_request(self, token: contextvars.Token) -> dict[str, float]:
+        """
+        :return: seconds spent in each span during the request.
+        """
+        spans = self.__request_spans.get() or {}
+        self.__request_spans.reset(token)
+        return spans
+
+    @contextmanager
+    def request(self) -> Iterator[dict[str, float]]:
+        token = self.start_request()
+        spans = self.__request_spans.get()
+        try:
+            yield spans
+        finally:
+            self.end_request(token)
+
+    def histograms(self) -> dict[str, Histogram]:
+        """
+        :return: a copy of the histograms by span name.
+        """
+        with self.__lock:
+            return {name: histogram.copy() for name, histogram in self.__histograms.items()}
+
+
+timings = Timings()
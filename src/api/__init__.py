@@ -1,15 +1,46 @@
-from flask import Flask
+import time
+
+from flask import Flask, g, request
 
 from src.api.portfolio_routes import portfolio_blueprint
 from src.api.symbol_routes import symbols as symbols_blueprint
+from src.api.metrics_routes import metrics_blueprint
+from src.api.health_routes import health_blueprint, start_warm_up
+from src.Utils.timing import timings
 
 
 app = Flask(__name__)
 app.register_blueprint(symbols_blueprint)
 app.register_blueprint(portfolio_blueprint)
+app.register_blueprint(health_blueprint)
 
 
-def start_api():
-    app.run(host='0.0.0.0', port=8001)
+@app.before_request
+def start_request_timings():
+    g.timings_token = timings.start_request()
+    g.started_at = time.perf_counter()
+
 
+@app.after_request
+def add_server_timing(response):
+    """
+    Shows the time spent in each stage of the request to the client, in the Server-Timing header.
+    """
+    token = g.pop('timings_token', None)
+    if token is None:
+        return response
+    spans = timings.end_request(token)
+    total = time.perf_counter() - g.started_at
+    timings.record('http.{}'.format(request.endpoint or 'unmatched'), total)
 
+    spans['total'] = total
+    response.headers['Server-Timing'] = ', '.join('{};dur={:.2f}'.format(name, seconds * 1000)
+                                                  for name, seconds in spans.items())
+    return response
+
+
+def start_api():
+    # Served apart from the api socket when there are several worker processes.
+    app.register_blueprint(metrics_blueprint)
+    start_warm_up()
+    app.run(host='0.0.0.0', port=8001)
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import ujson
+from flask import Blueprint, Response
+
+from src.api import portfolio_routes, symbol_routes
+from src.Utils.exceptions import SymbolException, RepositoryException
+from src.Utils.scheduler import Scheduler
+from src import settings as st
+
+health_blueprint = Blueprint(name='health', import_name=__name__)
+
+# Seconds before the first retry of the warm-up tasks that failed with a transient error, doubled on each retry
+# up to the max.
+WARMUP_RETRY_INTERVAL = 5
+WARMUP_RETRY_MAX_INTERVAL = 60
+# Errors the warm-up tasks are retried on, the data may be read once the database or broker is reachable again.
+TRANSIENT_ERRORS = (RepositoryException, ConnectionError, TimeoutError)
+
+
+class Readiness:
+    """
+    Startup state of the api process: it is alive as soon as it serves requests,
+    and ready once the warm-up has loaded what the first requests need.
+    """
+    def __init__(self):
+        self.started_at = _process_started_at()
+        self.ready_at = None
+        self.pending = ()
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    @property
+    def startup_seconds(self) -> float:
+        """
+        Seconds from the start of the process until it was ready, or until now if it is not ready yet.
+        """
+        return (self.ready_at if self.ready_at is not None else time.monotonic()) - self.started_at
+
+    def restart(self) -> None:
+        """
+        Starts over, for processes forked from an already started one.
+        """
+        self.started_at = _process_started_at()
+        self.ready_at = None
+        self.pending = ()
+
+    def warm_up(self, tasks: dict[str, Callable[[], object]], workers: int = st.WARMUP_WORKERS) -> None:
+        """
+        Runs the tasks in parallel, those failed with a transient error are retried until they succeed, with a
+        growing delay. Any other error would fail again, the task is dropped so the process gets ready without it.
+        """
+        pending = dict(tasks)
+        retry_interval = WARMUP_RETRY_INTERVAL
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending:
+                self.pending = tuple(pending)
+                futures = {name: pool.submit(task) for name, task in pending.items()}
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                    except TRANSIENT_ERRORS as e:
+                        st.logger.warning("Warm-up task {} failed, it will be retried: {}".format(name, e))
+                    except Exception as e:
+                        st.logger.error("Warm-up task {} failed, it is dropped".format(name))
+                        st.logger.exception(e)
+                        del pending[name]
+                    else:
+                        del pending[name]
+                if pending:
+                    time.sleep(retry_interval)
+                    retry_interval = min(WARMUP_RETRY_MAX_INTERVAL, retry_interval * 2)
+        self.pending = ()
+        self.ready_at = time.monotonic()
+        st.logger.info("Api process {} ready, startup took {:.2f}s".format(os.getpid(), self.startup_seconds))
+
+
+def _process_started_at() -> float:
+    """
+    :return: monotonic time the process was started at, so the imports are accounted in the startup time.
+    Where /proc is not available, the current time.
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic()
+    return time.monotonic() - max(0.0, age)
+
+
+readiness = Readiness()
+
+
+@health_blueprint.route('/health', methods=['GET'])
+def get_health():
+    return Response(response=ujson.dumps({'status': 'alive'}), status=200, mimetype='application/json')
+
+
+@health_blueprint.route('/ready', methods=['GET'])
+def get_readiness():
+    if not readiness.ready:
+        return Response(response=ujson.dumps({'status': 'warming', 'pending': readiness.pending,
+                                              'elapsed_seconds': round(readiness.startup_seconds, 3)}),
+                        status=503, mimetype='application/json')
+    return Response(response=ujson.dumps({'status': 'ready',
+                                          'startup_seconds': round(readiness.startup_seconds, 3)}),
+                    status=200, mimetype='application/json')
+
+
+def warm_up_tasks() -> dict[str, Callable[[], object]]:
+    """
+    :return: the warm-up tasks by name: the symbols lists, the benchmark indexes and hot symbols,
+    and the portfolio analysis pool.
+    """
+    return dict(data_warm_up_tasks(), portfolio_pool=portfolio_routes.portfolio_service.warm_up)
+
+
+def data_warm_up_tasks() -> dict[str, Callable[[], object]]:
+    """
+    :return: the warm-up tasks that depend on the symbols data, by name: the symbols lists, the screener index,
+    the return profiles of the similarity search, and the benchmark indexes and hot symbols with their statistics
+    precomputed.
+    """
+    tasks = {'stocks_list': lambda: symbol_routes.lists_cache.get('stocks', symbol_routes.render_stocks_list),
+             'indexes_list': lambda: symbol_routes.lists_cache.get('indexes', symbol_routes.render_indexes_list),
+             'screener': symbol_routes.symbol_service.screener_cache.index,
+             'similarity': symbol_routes.symbol_service.similarity_cache.profiles}
+    for ticker in st.EXCHANGES + st.WARMUP_SYMBOLS:
+        tasks['symbol {}'.format(ticker)] = lambda ticker=ticker: _warm_up_symbol(ticker)
+    return tasks
+
+
+def _warm_up_symbol(ticker: str) -> None:
+    try:
+        symbol_routes.symbol_service.get_symbol(ticker)
+        # Keeps its returns prefix sums, for the date window queries.
+        symbol_routes.symbol_service.get_window(ticker)
+    except SymbolException:
+        # The symbol has not data, there is nothing to warm up.
+        pass
+
+
+def start_warm_up() -> threading.Thread:
+    """
+    Warms up the process in background, it serves requests meanwhile but reports itself as not ready.
+    """
+    thread = threading.Thread(target=readiness.warm_up, args=(warm_up_tasks(),), daemon=True)
+    thread.start()
+    return thread
+
+
+def schedule_warm_up(scheduler: Scheduler) -> None:
+    """
+    Warms up again the data derived from the symbols once each ingestion wave has finished,
+    so the first requests after it do not pay for reading and computing them.
+    """
+    scheduler.after_ingestion_waves('warm_up', _rewarm)
+
+
+def _rewarm() -> None:
+    # One task after another, the background jobs must not take the cpu from the requests.
+    for name, task in data_warm_up_tasks().items():
+        try:
+            task()
+        except Exception as e:
+            st.logger.warning("Warm-up task {} failed: {}".format(name, e))
@@ -0,0 +1,112 @@
+from flask import Blueprint, Response
+
+from src.api import portfolio_routes, symbol_routes
+from src.api.health_routes import readiness
+from src.Symbol.application.ingestion_metrics import ingestion_metrics
+from src.Symbol.infrastructure.memory_store_adapter import MemoryStoreRepositoryAdapter
+from src.Utils.data_version import symbols_data_version
+from src.Utils.scheduler import scheduler
+from src.Utils.timing import timings
+
+metrics_blueprint = Blueprint(name='metrics', import_name=__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+INGESTION_COUNTERS = ('received', 'processed', 'acked', 'nacked', 'dropped', 'skipped')
+# Ingestion gauges by metric name: key in the ingestion metrics and description.
+INGESTION_GAUGES = {
+    'queue_depth': ('queue_depth', 'Messages waiting in the ingestion queue.'),
+    'queue_bytes': ('queue_bytes', 'Bytes of the messages queued or being processed.'),
+    'prefetch_count': ('prefetch_count', 'Current prefetch window of the symbols consumer.'),
+    'lag_seconds': ('lag', 'Moving average of the time a message waits in the queue.'),
+    'processing_latency_seconds': ('processing_latency', 'Moving average of the time spent processing a message.')}
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(response=render_metrics(), status=200, content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def render_metrics() -> str:
+    """
+    Renders the metrics of this process in the Prometheus text format.
+    """
+    lines = ['# HELP fincalcs_span_duration_seconds Duration of the instrumented stages.',
+             '# TYPE fincalcs_span_duration_seconds histogram']
+    for name, histogram in sorted(timings.histograms().items()):
+        bounds = tuple(str(bound) for bound in histogram.buckets) + ('+Inf',)
+        for bound, count in zip(bounds, histogram.cumulative_counts()):
+            lines.append('fincalcs_span_duration_seconds_bucket{{span="{}",le="{}"}} {}'.format(name, bound, count))
+        lines.append('fincalcs_span_duration_seconds_sum{{span="{}"}} {}'.format(name, histogram.sum))
+        lines.append('fincalcs_span_duration_seconds_count{{span="{}"}} {}'.format(name, histogram.count))
+
+    ingestion = ingestion_metrics.to_dict()
+    lines.extend(('# HELP fincalcs_ingestion_messages_total Symbol messages by outcome.',
+                  '# TYPE fincalcs_ingestion_messages_total counter'))
+    lines.extend('fincalcs_ingestion_messages_total{{outcome="{}"}} {}'.format(counter, ingestion[counter])
+                 for counter in INGESTION_COUNTERS)
+    for name, (key, description) in INGESTION_GAUGES.items():
+        lines.extend(_gauge('fincalcs_ingestion_{}'.format(name), description, ingestion[key]))
+
+    lists_cache = symbol_routes.lists_cache
+    lines.extend(('# HELP fincalcs_response_cache_requests_total Lookups of the symbols lists cache.',
+                  '# TYPE fincalcs_response_cache_requests_total counter',
+                  'fincalcs_response_cache_requests_total{{result="hit"}} {}'.format(lists_cache.hits),
+                  'fincalcs_response_cache_requests_total{{result="miss"}} {}'.format(lists_cache.misses)))
+    lines.extend(_gauge('fincalcs_response_cache_bytes', 'Bytes held by the symbols lists cache.', lists_cache.size))
+
+    prefix_sums_cache = symbol_routes.symbol_service.prefix_sums_cache
+    lines.extend(('# HELP fincalcs_prefix_sums_requests_total Lookups of the returns prefix sums of the window queries.',
+                  '# TYPE fincalcs_prefix_sums_requests_total counter',
+                  'fincalcs_prefix_sums_requests_total{{result="hit"}} {}'.format(prefix_sums_cache.hits),
+                  'fincalcs_prefix_sums_requests_total{{result="miss"}} {}'.format(prefix_sums_cache.misses)))
+    lines.extend(_gauge('fincalcs_prefix_sums_bytes', 'Bytes held by the returns prefix sums.',
+                        prefix_sums_cache.nbytes))
+    lines.extend(_gauge('fincalcs_prefix_sums_symbols', 'Symbols with their returns prefix sums kept.',
+                        len(prefix_sums_cache)))
+
+    repository = symbol_routes.symbol_service.repository
+    # Not isinstance, the repository interface's subclass hook matches every repository adapter.
+    if type(repository) is MemoryStoreRepositoryAdapter:
+        lines.extend(_memory_store_metrics(repository))
+
+    portfolio_service = portfolio_routes.portfolio_service
+    lines.extend(_gauge('fincalcs_portfolio_pending', 'Portfolio analyses accepted and not finished.',
+                        portfolio_service.pending))
+    lines.extend(_gauge('fincalcs_portfolio_max_pending', 'Portfolio analyses accepted before shedding load.',
+                        portfolio_service.max_pending))
+    lines.extend(_gauge('fincalcs_ready', 'Whether the process has finished its warm-up.', int(readiness.ready)))
+    lines.extend(_gauge('fincalcs_startup_seconds', 'Time from the start of the process until it was ready.',
+                        readiness.startup_seconds))
+    jobs = scheduler.stats()
+    lines.extend(('# HELP fincalcs_job_runs_total Runs of the background jobs by outcome.',
+                  '# TYPE fincalcs_job_runs_total counter'))
+    for name, job in sorted(jobs.items()):
+        lines.extend(('fincalcs_job_runs_total{{job="{}",outcome="ok"}} {}'.format(name, job['runs'] - job['failures']),
+                      'fincalcs_job_runs_total{{job="{}",outcome="failed"}} {}'.format(name, job['failures']),
+                      'fincalcs_job_runs_total{{job="{}",outcome="skipped"}} {}'.format(name, job['skipped'])))
+    lines.extend(_gauge('fincalcs_symbols_data_version', 'Version of the symbols data served.',
+                        symbols_data_version.value))
+    return '\n'.join(lines) + '\n'
+
+
+def _memory_store_metrics(store: MemoryStoreRepositoryAdapter) -> list[str]:
+    lines = ['# HELP fincalcs_symbols_memory_symbol_bytes Bytes held by each symbol in the memory store.',
+             '# TYPE fincalcs_symbols_memory_symbol_bytes gauge']
+    lines.extend('fincalcs_symbols_memory_symbol_bytes{{ticker="{}"}} {}'.format(ticker, nbytes)
+                 for ticker, nbytes in sorted(store.symbols_nbytes().items()))
+    lines.extend(_gauge('fincalcs_symbols_memory_bytes', 'Bytes held by the symbols memory store.', store.nbytes))
+    lines.extend(_gauge('fincalcs_symbols_memory_budget_bytes', 'Bytes the symbols memory store can hold.',
+                        store.budget_bytes))
+    lines.extend(_gauge('fincalcs_symbols_memory_symbols', 'Symbols held by the memory store.', len(store)))
+    lines.extend(('# HELP fincalcs_symbols_memory_requests_total Lookups of the symbols memory store.',
+                  '# TYPE fincalcs_symbols_memory_requests_total counter',
+                  'fincalcs_symbols_memory_requests_total{{result="hit"}} {}'.format(store.hits),
+                  'fincalcs_symbols_memory_requests_total{{result="miss"}} {}'.format(store.misses),
+                  '# HELP fincalcs_symbols_memory_evictions_total Symbols evicted to stay within the budget.',
+                  '# TYPE fincalcs_symbols_memory_evictions_total counter',
+                  'fincalcs_symbols_memory_evictions_total {}'.format(store.evictions)))
+    return lines
+
+
+def _gauge(name: str, description: str, value) -> tuple[str, str, str]:
+    return '# HELP {} {}'.format(name, description), '# TYPE {} gauge'.format(name), '{} {}'.format(name, value)
@@ -5,15 +5,17 @@ from flask import Blueprint, Response, request
 from cerberus.validator import Validator
 from cerberus.errors import ValidationError
 
-from src.Portfolio.application.flask_adapter import FlaskServiceAdapter
+from src.api.response_cache import compressed_response
+from src.api.symbol_routes import symbols_repository, symbol_service, parse_similarity_filters
+from src.Portfolio.application.async_adapter import AsyncServiceAdapter
 from src.Portfolio.domain.domain_service import DomainService
 from src.Symbol.domain.domain_service import DomainService as SymbolDomainService
-from src.Symbol.infrastructure.mongodb_adapter import MongoRepositoryAdapter
-from src.Utils.exceptions import PortfolioException
+from src.Utils.exceptions import PortfolioException, SymbolException
+from src.Utils.timing import timings
 
 portfolio_blueprint = Blueprint(name='portfolio', import_name=__name__, url_prefix='/portfolio')
 
-portfolio_service = FlaskServiceAdapter(symbol_repository=MongoRepositoryAdapter(),
+portfolio_service = AsyncServiceAdapter(symbol_repository=symbols_repository,
                                         symbol_domain_service=SymbolDomainService(),
                                         domain_service=DomainService())
 
@@ -23,6 +25,10 @@ def get_portfolio_analysis():
     def to_date(d):
         return datetime.strptime(d, '%d-%m-%Y').date()
 
+    def to_bool(b):
+        # Form values are strings, anything else than true or false is left to fail the validation.
+        return {'true': True, 'false': False}.get(b.lower(), b) if isinstance(b, str) else b
+
     schema = {
         'tickers': {
             'type': 'list',
@@ -31,7 +37,8 @@ def get_portfolio_analysis():
             'empty': False
         },
         'initial_date': {'type': 'date', 'coerce': to_date, 'required': False},
-        'end_date': {'type': 'date', 'coerce': to_date, 'required': False}
+        'end_date': {'type': 'date', 'coerce': to_date, 'required': False},
+        'total_return': {'type': 'boolean', 'coerce': to_bool, 'required': False}
     }
     data = request.data if len(request.data) > 0 else request.form
     try:
@@ -46,6 +53,9 @@ def get_portfolio_analysis():
         body['initial_date'] = initial_date
     if end_date is not None:
         body['end_date'] = end_date
+    total_return = data.get('total_return')
+    if total_return is not None:
+        body['total_return'] = total_return
 
     shares_per_stock = {}
     sps_input = data.get('sharesPerStock').split(",")
@@ -85,11 +95,47 @@ def get_portfolio_analysis():
         portfolio_info = (portfolio_service.create_portfolio(tickers=tuple(body['tickers']),
                                                              n_shares_per_symbol=body['shares_per_stock'],
                                                              initial_date=body['initial_date'],
-                                                             end_date=body['end_date']))
+                                                             end_date=body['end_date'],
+                                                             total_return=body.get('total_return', False)))
     except PortfolioException as e:
         if e.error == 'No symbols found':
             return Response(response=ujson.dumps(e.error), status=404, mimetype='application/json')
         elif e.error == 'Invalid ticker':
             return Response(response=ujson.dumps(e.error), status=400, mimetype='application/json')
+        elif e.error == 'Service overloaded':
+            return Response(response=ujson.dumps(e.error), status=429, mimetype='application/json',
+                            headers={'Retry-After': '1'})
+        elif e.error == 'Deadline exceeded':
+            return Response(response=ujson.dumps(e.error), status=503, mimetype='application/json')
     else:
-        return Response(response=ujson.dumps(portfolio_info.to_json()), status=200, mimetype='application/json')
+        with timings.span('portfolio.serialize'):
+            body = ujson.dumps(portfolio_info.to_json())
+        return compressed_response(body)
+
+
+@portfolio_blueprint.route('/similar', methods=['POST'])
+def get_similar_to_portfolio():
+    data = request.data if len(request.data) > 0 else request.form
+    try:
+        data = ujson.loads(data)
+    except TypeError:
+        pass
+
+    try:
+        similarity_filters = parse_similarity_filters(data)
+        shares_per_stock = {}
+        for stock in (data.get('sharesPerStock') or '').split(","):
+            ticker, _, shares = stock.partition(":")
+            if not ticker.strip() or not shares.strip().isdigit() or int(shares) <= 0:
+                raise ValueError("sharesPerStock must be a list of ticker:shares, with shares greater than 0")
+            shares_per_stock[ticker.strip()] = int(shares)
+    except ValueError as e:
+        return Response(response='Invalid request: {}'.format(e), status=400, mimetype='application/json')
+
+    try:
+        similar = symbol_service.get_similar_to_portfolio(shares_per_stock, **similarity_filters)
+    except SymbolException as e:
+        return Response(response=ujson.dumps(e.error), status=400, mimetype='application/json')
+    if not similar:
+        return Response(response=ujson.dumps('No symbols found'), status=404, mimetype='application/json')
+    return Response(response=ujson.dumps(similar.to_json()), status=200, mimetype='application/json')
@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Iterator, Union
+
+from flask import Response, request
+
+from src.Utils.data_version import symbols_data_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings in order of preference when the client accepts several with the same weight.
+ENCODINGS = ('br', 'gzip', 'identity') if brotli is not None else ('gzip', 'identity')
+# Bodies smaller than this are not worth compressing.
+MIN_COMPRESSION_SIZE = 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class CachedBody:
+    version: int
+    etag: str
+    variants: dict[str, bytes]
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """
+    :param accept_encoding: value of the Accept-Encoding header.
+    :return: the preferred encoding among the supported ones, 'identity' if none is accepted.
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = 'identity', 0.0
+    for coding in ENCODINGS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9)
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    return body
+
+
+def stream_compressed(body: bytes, encoding: str) -> Iterator[bytes]:
+    """
+    Compresses the body chunk by chunk, so the first bytes are sent before the whole body is compressed.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        for start in range(0, len(body), STREAM_CHUNK_SIZE):
+            chunk = compressor.process(body[start:start + STREAM_CHUNK_SIZE])
+            if chunk:
+                yield chunk
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level=6, wbits=16 + zlib.MAX_WBITS)
+        for start in range(0, len(body), STREAM_CHUNK_SIZE):
+            chunk = compressor.compress(body[start:start + STREAM_CHUNK_SIZE])
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
+
+def compressed_response(body: Union[str, bytes], status: int = 200, mimetype: str = 'application/json') -> Response:
+    """
+    Builds a response for a dynamic body, compressed on the fly if the client accepts it.
+    """
+    if isinstance(body, str):
+        body = body.encode()
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding == 'identity' or len(body) < MIN_COMPRESSION_SIZE:
+        return Response(response=body, status=status, mimetype=mimetype)
+
+    response = Response(response=stream_compressed(body, encoding), status=status, mimetype=mimetype,
+                        direct_passthrough=True)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+class CompressedResponseCache:
+    """
+    Keeps the rendered body of the responses that only change with the symbols data,
+    along with its compressed variants, so they are rendered and compressed once per data version.
+    """
+    def __init__(self, version: Callable[[], int] = lambda: symbols_data_version.value):
+        self.__version = version
+        self.__bodies = {}
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes held by the cached bodies and their compressed variants.
+        """
+        return sum(len(variant) for cached in tuple(self.__bodies.values()) for variant in cached.variants.values())
+
+    def get(self, key: str, render: Callable[[], Union[str, bytes]]) -> CachedBody:
+        """
+        :param key: identifier of the response.
+        :param render: builds the body, only called if there is not a body cached for the current version.
+        """
+        version = self.__version()
+        cached = self.__bodies.get(key)
+        if cached is not None and cached.version == version:
+            self.hits += 1
+            return cached
+
+        with self.__lock:
+            cached = self.__bodies.get(key)
+            if cached is not None and cached.version == version:
+                self.hits += 1
+                return cached
+            self.misses += 1
+            body = render()
+            if isinstance(body, str):
+                body = body.encode()
+            variants = {'identity': body}
+            if len(body) >= MIN_COMPRESSION_SIZE:
+                for encoding in ENCODINGS[:-1]:
+                    variants[encoding] = compress(body, encoding)
+            # From the content, the data version is local to each process and starts again on each boot.
+            etag = '"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+            cached = CachedBody(version=version, etag=etag, variants=variants)
+            self.__bodies[key] = cached
+            return cached
+
+    def response(self, key: str, render: Callable[[], Union[str, bytes]], mimetype: str = 'application/json') \
+            -> Response:
+        """
+        Serves the cached body in the encoding preferred by the client.
+        """
+        cached = self.get(key, render)
+        if request.headers.get('If-None-Match') == cached.etag:
+            response = Response(status=304)
+        else:
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+            if encoding not in cached.variants:
+                encoding = 'identity'
+            response = Response(response=cached.variants[encoding], status=200, mimetype=mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.headers['ETag'] = cached.etag
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def invalidate(self) -> None:
+        with self.__lock:
+            self.__bodies.clear()
@@ -0,0 +1,183 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from src.api import app, symbol_routes, portfolio_routes, health_routes
+from src.api.metrics_routes import metrics_blueprint
+from src.Symbol.infrastructure.repository_factory import create_repository
+from src.Symbol.infrastructure.shared_memory_adapter import SharedMemoryPublisher, SharedMemoryRepositoryAdapter
+from src.Utils.exceptions import RepositoryException
+from src.Utils.scheduler import scheduler
+from src import settings as st
+
+
+class PreforkServer:
+    """
+    Serves the api from N forked worker processes that share the same listening socket.
+    The master process does not serve requests, it publishes the symbols data into shared memory
+    for the workers and runs the ingestion. The workers are forked, and respawned when they die, by a supervisor
+    process forked from the master before it starts any thread, so no worker is forked while another thread
+    holds a lock, e.g. one of the logging module.
+    Each process serves its own /metrics apart from the api socket, the master on metrics_port and the worker
+    of each slot on the following ports, so every scrape of a port sees the same process.
+    """
+    def __init__(self, workers: int, host: str = st.API_HOST, port: int = st.API_PORT,
+                 metrics_port: int = st.METRICS_PORT):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.metrics_port = metrics_port
+        self.publisher = None
+        self.__metrics_server = None
+        self.__socket = None
+        self.__supervisor_pid = None
+        # Slot of each worker by pid, kept by the supervisor, a respawned worker takes the slot of the dead one.
+        self.__worker_pids = {}
+        self.__running = False
+
+    def start(self) -> None:
+        """
+        Publishes the first generation of symbols data and forks the supervisor of the workers.
+        Must be called before starting any other thread in the master process.
+        """
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__socket.bind((self.host, self.port))
+        self.__socket.listen(128)
+        self.__socket.set_inheritable(True)
+
+        self.publisher = SharedMemoryPublisher(repository=create_repository())
+        try:
+            self.publisher.publish()
+        except RepositoryException as e:
+            st.logger.exception(e)
+
+        self.__running = True
+        self.__supervisor_pid = os.fork()
+        if self.__supervisor_pid == 0:
+            try:
+                self.__run_supervisor()
+            finally:
+                os._exit(0)
+        self.publisher.start()
+        self.__metrics_server = self.__start_metrics_server(self.metrics_port)
+
+        signal.signal(signal.SIGTERM, self.__on_signal)
+        signal.signal(signal.SIGINT, self.__on_signal)
+        st.logger.info("Api served by {} workers on {}:{}".format(self.workers, self.host, self.port))
+
+    def supervise(self) -> None:
+        """
+        Blocks the master process until a SIGTERM or SIGINT is received, or the supervisor of the workers exits.
+        """
+        while self.__running:
+            try:
+                pid, status = os.waitpid(self.__supervisor_pid, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = self.__supervisor_pid, None
+            if pid == self.__supervisor_pid:
+                # It cannot be forked again once the master runs other threads.
+                st.logger.error("Api workers supervisor exited with status {}, stopping".format(status))
+                self.__supervisor_pid = None
+                break
+            time.sleep(1)
+        self.stop()
+
+    def stop(self) -> None:
+        self.__running = False
+        if self.__supervisor_pid is not None:
+            # It stops the workers before exiting.
+            try:
+                os.kill(self.__supervisor_pid, signal.SIGTERM)
+                os.waitpid(self.__supervisor_pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.__supervisor_pid = None
+        if self.publisher is not None:
+            self.publisher.stop()
+        if self.__metrics_server is not None:
+            self.__metrics_server.shutdown()
+        self.__socket.close()
+
+    def __start_metrics_server(self, port: int):
+        """
+        Serves the metrics of this process on its own port.
+        """
+        metrics_app = Flask(__name__)
+        metrics_app.register_blueprint(metrics_blueprint)
+        metrics_server = make_server(self.host, port, metrics_app, threaded=True)
+        threading.Thread(target=metrics_server.serve_forever, daemon=True).start()
+        return metrics_server
+
+    def __on_signal(self, signum, frame):
+        self.__running = False
+
+    def __run_supervisor(self):
+        """
+        Forks the workers and respawns the dead ones, until a SIGTERM or SIGINT is received or the master exits.
+        Runs in a single thread, it is only used to fork.
+        """
+        master_pid = os.getppid()
+        signal.signal(signal.SIGTERM, self.__on_signal)
+        signal.signal(signal.SIGINT, self.__on_signal)
+        for slot in range(self.workers):
+            self.__spawn_worker(slot)
+        while self.__running and os.getppid() == master_pid:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid in self.__worker_pids:
+                slot = self.__worker_pids.pop(pid)
+                if self.__running:
+                    st.logger.warning("Api worker {} exited with status {}, respawning it".format(pid, status))
+                    self.__spawn_worker(slot)
+                continue
+            time.sleep(1)
+        for pid in tuple(self.__worker_pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.__worker_pids.clear()
+
+    def __spawn_worker(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.__run_worker(slot)
+            finally:
+                os._exit(0)
+        self.__worker_pids[pid] = slot
+
+    def __run_worker(self, slot: int):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        health_routes.readiness.restart()
+
+        repository = SharedMemoryRepositoryAdapter(fallback=create_repository())
+        symbol_routes.symbol_service.use_repository(repository)
+        portfolio_routes.portfolio_service.symbol_repository = repository
+        # The ingestion runs in the master process, new data is noticed through the published generations.
+        app.before_request(repository.refresh)
+
+        server = make_server(self.host, self.port, app, threaded=True, fd=self.__socket.fileno())
+        self.__start_metrics_server(self.metrics_port + 1 + slot)
+        health_routes.start_warm_up()
+        # Idle workers notice the new generations too, so they are warmed up before the next requests.
+        scheduler.every('shm_refresh', st.SHM_PUBLISH_INTERVAL, repository.refresh)
+        health_routes.schedule_warm_up(scheduler)
+        scheduler.start()
+        server.serve_forever()
+
+
+def start_production_api(workers: int = st.API_WORKERS) -> PreforkServer:
+    server = PreforkServer(workers=workers)
+    server.start()
+    return server
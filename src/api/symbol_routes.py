@@ -1,32 +1,262 @@
+from datetime import datetime
+
 import ujson
-from flask import Blueprint, Response
+from flask import Blueprint, Response, request
 
+from src.api.response_cache import CompressedResponseCache, compressed_response
 from src.Symbol.application.flask_adapter import FlaskServiceAdapter
-from src.Symbol.domain.domain_service import DomainService
-from src.Symbol.infrastructure.mongodb_adapter import MongoRepositoryAdapter
+from src.Symbol.domain.domain_service import DomainService, RESAMPLING_FREQUENCIES
+from src.Symbol.domain.screener import SCREEN_METRICS
+from src.Symbol.infrastructure.memory_store_adapter import MemoryStoreRepositoryAdapter
+from src.Symbol.infrastructure.repository_factory import create_repository
+from src.Utils.exceptions import SymbolException
+from src.Utils.timing import timings
+from src import settings as st
 symbols = Blueprint(name='symbols', import_name=__name__, url_prefix='/symbols')
 
 
-symbol_service = FlaskServiceAdapter(repository=MongoRepositoryAdapter(), domain_service=DomainService())
+# Shared with the portfolio routes.
+symbols_repository = create_repository()
+if st.SYMBOLS_MEMORY_BUDGET > 0:
+    symbols_repository = MemoryStoreRepositoryAdapter(fallback=symbols_repository, budget_bytes=st.SYMBOLS_MEMORY_BUDGET,
+                                                      float32=st.SYMBOLS_MEMORY_FLOAT32)
+symbol_service = FlaskServiceAdapter(repository=symbols_repository, domain_service=DomainService())
+# The lists only change when new symbols data is ingested.
+lists_cache = CompressedResponseCache()
 
 
 @symbols.route('/stocks', methods=['GET'])
 def get_stocks_list():
-    symbs = ujson.dumps([symbol.to_json() for symbol in symbol_service.get_stocks_info()])
-    return Response(response=symbs, status=200, mimetype='application/json')
+    return lists_cache.response('stocks', render_stocks_list)
 
 
 @symbols.route('/indexes', methods=['GET'])
 def get_indexes_list():
-    indexes = ujson.dumps([index.to_json() for index in symbol_service.get_indexes_info()])
-    return Response(response=indexes, status=200, mimetype='application/json')
+    return lists_cache.response('indexes', render_indexes_list)
+
+
+def render_stocks_list() -> str:
+    return ujson.dumps([symbol.to_json() for symbol in symbol_service.get_stocks_info()])
+
+
+def render_indexes_list() -> str:
+    return ujson.dumps([index.to_json() for index in symbol_service.get_indexes_info()])
+
+
+@symbols.route('/risk', methods=['GET'])
+def get_risk():
+    tickers = request.args.get('tickers')
+    tickers = tuple(ticker for ticker in tickers.split(',') if ticker) if tickers else None
+    with timings.span('symbol.serialize'):
+        body = ujson.dumps([risk.to_json() for risk in symbol_service.get_risk(tickers)])
+    return compressed_response(body)
+
+
+@symbols.route('/screen', methods=['GET'])
+def screen_symbols():
+    try:
+        screen_filters = _parse_screen_filters(request.args)
+    except ValueError as e:
+        return Response(response='Invalid request: {}'.format(e), status=400, mimetype='application/json')
+
+    screen = symbol_service.screen(**screen_filters)
+    with timings.span('symbol.serialize'):
+        body = ujson.dumps(screen.to_json())
+    return compressed_response(body)
 
 
 @symbols.route('/<symbol_ticker>', methods=['GET'])
 def get_symbol(symbol_ticker):
-    symbol = symbol_service.get_symbol(symbol_ticker)
+    try:
+        history_filters = _parse_history_filters(request.args)
+    except ValueError as e:
+        return Response(response='Invalid request: {}'.format(e), status=400, mimetype='application/json')
+
+    try:
+        symbol = symbol_service.get_symbol(symbol_ticker, **history_filters)
+    except SymbolException as e:
+        return Response(response=ujson.dumps(e.error), status=400, mimetype='application/json')
     if not symbol:
         return Response(response='Error: symbol not found', status=404, mimetype='application/json')
 
-    symbol = ujson.dumps(symbol.to_json())
-    return Response(response=symbol, status=200, mimetype='application/json')
+    with timings.span('symbol.serialize'):
+        body = ujson.dumps(symbol.to_json())
+    return compressed_response(body)
+
+
+@symbols.route('/<symbol_ticker>/window', methods=['GET'])
+def get_symbol_window(symbol_ticker):
+    try:
+        window = _parse_date_window(request.args)
+    except ValueError as e:
+        return Response(response='Invalid request: {}'.format(e), status=400, mimetype='application/json')
+
+    try:
+        statistics = symbol_service.get_window(symbol_ticker, **window)
+    except SymbolException as e:
+        return Response(response=ujson.dumps(e.error), status=400, mimetype='application/json')
+    if not statistics:
+        return Response(response='Error: symbol not found', status=404, mimetype='application/json')
+    return Response(response=ujson.dumps(statistics.to_json()), status=200, mimetype='application/json')
+
+
+@symbols.route('/<symbol_ticker>/drawdowns', methods=['GET'])
+def get_symbol_drawdowns(symbol_ticker):
+    try:
+        filters = _parse_date_window(request.args)
+        min_depth = request.args.get('min_depth')
+        if min_depth:
+            try:
+                filters['min_depth'] = float(min_depth)
+            except ValueError:
+                raise ValueError("min_depth must be a number")
+            if not 0 <= filters['min_depth'] < 1:
+                raise ValueError("min_depth must be between 0 and 1")
+    except ValueError as e:
+        return Response(response='Invalid request: {}'.format(e), status=400, mimetype='application/json')
+
+    try:
+        drawdowns = symbol_service.get_drawdowns(symbol_ticker, **filters)
+    except SymbolException as e:
+        return Response(response=ujson.dumps(e.error), status=400, mimetype='application/json')
+    if not drawdowns:
+        return Response(response='Error: symbol not found', status=404, mimetype='application/json')
+
+    with timings.span('symbol.serialize'):
+        body = ujson.dumps(drawdowns.to_json())
+    return compressed_response(body)
+
+
+@symbols.route('/<symbol_ticker>/similar', methods=['GET'])
+def get_similar_symbols(symbol_ticker):
+    try:
+        similarity_filters = parse_similarity_filters(request.args)
+    except ValueError as e:
+        return Response(response='Invalid request: {}'.format(e), status=400, mimetype='application/json')
+
+    try:
+        similar = symbol_service.get_similar(symbol_ticker, **similarity_filters)
+    except SymbolException as e:
+        return Response(response=ujson.dumps(e.error), status=400, mimetype='application/json')
+    if not similar:
+        return Response(response='Error: symbol not found', status=404, mimetype='application/json')
+    return Response(response=ujson.dumps(similar.to_json()), status=200, mimetype='application/json')
+
+
+def parse_similarity_filters(args) -> dict:
+    """
+    Parses the ?k=&order= parameters of the similarity search, shared with the portfolio routes.
+    :raises ValueError: if any of the parameters is not valid.
+    """
+    similarity_filters = {}
+    k = args.get('k')
+    if k not in (None, ''):
+        if not str(k).isdigit() or not 0 < int(k) <= st.SIMILAR_MAX_K:
+            raise ValueError("k must be an integer between 1 and {}".format(st.SIMILAR_MAX_K))
+        similarity_filters['k'] = int(k)
+
+    order = args.get('order')
+    if order:
+        if order not in ('most', 'least'):
+            raise ValueError("order must be most or least")
+        similarity_filters['least'] = order == 'least'
+    return similarity_filters
+
+
+def _parse_date_window(args) -> dict:
+    """
+    Parses the ?from=&to= query parameters.
+    :raises ValueError: if any of the parameters is not valid.
+    """
+    def to_date(d):
+        return datetime.strptime(d, '%d-%m-%Y').date()
+
+    window = {}
+    try:
+        if args.get('from'):
+            window['initial_date'] = to_date(args['from'])
+        if args.get('to'):
+            window['end_date'] = to_date(args['to'])
+    except ValueError:
+        raise ValueError("dates must follow the format dd-mm-yyyy")
+    if 'initial_date' in window and 'end_date' in window and window['initial_date'] >= window['end_date']:
+        raise ValueError("from must be previous to to")
+    return window
+
+
+def _parse_history_filters(args) -> dict:
+    """
+    Parses the ?from=&to=&freq=&points=&total_return= query parameters of the symbol history.
+    :raises ValueError: if any of the parameters is not valid.
+    """
+    filters = _parse_date_window(args)
+
+    freq = args.get('freq')
+    if freq:
+        if freq not in RESAMPLING_FREQUENCIES:
+            raise ValueError("freq must be one of {}".format(", ".join(RESAMPLING_FREQUENCIES)))
+        filters['freq'] = freq
+
+    points = args.get('points')
+    if points:
+        if not points.isdigit() or int(points) < 3:
+            raise ValueError("points must be an integer greater than 2")
+        filters['points'] = int(points)
+
+    total_return = args.get('total_return')
+    if total_return:
+        if total_return not in ('true', 'false'):
+            raise ValueError("total_return must be true or false")
+        filters['total_return'] = total_return == 'true'
+
+    return filters
+
+
+def _parse_screen_filters(args) -> dict:
+    """
+    Parses the ?min_<metric>=&max_<metric>=&type=&order_by=&offset=&limit= query parameters of the screener,
+    order_by is prefixed by '-' to order from the highest value.
+    :raises ValueError: if any of the parameters is not valid.
+    """
+    ranges = {}
+    for metric in SCREEN_METRICS:
+        bounds = []
+        for bound in ('min', 'max'):
+            value = args.get('{}_{}'.format(bound, metric))
+            try:
+                bounds.append(float(value) if value else None)
+            except ValueError:
+                raise ValueError("{}_{} must be a number".format(bound, metric))
+        if bounds != [None, None]:
+            if None not in bounds and bounds[0] > bounds[1]:
+                raise ValueError("min_{0} must not be greater than max_{0}".format(metric))
+            ranges[metric] = tuple(bounds)
+    screen_filters = {'filters': ranges}
+
+    symbol_type = args.get('type')
+    if symbol_type:
+        if symbol_type not in ('stock', 'index'):
+            raise ValueError("type must be stock or index")
+        screen_filters['symbol_type'] = symbol_type
+
+    order_by = args.get('order_by')
+    if order_by:
+        descending = order_by.startswith('-')
+        order_by = order_by.lstrip('-')
+        if order_by not in SCREEN_METRICS:
+            raise ValueError("order_by must be one of {}".format(", ".join(SCREEN_METRICS)))
+        screen_filters['order_by'], screen_filters['descending'] = order_by, descending
+
+    offset = args.get('offset')
+    if offset:
+        if not offset.isdigit():
+            raise ValueError("offset must be a non negative integer")
+        screen_filters['offset'] = int(offset)
+
+    limit = args.get('limit')
+    if limit:
+        if not limit.isdigit() or not 0 < int(limit) <= st.SCREEN_MAX_LIMIT:
+            raise ValueError("limit must be an integer between 1 and {}".format(st.SCREEN_MAX_LIMIT))
+        screen_filters['limit'] = int(limit)
+
+    return screen_filters
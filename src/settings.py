@@ -1,5 +1,6 @@
 import os
 import logging
+import socket
 from logging.handlers import RotatingFileHandler
 
 from environ import environ
@@ -8,6 +9,8 @@ ROOT_DIR = os.path.dirname(os.path.dirname((os.path.abspath(__file__))))
 ENV_FILE = os.path.abspath(os.path.join(ROOT_DIR, ".env"))
 
 env = environ.Env(
+    REPOSITORY_BACKEND=(str, "mongo"),
+    SQLITE_PATH=(str, "fincalcs.db"),
     MONGO_DB=(str, ""),
     MONGODB_USER=(str, ""),
     MONGODB_PASS=(str, ""),
@@ -16,11 +19,23 @@ env = environ.Env(
     RABBIT_USER=(str, ""),
     RABBIT_PASSWORD=(str, ""),
     RABBIT_VHOST=(str, ""),
+    API_WORKERS=(int, 1),
+    SYMBOLS_CONSUMER_WORKERS=(int, 4),
+    SYMBOLS_PREFETCH_COUNT=(int, 32),
+    WARMUP_SYMBOLS=(list, []),
+    SYMBOLS_MEMORY_BUDGET=(int, 0),
+    SYMBOLS_MEMORY_FLOAT32=(bool, False),
+    SIMILARITY_LOOKBACK=(int, 252),
+    INSTANCE_ID=(str, ""),
+    INSTANCES=(list, []),
 )
 
 env.read_env(ENV_FILE)
 
-MONGO_HOST, MONGO_PORT = env("MONGO_DB").split(":")
+# Repository the symbols are stored in: mongo or sqlite (embedded, for single node deployments and CI).
+REPOSITORY_BACKEND = env("REPOSITORY_BACKEND")
+SQLITE_PATH = env("SQLITE_PATH")
+MONGO_HOST, _, MONGO_PORT = env("MONGO_DB").partition(":")
 
 # LOGGING CONFIG
 
@@ -61,6 +76,36 @@ SYMBOLS_QUEUE = 'fincalcs_symbols'
 SYMBOLS_TOPIC_ROUTING_KEY = 'findata.symbol.#'
 SYMBOLS_STOCK_ROUTING_KEY = 'findata.symbol.stock'
 SYMBOLS_INDEX_ROUTING_KEY = 'findata.symbol.index'
+# Threads processing the symbols messages, the messages of a ticker are always processed by the same one.
+SYMBOLS_CONSUMER_WORKERS = env("SYMBOLS_CONSUMER_WORKERS")
+# Processes parsing the symbols messages.
+SYMBOLS_DECODER_PROCESSES = max(1, (os.cpu_count() or 1) - 1)
+# Unacknowledged messages the broker can deliver to the consumer, it adapts between min and max to the load.
+SYMBOLS_PREFETCH_COUNT = env("SYMBOLS_PREFETCH_COUNT")
+SYMBOLS_PREFETCH_MIN = 1
+SYMBOLS_PREFETCH_MAX = 512
+# Seconds between prefetch adjustments.
+SYMBOLS_PREFETCH_ADJUST_INTERVAL = 2
+# Seconds a message may wait in the queue before the prefetch stops growing.
+SYMBOLS_TARGET_LAG = 1
+# Size of the messages held in memory at the same time, 256mb.
+SYMBOLS_QUEUE_MAX_BYTES = 268435456
+
+# Scale-out, several instances sharing the ingestion, enabled when INSTANCES is set.
+# Name of this instance, it must be one of INSTANCES.
+INSTANCE_ID = env("INSTANCE_ID") or socket.gethostname()
+# Names of every instance, comma separated, the partitions of the tickers are spread across them.
+INSTANCES = tuple(env("INSTANCES"))
+# Partitions the tickers are hashed into, the producers publish with the same number (see partitioning.py).
+SYMBOLS_PARTITIONS = 256
+SYMBOLS_PARTITION_QUEUE = 'fincalcs_symbols.{}'
+SYMBOLS_PARTITION_ROUTING_KEY = 'findata.symbol.*.{}'
+# Points of each instance on the consistent hash ring the partitions are assigned with.
+HASH_RING_VIRTUAL_NODES = 256
+# Fanout exchange each instance broadcasts the tickers it writes on, so its peers invalidate their caches.
+DATA_VERSION_EXCHANGE = 'fincalcs_data_versions'
+# Seconds before connecting again to the broadcast exchange after losing the connection.
+DATA_VERSION_RETRY_DELAY = 5
 
 # Ibex35, S&P500, Dow Jones, Nasdaq, Euro stoxx50, EURONEXT100, Ibex Medium Cap.
 EXCHANGES = ('^IBEX', '^GSPC', '^DJI', '^IXIC', '^STOXX50E', '^N100', 'INDC.MC')
@@ -69,3 +114,59 @@ EXCHANGES = ('^IBEX', '^GSPC', '^DJI', '^IXIC', '^STOXX50E', '^N100', 'INDC.MC')
 ANNUALIZATION_FACTOR = 252
 # We assume a 2%
 RISK_FREE_RATIO = 0.02
+
+# Production serving, used when API_WORKERS > 1
+API_HOST = '0.0.0.0'
+API_PORT = 8001
+API_WORKERS = env("API_WORKERS")
+# Port the master process serves its /metrics on (ingestion and shared memory publishing), each worker serves its own
+# on one of the following API_WORKERS ports. With a single process it is served on the api port.
+METRICS_PORT = 8002
+# Prefix of the shared memory segments that hold the decoded symbols data.
+SHM_NAMESPACE = 'fincalcs'
+# Seconds between checks for new symbols data to publish into shared memory.
+SHM_PUBLISH_INTERVAL = 30
+# Seconds an old generation is kept before being unlinked, so workers can finish reading it.
+SHM_GENERATION_GRACE = 60
+# Generations whose changed tickers each new one keeps, the workers that skipped more rebuild their caches.
+SHM_CHANGES_HISTORY = 16
+
+# Bytes of decoded symbols each api process keeps in memory, the least recently read are evicted beyond it.
+# 0 disables the store, every read goes to the database.
+SYMBOLS_MEMORY_BUDGET = env("SYMBOLS_MEMORY_BUDGET")
+# Keeps the stored values in single precision, halving the memory they take.
+SYMBOLS_MEMORY_FLOAT32 = env("SYMBOLS_MEMORY_FLOAT32")
+# Bytes of returns prefix sums each api process keeps for the date window queries, ~300kb per 30 years of history.
+PREFIX_SUMS_BUDGET = 256 * 1024 * 1024
+# Max symbols of a page of the screener.
+SCREEN_MAX_LIMIT = 500
+# Business days of daily returns the correlations of the similarity search are computed over.
+SIMILARITY_LOOKBACK = env("SIMILARITY_LOOKBACK")
+# Max symbols returned by a similarity search.
+SIMILAR_MAX_K = 100
+
+# Warm-up of each api process before reporting itself as ready.
+# Symbols read on warm-up besides the benchmark indexes, comma separated.
+WARMUP_SYMBOLS = tuple(env("WARMUP_SYMBOLS"))
+# Threads running the warm-up tasks in parallel.
+WARMUP_WORKERS = 8
+
+# Background jobs of each process, run apart from the request threads.
+# Seconds between cleanups of the symbols not updated in the last days, 6h.
+CLEAN_OLD_SYMBOLS_INTERVAL = 6 * 60 * 60
+# Fraction of its interval each run of a periodic job is randomly delayed or advanced, so processes and nodes
+# do not run it at once. The jobs run by a single process hold their lease for the interval minus the jitter.
+SCHEDULER_JITTER = 0.1
+# Seconds without symbols written for an ingestion wave to be finished, then the caches are warmed up again.
+INGESTION_WAVE_QUIET = 10
+# Niceness of the threads running the jobs.
+SCHEDULER_NICENESS = 10
+
+# Portfolio analysis, computed in a process pool
+PORTFOLIO_PROCESS_WORKERS = os.cpu_count() or 1
+# Analyses accepted at the same time by each api process, the rest are rejected with a 429.
+PORTFOLIO_MAX_PENDING = 4 * PORTFOLIO_PROCESS_WORKERS
+# Seconds an analysis can take before being cancelled.
+PORTFOLIO_DEADLINE = 10
+# Threads used for the concurrent repository reads.
+PORTFOLIO_IO_WORKERS = 16